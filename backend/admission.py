@@ -0,0 +1,181 @@
+"""Rate limiting and concurrency limits that shed load before it reaches the handlers.
+
+Two independent controls:
+
+* ``RateLimiter`` - token buckets keyed by client IP or user id, one policy per
+  route group (see the RATE LIMITS section of server.py). A bucket holds up to
+  ``burst`` tokens and refills at ``limit / period`` tokens per second; a
+  request that finds it empty gets 429 with ``Retry-After`` set to when the
+  next token arrives. Buckets live in the shared state backend (see
+  shared_state.py), so with SHARED_STATE=redis every API process draws from
+  the same buckets.
+* ``ConcurrencyLimiter`` with ``AdmissionMiddleware`` - caps the requests a
+  process handles at once. Requests over the cap wait briefly in a bounded
+  queue; when the queue is full or the wait times out they get 503 with
+  ``Retry-After`` instead of piling up behind slow ones.
+
+Rate limits fail open: a Redis outage logs an error and admits the request.
+"""
+import asyncio
+import logging
+import math
+import os
+import re
+from typing import Dict, NamedTuple, Optional, Pattern, Tuple
+
+from shared_state import state_for
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+# Requests the concurrency limit never delays, so probes keep working under load.
+# Live stock streams stay open for minutes and would pin a slot each; StockEvents caps them instead.
+EXEMPT_PATHS = re.compile(r"^/(?:api/health|metrics|api/products/[^/]+/stock/events)$")
+
+
+class RatePolicy(NamedTuple):
+    key: str  # "ip" or "user"
+    limit: int
+    period: float
+    burst: Optional[int] = None  # defaults to ``limit``
+
+    @property
+    def rate(self) -> float:
+        return self.limit / self.period
+
+    @property
+    def capacity(self) -> int:
+        return self.burst if self.burst is not None else self.limit
+
+
+def parse_rate(value: str) -> Tuple[int, float]:
+    """``"10/minute"`` -> ``(10, 60.0)``."""
+    count, _, period = value.partition("/")
+    if period not in PERIODS:
+        raise ValueError(f"Rate must look like 10/minute (second, minute or hour), not {value!r}")
+    return int(count), float(PERIODS[period])
+
+
+class RateLimiter:
+    def __init__(self, store, policies: Dict[str, RatePolicy]):
+        self.store = store
+        self.policies = policies
+        self.rejected: Dict[str, int] = {name: 0 for name in policies}
+
+    @classmethod
+    def from_env(cls, shared, policies: Dict[str, RatePolicy]) -> "RateLimiter":
+        """RATE_LIMIT_<NAME>=20/minute overrides a policy's limit and period.
+
+        RATE_LIMIT_BACKEND=memory keeps buckets per process even with a shared
+        Redis state; ``off`` disables limiting.
+        """
+        store = state_for('RATE_LIMIT_BACKEND', shared)
+        configured = {}
+        for name, policy in policies.items():
+            override = os.environ.get(f'RATE_LIMIT_{name.upper()}')
+            if override:
+                limit, period = parse_rate(override)
+                # A burst left at its default follows the new limit
+                policy = policy._replace(limit=limit, period=period)
+            configured[name] = policy
+        return cls(store, configured)
+
+    async def check(self, name: str, key: str) -> float:
+        """Return 0 if the request is admitted, else the seconds until it would be."""
+        if self.store is None:
+            return 0.0
+        policy = self.policies[name]
+        try:
+            wait = await self.store.take(f"ratelimit:{name}:{key}", policy.rate, policy.capacity)
+        except Exception:
+            logger.exception("Rate limit store failed; admitting request")
+            return 0.0
+        if wait > 0:
+            self.rejected[name] += 1
+        return wait
+
+    def total_rejected(self) -> int:
+        return sum(self.rejected.values())
+
+
+def retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrent: int = 256, max_queue: int = 512, queue_timeout: float = 1.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "ConcurrencyLimiter":
+        """MAX_CONCURRENT_REQUESTS=0 turns the limit off."""
+        return cls(
+            max_concurrent=int(os.environ.get('MAX_CONCURRENT_REQUESTS', 256)),
+            max_queue=int(os.environ.get('ADMISSION_QUEUE', 512)),
+            queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_SECONDS', 1.0)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._semaphore is not None
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting up to ``queue_timeout``; False means the request should be shed."""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        elif self.waiting >= self.max_queue:
+            self.rejected += 1
+            return False
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return False
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+BUSY_BODY = b'{"detail":"Server is busy, please retry shortly"}'
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, limiter: ConcurrencyLimiter, exempt: Pattern = EXEMPT_PATHS):
+        self.app = app
+        self.limiter = limiter
+        self.exempt = exempt
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled or self.exempt.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.limiter.acquire():
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(BUSY_BODY)).encode()),
+                    (b"retry-after", retry_after(self.limiter.queue_timeout).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": BUSY_BODY})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
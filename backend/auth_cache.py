@@ -0,0 +1,171 @@
+"""Caches behind the stateless JWT fast path.
+
+Access tokens carry the user's id, email and name, so most endpoints trust the
+verified claims without a database read. Two pieces keep that safe:
+
+* ``VerifiedUserCache`` - a small TTL cache of user records for the endpoints
+  (and legacy tokens) that still need to look the user up.
+* ``TokenRevocationList`` - logout revokes a single token by ``jti``, and a
+  password change revokes every token a user was issued before a cutoff.
+  Revocations are written to Mongo and each process polls for new ones at most
+  every ``sync_interval`` seconds, which bounds how long a revoked token from
+  another process can still be used. Revocations made in this process apply
+  immediately. With a shared state backend, each revocation also bumps a
+  shared counter; processes read it every ``stamp_interval`` seconds and pull
+  from Mongo as soon as it moves, so other processes see a logout within a
+  fraction of a second without polling Mongo more often.
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+REVOCATIONS_COLLECTION = "token_revocations"
+REVOCATION_STAMP = "token_revocations:stamp"
+
+logger = logging.getLogger(__name__)
+
+
+class VerifiedUserCache:
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 10_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # user_id -> (expires_at, user_doc), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "VerifiedUserCache":
+        return cls(
+            ttl_seconds=float(os.environ.get('USER_CACHE_TTL_SECONDS', 30)),
+            max_entries=int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10_000)),
+        )
+
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self._entries.pop(user_id, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id: str, user_doc: dict) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, user_doc)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class TokenRevocationList:
+    def __init__(self, db, sync_interval: float = 5.0, shared=None, stamp_interval: float = 0.5):
+        self.db = db
+        self.sync_interval = sync_interval
+        self.shared = shared
+        self.stamp_interval = stamp_interval
+        self._stamp = 0
+        self._next_stamp_check = 0.0
+        self._revoked_jtis: Dict[str, datetime] = {}  # jti -> token expiry
+        # user_id -> (cutoff, record expiry); tokens with iat below the cutoff are revoked
+        self._not_before: Dict[str, Tuple[float, datetime]] = {}
+        self._watermark = datetime.fromtimestamp(0, timezone.utc)
+        self._next_sync = 0.0
+
+    @classmethod
+    def from_env(cls, db, shared=None) -> "TokenRevocationList":
+        return cls(
+            db,
+            sync_interval=float(os.environ.get('TOKEN_REVOCATION_SYNC_SECONDS', 5)),
+            shared=shared,
+            stamp_interval=float(os.environ.get('TOKEN_REVOCATION_STAMP_SECONDS', 0.5)),
+        )
+
+    def is_revoked(self, claims: dict) -> bool:
+        jti = claims.get("jti")
+        if jti is not None and jti in self._revoked_jtis:
+            return True
+        entry = self._not_before.get(claims.get("sub"))
+        return entry is not None and claims.get("iat", 0) < entry[0]
+
+    async def revoke_token(self, claims: dict) -> None:
+        """Revoke one token (logout); the record expires with the token itself."""
+        expires_at = datetime.fromtimestamp(claims["exp"], timezone.utc)
+        self._revoked_jtis[claims["jti"]] = expires_at
+        await self.db[REVOCATIONS_COLLECTION].insert_one({
+            "jti": claims["jti"],
+            "user_id": claims.get("sub"),
+            "created_at": datetime.now(timezone.utc),
+            "expires_at": expires_at,
+        })
+        await self._bump_stamp()
+
+    async def revoke_user_tokens(self, user_id: str, token_lifetime: timedelta) -> None:
+        """Revoke every token issued to ``user_id`` so far (password change, account lock)."""
+        now = datetime.now(timezone.utc)
+        self._not_before[user_id] = (now.timestamp(), now + token_lifetime)
+        await self.db[REVOCATIONS_COLLECTION].insert_one({
+            "user_id": user_id,
+            "not_before": now.timestamp(),
+            "created_at": now,
+            "expires_at": now + token_lifetime,
+        })
+        await self._bump_stamp()
+
+    async def sync(self) -> None:
+        """Pull revocations written by other processes, at most once per interval."""
+        now = time.monotonic()
+        if self.shared is not None and now >= self._next_stamp_check:
+            self._next_stamp_check = now + self.stamp_interval
+            try:
+                stamp = await self.shared.counter(REVOCATION_STAMP)
+            except Exception:
+                logger.exception("Could not read the revocation stamp; relying on the periodic sync")
+                stamp = self._stamp
+            if stamp != self._stamp:
+                # Another process revoked something: pull now rather than at the next interval
+                self._stamp = stamp
+                self._next_sync = 0.0
+        if now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+
+        # Overlap the window a little so writers with a lagging clock are not missed
+        since = self._watermark - timedelta(seconds=self.sync_interval)
+        docs = await self.db[REVOCATIONS_COLLECTION].find(
+            {"created_at": {"$gt": since}}, {"_id": 0}
+        ).to_list(None)
+        for doc in docs:
+            if doc.get("jti"):
+                self._revoked_jtis[doc["jti"]] = doc["expires_at"]
+            elif doc.get("not_before") is not None:
+                current = self._not_before.get(doc["user_id"])
+                if current is None or doc["not_before"] > current[0]:
+                    self._not_before[doc["user_id"]] = (doc["not_before"], doc["expires_at"])
+            self._watermark = max(self._watermark, doc["created_at"])
+
+        # Expired tokens are rejected by the signature check anyway, so their entries can go
+        cutoff = datetime.now(timezone.utc)
+        for jti in [j for j, expires in self._revoked_jtis.items() if expires <= cutoff]:
+            del self._revoked_jtis[jti]
+        for user_id in [u for u, (_, expires) in self._not_before.items() if expires <= cutoff]:
+            del self._not_before[user_id]
+
+    async def _bump_stamp(self) -> None:
+        if self.shared is None:
+            return
+        try:
+            await self.shared.incr(REVOCATION_STAMP)
+        except Exception:
+            logger.exception("Could not bump the revocation stamp; other processes will see it on their periodic sync")
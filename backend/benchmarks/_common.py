@@ -0,0 +1,23 @@
+"""Timing and reporting helpers shared by the benchmark scripts.
+
+Benchmarks run as scripts from ``backend/`` (``python benchmarks/<name>.py``),
+so this directory is on ``sys.path`` and ``from _common import ...`` works.
+"""
+import statistics
+import time
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def elapsed_ms(start):
+    """Milliseconds since ``start``, a ``time.perf_counter()`` reading."""
+    return (time.perf_counter() - start) * 1000
+
+
+def latency_columns(samples, width=9, precision=2):
+    """p50 and p99 of ``samples``, right-aligned for a results table."""
+    return f"{statistics.median(samples):>{width}.{precision}f} {percentile(samples, 99):>{width}.{precision}f}"
@@ -0,0 +1,96 @@
+"""Benchmark authenticated request throughput: per-request user lookup vs JWT claims.
+
+Drives the FastAPI app in-process (no network) against the MongoDB configured in
+backend/.env, using a throwaway ``<DB_NAME>_bench`` database. "before" runs with
+AUTH_MODE=database and the user cache disabled, which reproduces the old
+find_one-per-request behaviour; "after" runs with the default claims fast path.
+
+Usage:
+    python benchmarks/bench_auth.py [--requests 2000] [--concurrency 32] [--cart-items 10]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+os.environ['DB_NAME'] = f"{os.environ['DB_NAME']}_bench"
+# Every simulated client shares one IP, so per-client rate limits would throttle the benchmark itself
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'off')
+sys.path.insert(0, str(ROOT_DIR))
+
+import server  # noqa: E402
+
+
+async def seed(client, cart_items):
+    products = [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Bench Product {i}",
+            "description": "Synthetic product used by the auth benchmark.",
+            "price": 10.0 + i,
+            "category": "Bench",
+            "image": "https://example.com/bench.jpg",
+            "stock": 100,
+            "created_at": datetime.now(timezone.utc),
+        }
+        for i in range(cart_items)
+    ]
+    await server.db.products.insert_many(products)
+
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    response = await client.post("/api/auth/register", json={"email": email, "name": "Bench", "password": "bench-password"})
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    for product in products:
+        await client.post("/api/cart", json={"product_id": product["id"], "quantity": 1}, headers=headers)
+    return headers
+
+
+async def requests_per_second(client, path, headers, total, concurrency):
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            response = await client.get(path, headers=headers)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+async def run(total, concurrency, cart_items):
+    transport = httpx.ASGITransport(app=server.app)
+    # The lifespan connects to MongoDB and closes the client on exit
+    async with server.lifespan(server.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        try:
+            headers = await seed(client, cart_items)
+            print(f"{'endpoint':<14} {'before rps':>11} {'after rps':>10} {'speedup':>8}")
+            for path in ("/api/auth/me", "/api/cart"):
+                server.AUTH_MODE, server.user_cache.ttl_seconds = "database", 0
+                before = await requests_per_second(client, path, headers, total, concurrency)
+                server.AUTH_MODE, server.user_cache.ttl_seconds = "claims", 30
+                after = await requests_per_second(client, path, headers, total, concurrency)
+                print(f"{path:<14} {before:>11.0f} {after:>10.0f} {after / before:>7.2f}x")
+        finally:
+            await server.client.drop_database(server.db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--cart-items", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.cart_items))
@@ -0,0 +1,121 @@
+"""Benchmark GET /api/cart product join: per-row find_one loop vs batched $in lookup.
+
+Runs against the MongoDB configured in backend/.env, using a throwaway
+``<DB_NAME>_bench`` database that is dropped when the run finishes.
+
+Usage:
+    python benchmarks/bench_cart_join.py [--iterations 200] [--sizes 1 10 100 500]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from _common import elapsed_ms, latency_columns
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def seed_cart(db, user_id, size):
+    products = [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Bench Product {i}",
+            "description": "Synthetic product used by the cart join benchmark.",
+            "price": 10.0 + i,
+            "category": "Bench",
+            "image": "https://example.com/bench.jpg",
+            "stock": 100,
+            "created_at": datetime.now(timezone.utc),
+        }
+        for i in range(size)
+    ]
+    await db.products.insert_many(products)
+    await db.cart.insert_many([
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "product_id": product["id"],
+            "quantity": 1,
+            "created_at": datetime.now(timezone.utc),
+        }
+        for product in products
+    ])
+
+
+async def loop_join(db, user_id):
+    """The original get_cart strategy: one find_one per cart row."""
+    cart_items = await db.cart.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    result = []
+    for item in cart_items:
+        product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0})
+        if product:
+            result.append((item["id"], product, item["quantity"]))
+    return result
+
+
+async def batched_join(db, user_id):
+    """The current get_cart strategy: cart rows plus one $in product lookup."""
+    cart_items = await db.cart.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    if not cart_items:
+        return []
+    product_ids = list({item["product_id"] for item in cart_items})
+    products = await db.products.find(
+        {"id": {"$in": product_ids}}, {"_id": 0}
+    ).to_list(len(product_ids))
+    products_by_id = {product["id"]: product for product in products}
+    return [
+        (item["id"], products_by_id[item["product_id"]], item["quantity"])
+        for item in cart_items
+        if item["product_id"] in products_by_id
+    ]
+
+
+async def measure(strategy, db, user_id, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await strategy(db, user_id)
+        samples.append(elapsed_ms(start))
+    return samples
+
+
+async def run(sizes, iterations):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[f"{os.environ['DB_NAME']}_bench"]
+    try:
+        await db.products.create_index("id")
+        await db.cart.create_index("user_id")
+
+        print(f"{'items':>6} {'strategy':>8} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+        for size in sizes:
+            user_id = str(uuid.uuid4())
+            await seed_cart(db, user_id, size)
+
+            expected = await loop_join(db, user_id)
+            assert await batched_join(db, user_id) == expected, "strategies disagree"
+
+            for name, strategy in (("loop", loop_join), ("batched", batched_join)):
+                samples = await measure(strategy, db, user_id, iterations)
+                print(
+                    f"{size:>6} {name:>8} {latency_columns(samples)} {statistics.fmean(samples):>9.2f}"
+                )
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 500])
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.iterations))
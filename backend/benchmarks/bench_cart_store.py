@@ -0,0 +1,129 @@
+"""Benchmark the cart storage engines under concurrent mutation.
+
+For each engine (``rows`` and ``embedded``, see cart_store.py):
+
+* contention - ``--workers`` tasks add the same product to the same cart at
+  once. The final quantity must equal the sum of the adds, and the cart must
+  hold exactly one line for the product. Lost updates or duplicate lines fail
+  the run.
+* mixed      - ``--workers`` tasks run a random mix of add, set quantity,
+  remove and read against ``--users`` carts of ``--cart-size`` lines. Reports
+  throughput and p50/p99 per operation.
+
+Runs against the MongoDB configured in backend/.env, using a throwaway
+``<DB_NAME>_bench`` database that is dropped when the run finishes.
+
+Usage:
+    python benchmarks/bench_cart_store.py [--workers 64] [--ops 20000] [--users 200] [--cart-size 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+sys.path.insert(0, str(ROOT_DIR))
+
+from _common import elapsed_ms, latency_columns  # noqa: E402
+from cart_store import CART_STORES  # noqa: E402
+from db_indexes import ensure_indexes  # noqa: E402
+
+MIX = {"add": 0.4, "set": 0.2, "remove": 0.1, "list": 0.3}
+
+
+async def contention(store, workers):
+    user_id, product_id = str(uuid.uuid4()), str(uuid.uuid4())
+    start = time.perf_counter()
+    await asyncio.gather(*(store.add_item(user_id, product_id, 1) for _ in range(workers)))
+    elapsed = time.perf_counter() - start
+    lines = [line for line in await store.list_items(user_id) if line["product_id"] == product_id]
+    ok = len(lines) == 1 and lines[0]["quantity"] == workers
+    detail = f"{len(lines)} line(s), quantity {lines[0]['quantity'] if lines else 0} (expected 1 line, {workers})"
+    return ok, detail, elapsed
+
+
+async def mixed(store, workers, total_ops, users, cart_size, seed):
+    rng = random.Random(seed)
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    product_ids = [str(uuid.uuid4()) for _ in range(cart_size * 4)]
+    for user_id in user_ids:
+        await store.merge_items(user_id, {pid: 1 for pid in rng.sample(product_ids, cart_size)})
+
+    latencies = defaultdict(list)
+    operations = rng.choices(list(MIX), weights=list(MIX.values()), k=total_ops)
+    queue = iter(operations)
+
+    async def worker(worker_rng):
+        for operation in queue:
+            user_id = worker_rng.choice(user_ids)
+            start = time.perf_counter()
+            if operation == "add":
+                await store.add_item(user_id, worker_rng.choice(product_ids), 1)
+            elif operation == "list":
+                await store.list_items(user_id)
+            else:
+                lines = await store.list_items(user_id)
+                if not lines:
+                    continue
+                line = worker_rng.choice(lines)
+                start = time.perf_counter()  # time the write only
+                if operation == "set":
+                    await store.set_quantity(user_id, line["id"], worker_rng.randint(1, 5))
+                else:
+                    await store.remove_item(user_id, line["id"])
+            latencies[operation].append(elapsed_ms(start))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(random.Random(seed + i)) for i in range(workers)))
+    return latencies, time.perf_counter() - start
+
+
+async def run(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[f"{os.environ['DB_NAME']}_bench"]
+    failures = []
+    try:
+        await ensure_indexes(db)
+        print(f"{'engine':<9} {'operation':<8} {'count':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        for name, store_class in CART_STORES.items():
+            store = store_class(db)
+            ok, detail, elapsed = await contention(store, args.workers)
+            print(f"{name:<9} {'contend':<8} {args.workers:>7} {'':>8} {'':>8}  {elapsed * 1000:.1f} ms total, {detail}")
+            if not ok:
+                failures.append(f"{name}: {detail}")
+
+            latencies, elapsed = await mixed(store, args.workers, args.ops, args.users, args.cart_size, args.seed)
+            completed = sum(len(samples) for samples in latencies.values())
+            for operation in MIX:
+                samples = latencies[operation]
+                if samples:
+                    print(
+                        f"{name:<9} {operation:<8} {len(samples):>7} {latency_columns(samples, width=8)}"
+                    )
+            print(f"{name:<9} {'total':<8} {completed:>7}  {completed / elapsed:.0f} ops/s over {elapsed:.1f}s\n")
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--ops", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--cart-size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,133 @@
+"""Concurrency test: hundreds of simultaneous checkouts on one low-stock product.
+
+Drives the FastAPI app in-process against the MongoDB configured in backend/.env,
+using a throwaway ``<DB_NAME>_bench`` database. Every buyer has the same product
+in their cart and they all POST /api/orders at once. Afterwards the run checks
+that exactly ``stock`` orders succeeded, that stock ended at zero and never went
+negative, and that replaying every request with its Idempotency-Key changes
+nothing. It exits non-zero if any check fails.
+
+Usage:
+    python benchmarks/bench_checkout.py [--buyers 300] [--stock 20] [--quantity 1] [--transactions auto]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+os.environ['DB_NAME'] = f"{os.environ['DB_NAME']}_bench"
+# Every simulated client shares one IP, so per-client rate limits would throttle the benchmark itself
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'off')
+sys.path.insert(0, str(ROOT_DIR))
+
+from _common import elapsed_ms, percentile  # noqa: E402
+import server  # noqa: E402
+
+
+async def seed(buyers, stock, quantity):
+    product_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    await server.db.products.insert_one({
+        "id": product_id,
+        "name": "Limited Edition Bench Widget",
+        "description": "Synthetic product used by the checkout concurrency test.",
+        "price": 24.99,
+        "category": "Bench",
+        "image": "https://example.com/bench.jpg",
+        "stock": stock,
+        "created_at": now,
+    })
+    # Users are inserted directly; tokens are minted without going through bcrypt
+    users = [server.User(email=f"buyer-{i}@example.com", name=f"Buyer {i}", password_hash="") for i in range(buyers)]
+    await server.db.users.insert_many([user.model_dump() for user in users])
+    # Through the cart store, so the test runs against whichever CART_STORE is configured
+    await asyncio.gather(*(server.carts.add_item(user.id, product_id, quantity) for user in users))
+    headers = [
+        {
+            "Authorization": f"Bearer {server.create_access_token(server.user_token_claims(user))}",
+            "Idempotency-Key": uuid.uuid4().hex,
+        }
+        for user in users
+    ]
+    return product_id, headers
+
+
+async def checkout(client, headers):
+    start = time.perf_counter()
+    response = await client.post("/api/orders", headers=headers)
+    return response, elapsed_ms(start)
+
+
+async def run(buyers, stock, quantity, transactions):
+    transport = httpx.ASGITransport(app=server.app)
+    # The lifespan connects to MongoDB and closes the client on exit
+    async with server.lifespan(server.app), httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        try:
+            # "auto" keeps what the lifespan detected
+            if transactions != "auto":
+                server.use_order_transactions = transactions == "on"
+            product_id, headers = await seed(buyers, stock, quantity)
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(checkout(client, h) for h in headers))
+            wall = time.perf_counter() - start
+
+            statuses = Counter(response.status_code for response, _ in results)
+            samples = [ms for _, ms in results]
+            placed = {
+                h["Idempotency-Key"]: response.json()["id"]
+                for h, (response, _) in zip(headers, results)
+                if response.status_code == 201
+            }
+            print(f"transactions: {'on' if server.use_order_transactions else 'off'}")
+            print(f"{buyers} buyers x {quantity} against stock {stock} in {wall:.2f}s")
+            print(f"statuses: {dict(sorted(statuses.items()))}")
+            print(
+                f"latency: p50 {statistics.median(samples):.1f} ms, p99 {percentile(samples, 99):.1f} ms, "
+                f"max {max(samples):.1f} ms"
+            )
+
+            replays = await asyncio.gather(*(checkout(client, h) for h in headers if h["Idempotency-Key"] in placed))
+            product = await server.db.products.find_one({"id": product_id})
+            orders = await server.db.orders.count_documents({"status": "placed"})
+            pending = await server.db.orders.count_documents({"status": "pending"})
+
+            expected_orders = min(buyers, stock // quantity)
+            checks = {
+                "no oversell": product["stock"] >= 0,
+                "stock fully sold": product["stock"] == stock - expected_orders * quantity,
+                "one order per unit": len(placed) == orders == expected_orders,
+                "no pending claims left": pending == 0,
+                "only 201 and 409 responses": set(statuses) <= {201, 409},
+                "replays return the same order": all(
+                    response.status_code == 200 and response.json()["id"] in placed.values()
+                    for response, _ in replays
+                ),
+            }
+            print(f"final stock: {product['stock']}, placed orders: {orders}\n")
+            for name, ok in checks.items():
+                print(f"{'ok  ' if ok else 'FAIL'} {name}")
+            return all(checks.values())
+        finally:
+            await server.client.drop_database(server.db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=300)
+    parser.add_argument("--stock", type=int, default=20)
+    parser.add_argument("--quantity", type=int, default=1)
+    parser.add_argument("--transactions", choices=["auto", "on", "off"], default="auto")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.buyers, args.stock, args.quantity, args.transactions)) else 1)
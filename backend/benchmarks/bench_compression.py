@@ -0,0 +1,80 @@
+"""Benchmark response compression for the product listing and cart payloads.
+
+Builds the JSON bodies the API sends for a product listing (``--products``
+products from datagen.py) and a cart of ``--cart-size`` lines, then
+compresses each with gzip and, when the ``brotli`` package is installed,
+brotli at several levels. Reports bytes on the wire, compression ratio and
+CPU time per response. Rows marked ``*`` are the levels the API uses for that
+route with the current COMPRESSION_* settings.
+
+Catalog responses are compressed once per HTTP cache entry, cart responses on
+every request, so the CPU column matters most for the cart.
+
+No database is needed.
+
+Usage:
+    python benchmarks/bench_compression.py [--products 1000] [--cart-size 20] [--iterations 50]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from compression import CompressionPolicy, brotli  # noqa: E402
+from datagen import generate_products  # noqa: E402
+from server import compressor, json_response  # noqa: E402
+
+LEVELS = {"gzip": (1, 6, 9), "br": (4, 6, 9, 11)}
+
+
+def payloads(product_count, cart_size):
+    products = list(generate_products(product_count))
+    cart = [{"id": f"line-{i}", "product": product, "quantity": 1 + i % 3} for i, product in enumerate(products[:cart_size])]
+    return {
+        "/api/products": json_response(products).body,
+        "/api/cart": json_response(cart).body,
+    }
+
+
+def cpu_ms(compress, body, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.process_time()
+        compressed = compress(body)
+        samples.append((time.process_time() - start) * 1000)
+    return statistics.median(samples), compressed
+
+
+def main(args):
+    encodings = [encoding for encoding in ("gzip", "br") if encoding != "br" or brotli is not None]
+    if brotli is None:
+        print("brotli is not installed; reporting gzip only\n")
+    print(f"{'route':<14} {'encoding':<9} {'level':>5} {'bytes':>9} {'ratio':>7} {'cpu ms':>8}")
+    for path, body in payloads(args.products, args.cart_size).items():
+        policy = compressor.policy_for(path)
+        print(f"{path:<14} {'identity':<9} {'':>5} {len(body):>9} {1:>7.2f} {0:>8.2f}")
+        for encoding in encodings:
+            configured = policy.gzip_level if encoding == "gzip" else policy.brotli_level
+            for level in sorted(set(LEVELS[encoding]) | {configured}):
+                level_policy = CompressionPolicy(gzip_level=level, brotli_level=level)
+                ms, compressed = cpu_ms(
+                    lambda data: compressor.compress(data, encoding, level_policy), body, args.iterations
+                )
+                marker = "*" if level == configured else ""
+                print(
+                    f"{path:<14} {encoding:<9} {level:>5} {len(compressed):>9} "
+                    f"{len(body) / len(compressed):>7.2f} {ms:>8.2f} {marker}"
+                )
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--cart-size", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=50)
+    main(parser.parse_args())
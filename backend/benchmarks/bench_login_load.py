@@ -0,0 +1,109 @@
+"""Load test: catalog latency while logins are hammered, inline bcrypt vs worker pool.
+
+Drives the FastAPI app in-process against the MongoDB configured in backend/.env,
+using a throwaway ``<DB_NAME>_bench`` database. For each mode, login workers hit
+/api/auth/login continuously while a probe measures GET /api/products latency.
+With inline hashing every login blocks the event loop; with the pool the probe's
+p99 should stay close to its idle value.
+
+Usage:
+    python benchmarks/bench_login_load.py [--seconds 10] [--login-concurrency 16] [--rounds 12]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+os.environ['DB_NAME'] = f"{os.environ['DB_NAME']}_bench"
+# Every simulated client shares one IP, so per-client rate limits would throttle the benchmark itself
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'off')
+sys.path.insert(0, str(ROOT_DIR))
+
+from _common import elapsed_ms, latency_columns, percentile  # noqa: E402
+import server  # noqa: E402
+from password_hashing import PasswordHasher  # noqa: E402
+
+
+async def probe_catalog(client, stop_at):
+    samples = []
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        response = await client.get("/api/products", params={"limit": 24})
+        response.raise_for_status()
+        samples.append(elapsed_ms(start))
+        await asyncio.sleep(0.005)
+    return samples
+
+
+async def hammer_logins(client, credentials, stop_at, statuses):
+    while time.perf_counter() < stop_at:
+        response = await client.post("/api/auth/login", json=credentials)
+        statuses[response.status_code] += 1
+        if response.status_code == 429:
+            await asyncio.sleep(0.05)
+
+
+async def run_mode(client, credentials, seconds, login_concurrency):
+    statuses = Counter()
+    stop_at = time.perf_counter() + seconds
+    probe = asyncio.create_task(probe_catalog(client, stop_at))
+    await asyncio.gather(*(hammer_logins(client, credentials, stop_at, statuses) for _ in range(login_concurrency)))
+    return await probe, statuses
+
+
+async def run(seconds, login_concurrency, rounds):
+    transport = httpx.ASGITransport(app=server.app)
+    # The lifespan connects to MongoDB and closes the client on exit
+    async with server.lifespan(server.app), httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        try:
+            await server.db.products.insert_many([
+                {
+                    "id": str(uuid.uuid4()),
+                    "name": f"Bench Product {i}",
+                    "description": "Synthetic product used by the login load test.",
+                    "price": 10.0 + i,
+                    "category": "Bench",
+                    "image": "https://example.com/bench.jpg",
+                    "stock": 100,
+                    "created_at": datetime.now(timezone.utc),
+                }
+                for i in range(100)
+            ])
+
+            credentials = {"email": f"bench-{uuid.uuid4().hex[:8]}@example.com", "password": "bench-password"}
+            server.password_hasher = PasswordHasher(rounds=rounds, max_workers=1, max_queue=0)
+            await client.post("/api/auth/register", json={**credentials, "name": "Bench"})
+
+            idle, _ = await run_mode(client, credentials, 2, 0)
+            print(f"idle catalog: p50 {statistics.median(idle):.2f} ms, p99 {percentile(idle, 99):.2f} ms\n")
+
+            print(f"{'mode':<8} {'probes':>7} {'p50 ms':>9} {'p99 ms':>9} {'logins ok':>10} {'429s':>6}")
+            for mode, workers in (("inline", 0), ("pool", min(4, os.cpu_count() or 1))):
+                server.password_hasher = PasswordHasher(rounds=rounds, max_workers=workers, max_queue=login_concurrency // 2)
+                samples, statuses = await run_mode(client, credentials, seconds, login_concurrency)
+                print(
+                    f"{mode:<8} {len(samples):>7} {latency_columns(samples)} {statuses[200]:>10} {statuses[429]:>6}"
+                )
+                server.password_hasher.shutdown()
+        finally:
+            await server.client.drop_database(server.db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--login-concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+    asyncio.run(run(args.seconds, args.login_concurrency, args.rounds))
@@ -0,0 +1,121 @@
+"""Measure the overhead of the metrics subsystem.
+
+Three measurements:
+
+* middleware - per-request latency of GET /api/ and a cache-warm GET /api/products,
+               driven in-process with and without MetricsMiddleware
+* listener   - cost of one started+succeeded pair through CommandMetrics, timed
+               directly with synthetic pymongo events (no database round trip;
+               includes building the events, so it is an upper bound)
+* scrape     - time to render /metrics
+
+Runs against the MongoDB configured in backend/.env, using a throwaway
+``<DB_NAME>_bench`` database.
+
+Usage:
+    python benchmarks/bench_metrics.py [--requests 5000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+from pymongo import monitoring
+from starlette.middleware import Middleware
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+os.environ['DB_NAME'] = f"{os.environ['DB_NAME']}_bench"
+# Every simulated client shares one IP, so per-client rate limits would throttle the benchmark itself
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'off')
+sys.path.insert(0, str(ROOT_DIR))
+
+from _common import elapsed_ms, percentile  # noqa: E402
+import server  # noqa: E402
+from metrics import CommandMetrics, MetricsMiddleware, render_metrics  # noqa: E402
+
+
+def set_middleware(enabled):
+    """Add or remove MetricsMiddleware and make Starlette rebuild its middleware stack."""
+    app = server.app
+    app.user_middleware = [m for m in app.user_middleware if m.cls is not MetricsMiddleware]
+    if enabled:
+        app.user_middleware.insert(0, Middleware(MetricsMiddleware))
+    app.middleware_stack = None
+
+
+async def latency_us(client, path, total):
+    samples = []
+    for _ in range(total):
+        start = time.perf_counter()
+        response = await client.get(path)
+        samples.append((time.perf_counter() - start) * 1e6)
+        response.raise_for_status()
+    return samples
+
+
+def listener_us(total):
+    listener = CommandMetrics()
+    command = {"find": "products", "filter": {"id": "product-id"}}
+    duration = timedelta(microseconds=800)
+    start = time.perf_counter()
+    for request_id in range(total):
+        listener.started(monitoring.CommandStartedEvent(command, "bench", request_id, ("localhost", 27017), request_id))
+        listener.succeeded(monitoring.CommandSucceededEvent(
+            duration, {"ok": 1}, "find", request_id, ("localhost", 27017), request_id
+        ))
+    return (time.perf_counter() - start) * 1e6 / total
+
+
+async def run(total):
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.lifespan(server.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        try:
+            await server.db.products.insert_many([
+                {
+                    "id": str(uuid.uuid4()),
+                    "name": f"Bench Product {i}",
+                    "description": "Synthetic product used by the metrics benchmark.",
+                    "price": 10.0 + i,
+                    "category": "Bench",
+                    "image": "https://example.com/bench.jpg",
+                    "stock": 100,
+                    "created_at": datetime.now(timezone.utc),
+                }
+                for i in range(100)
+            ])
+
+            print(f"{'path':<26} {'p50 off us':>11} {'p50 on us':>10} {'overhead us':>12} {'p99 on us':>10}")
+            for path in ("/api/", "/api/products?limit=24"):
+                results = {}
+                for enabled in (False, True, False, True):
+                    set_middleware(enabled)
+                    await latency_us(client, path, 200)  # warm caches and the rebuilt stack
+                    results[enabled] = await latency_us(client, path, total)
+                off, on = statistics.median(results[False]), statistics.median(results[True])
+                print(f"{path:<26} {off:>11.1f} {on:>10.1f} {on - off:>12.1f} {percentile(results[True], 99):>10.1f}")
+
+            print(f"\nCommandMetrics started+succeeded: {listener_us(total * 10):.2f} us per command")
+
+            samples = []
+            for _ in range(200):
+                start = time.perf_counter()
+                body, _ = render_metrics()
+                samples.append(elapsed_ms(start))
+            print(f"/metrics render: p50 {statistics.median(samples):.2f} ms, {len(body)} bytes")
+        finally:
+            await server.client.drop_database(server.db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
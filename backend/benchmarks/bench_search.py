@@ -0,0 +1,96 @@
+"""Benchmark the product search index against a regex scan over a synthetic catalog.
+
+The regex scan stands in for the old ``{"name": {"$regex": search, "$options": "i"}}``
+query, which had to test every product document. No database is needed.
+
+Usage:
+    python benchmarks/bench_search.py [--products 100000] [--iterations 50]
+"""
+import argparse
+import random
+import re
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from _common import elapsed_ms, latency_columns  # noqa: E402
+from search_index import ProductSearchIndex  # noqa: E402
+
+ADJECTIVES = [
+    "wireless", "vintage", "organic", "smart", "portable", "premium", "minimalist",
+    "ergonomic", "waterproof", "handcrafted", "compact", "classic", "modern", "rugged",
+]
+NOUNS = [
+    "headphones", "watch", "backpack", "shirt", "lamp", "speaker", "keyboard", "mat",
+    "bottle", "sneakers", "jacket", "camera", "chair", "blender", "tent", "charger",
+]
+CATEGORIES = ["Electronics", "Fashion", "Sports", "Home"]
+FILLER = (
+    "durable lightweight comfortable premium quality designed everyday use battery "
+    "stainless steel cotton leather adjustable travel outdoor office kitchen gift"
+).split()
+
+QUERIES = ["headphones", "wireless head", "vin", "smart watch", "premium leather", "zzz"]
+
+
+def synthetic_catalog(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(count):
+        name = f"{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()} {i}"
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "name": name,
+            "description": " ".join(rng.choices(FILLER, k=14)),
+            "category": rng.choice(CATEGORIES),
+        }
+
+
+def regex_scan(products, query):
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+    return [p["id"] for p in products if pattern.search(p["name"])]
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(elapsed_ms(start))
+    return samples, len(result)
+
+
+def main(count, iterations):
+    products = list(synthetic_catalog(count))
+
+    index = ProductSearchIndex()
+    start = time.perf_counter()
+    index.build(products)
+    print(f"Built index over {len(index)} products in {time.perf_counter() - start:.2f}s")
+
+    new_product = {"id": "bench-new", "name": "Wireless Widget", "description": "", "category": "Home"}
+    start = time.perf_counter()
+    index.add(new_product)
+    index.remove(new_product["id"])
+    print(f"Incremental add+remove: {elapsed_ms(start):.3f} ms\n")
+
+    print(f"{'query':<18} {'engine':>6} {'hits':>7} {'p50 ms':>9} {'p99 ms':>9}")
+    for query in QUERIES:
+        for engine, fn in (
+            ("index", lambda: index.search(query, limit=1000)),
+            ("regex", lambda: regex_scan(products, query)),
+        ):
+            samples, hits = measure(fn, iterations)
+            print(
+                f"{query:<18} {engine:>6} {hits:>7} {latency_columns(samples)}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    main(args.products, args.iterations)
@@ -0,0 +1,97 @@
+"""Measure API startup time and cold-request latency, with and without pool warmup.
+
+Starts ``uvicorn server:app`` as a subprocess against the MongoDB configured in
+backend/.env, using a throwaway ``<DB_NAME>_bench`` database. For each run it
+reports:
+
+* startup  - process spawn until /api/health first answers 200
+* cold     - the first GET /api/products after startup
+* warm p50 - the median of the next ``--requests`` identical requests
+
+A cold request that is much slower than warm p50 means it paid for connection
+setup. Raising MONGO_WARMUP_CONNECTIONS should close the gap.
+
+Usage:
+    python benchmarks/bench_startup.py [--warmup 0 10] [--requests 50] [--port 8765]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from _common import elapsed_ms
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+BENCH_DB = f"{os.environ['DB_NAME']}_bench"
+
+
+def timed_get(client, path):
+    start = time.perf_counter()
+    response = client.get(path)
+    response.raise_for_status()
+    return elapsed_ms(start)
+
+
+def measure(warmup, requests, port, timeout=60):
+    env = {
+        **os.environ,
+        "DB_NAME": BENCH_DB,
+        "MONGO_WARMUP_CONNECTIONS": str(warmup),
+        "MONGO_MIN_POOL_SIZE": str(warmup),
+    }
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR,
+        env=env,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=10) as client:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"server exited with code {process.returncode}")
+                if time.perf_counter() - start > timeout:
+                    raise RuntimeError("server did not become healthy in time")
+                try:
+                    if client.get("/api/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.02)
+            startup = elapsed_ms(start)
+
+            cold = timed_get(client, "/api/products?limit=24")
+            warm = [timed_get(client, "/api/products?limit=24") for _ in range(requests)]
+            pool = client.get("/api/health").json()["pool"]
+        return startup, cold, statistics.median(warm), pool["open_connections"]
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main(warmups, requests, port):
+    print(f"{'warmup':>6} {'startup ms':>11} {'cold ms':>8} {'warm p50 ms':>12} {'connections':>12}")
+    try:
+        for warmup in warmups:
+            startup, cold, warm, connections = measure(warmup, requests, port)
+            print(f"{warmup:>6} {startup:>11.0f} {cold:>8.2f} {warm:>12.2f} {connections:>12}")
+    finally:
+        with MongoClient(os.environ['MONGO_URL']) as client:
+            client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--warmup", type=int, nargs="+", default=[0, 10])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    main(args.warmup, args.requests, args.port)
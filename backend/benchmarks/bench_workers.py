@@ -0,0 +1,213 @@
+"""Measure API throughput as the number of worker processes grows.
+
+Starts ``serve.py --workers N`` as a subprocess for each N in ``--workers``
+against the MongoDB configured in backend/.env, using a throwaway
+``<DB_NAME>_bench`` database seeded with ``--products`` products from
+datagen.py. ``--clients`` load-generating processes, each holding
+``--concurrency`` connections, send GET /api/products?limit=24 for
+``--duration`` seconds. The requests carry ``Cache-Control: no-cache`` so
+every one runs the route rather than the HTTP response cache. ``--http-cache``
+drops that header.
+
+For each worker count it reports requests per second, p50/p99 latency, errors,
+the speedup over the first row, and how long the server took to exit after
+SIGTERM.
+
+``--shared`` picks the shared state backend the workers use:
+
+* ``memory`` (default) - each worker keeps its own state
+* ``standin`` - a local fakeredis server speaking the Redis protocol, started
+  for the run (needs the ``fakeredis`` package)
+* a ``redis://`` URL - an existing Redis
+
+Rate limits are switched off so the load generator is not throttled. Run the
+load generator on another machine, or leave it enough cores, or the workers
+and clients compete for CPU and the speedup flattens early.
+
+Usage:
+    python benchmarks/bench_workers.py [--workers 1 2 4] [--clients 4] [--concurrency 16]
+        [--duration 10] [--products 2000] [--shared memory|standin|redis://...] [--http-cache]
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+load_dotenv(ROOT_DIR / '.env')
+
+from _common import elapsed_ms, percentile  # noqa: E402
+from datagen import generate_products, insert_batched  # noqa: E402
+from product_cache import bump_catalog_version  # noqa: E402
+
+BENCH_DB = f"{os.environ['DB_NAME']}_bench"
+PATH = "/api/products?limit=24"
+STANDIN = "from fakeredis import TcpFakeServer; TcpFakeServer(('127.0.0.1', {port}), server_type='redis').serve_forever()"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def seed(products):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        await client.drop_database(BENCH_DB)
+        db = client[BENCH_DB]
+        await insert_batched(db.products, generate_products(products))
+        await bump_catalog_version(db)
+    finally:
+        client.close()
+
+
+async def drop():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        await client.drop_database(BENCH_DB)
+    finally:
+        client.close()
+
+
+def wait_healthy(process, base_url, timeout=60):
+    deadline = time.perf_counter() + timeout
+    with httpx.Client(base_url=base_url, timeout=5) as client:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"server exited with code {process.returncode}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError("server did not become healthy in time")
+            try:
+                if client.get("/api/health").status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.05)
+
+
+async def drive_async(base_url, headers, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def user(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(PATH, headers=headers)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(elapsed_ms(start))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def drive(base_url, headers, concurrency, duration):
+    """Load generator process: returns ``(latencies_ms, errors)``."""
+    return asyncio.run(drive_async(base_url, headers, concurrency, duration))
+
+
+def measure(workers, args, env):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR,
+        env=env,
+    )
+    try:
+        wait_healthy(process, base_url)
+        headers = {} if args.http_cache else {"Cache-Control": "no-cache"}
+        # Fill the product cache in every worker before the timed run
+        drive(base_url, headers, workers * 2, 1.0)
+
+        with multiprocessing.Pool(args.clients) as pool:
+            start = time.perf_counter()
+            results = pool.starmap(drive, [(base_url, headers, args.concurrency, args.duration)] * args.clients)
+            elapsed = time.perf_counter() - start
+    finally:
+        stop_start = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=args.graceful_timeout + 30)
+        stop_seconds = time.perf_counter() - stop_start
+
+    latencies = [ms for samples, _ in results for ms in samples]
+    errors = sum(count for _, count in results)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50) if latencies else 0.0,
+        "p99": percentile(latencies, 99) if latencies else 0.0,
+        "errors": errors,
+        "stop": stop_seconds,
+    }
+
+
+def main(args):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    env = {
+        **os.environ,
+        "DB_NAME": BENCH_DB,
+        "RATE_LIMIT_BACKEND": "off",
+        "GRACEFUL_TIMEOUT_SECONDS": str(args.graceful_timeout),
+    }
+    standin = None
+    if args.shared == "standin":
+        port = free_port()
+        standin = subprocess.Popen([sys.executable, "-c", STANDIN.format(port=port)])
+        env.update(SHARED_STATE="redis", SHARED_STATE_URL=f"redis://127.0.0.1:{port}/0")
+    elif args.shared != "memory":
+        env.update(SHARED_STATE="redis", SHARED_STATE_URL=args.shared)
+
+    asyncio.run(seed(args.products))
+    print(f"shared state: {args.shared}, {os.cpu_count()} cores, "
+          f"{args.clients} clients x {args.concurrency} connections, {args.duration:.0f}s per row\n")
+    print(f"{'workers':>7} {'rps':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'speedup':>8} {'stop s':>7}")
+    baseline = None
+    try:
+        for workers in args.workers:
+            result = measure(workers, args, env)
+            baseline = baseline or result["rps"]
+            print(
+                f"{workers:>7} {result['rps']:>9.0f} {result['p50']:>8.2f} {result['p99']:>8.2f} "
+                f"{result['errors']:>7} {result['rps'] / baseline:>7.2f}x {result['stop']:>7.2f}"
+            )
+    finally:
+        if standin is not None:
+            standin.terminate()
+            standin.wait(timeout=10)
+        asyncio.run(drop())
+
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, min(2, cores), min(4, cores), cores}))
+    parser.add_argument("--clients", type=int, default=max(2, cores // 2))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--shared", default="memory", help="memory, standin, or a redis:// URL")
+    parser.add_argument("--http-cache", action="store_true", help="let requests hit the HTTP response cache")
+    parser.add_argument("--graceful-timeout", type=float, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,135 @@
+"""Synthetic catalog, users and carts for load tests, scaled up from seed_products.py.
+
+Products are variations of the seed catalog: same categories, images and price
+bands, with a numbered name and a shuffled description. Every user has the same
+password. Its bcrypt hash is computed once at the configured cost, so logins do
+real work while seeding stays fast. Each user gets a cart of up to
+``cart_size`` distinct products.
+
+Used by benchmarks/loadtest.py, and can seed a real database on its own:
+
+    python benchmarks/datagen.py [--products 100000] [--users 1000] [--cart-size 20] [--db NAME]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+sys.path.insert(0, str(ROOT_DIR))
+
+from password_hashing import PasswordHasher  # noqa: E402
+from product_cache import bump_catalog_version  # noqa: E402
+from seed_products import products as SEED_PRODUCTS  # noqa: E402
+
+PASSWORD = "loadtest-password"
+BATCH_SIZE = 5000
+ADJECTIVES = [
+    "Classic", "Premium", "Compact", "Ultra", "Eco", "Pro", "Lite", "Vintage",
+    "Smart", "Rugged", "Deluxe", "Essential", "Modern", "Travel", "Studio",
+]
+
+
+def generate_products(count, seed=42):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    for i in range(count):
+        template = SEED_PRODUCTS[i % len(SEED_PRODUCTS)]
+        words = template["description"].rstrip(".").split()
+        rng.shuffle(words)
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "name": f"{rng.choice(ADJECTIVES)} {template['name']} {i}",
+            "description": " ".join(words) + ".",
+            "price": round(template["price"] * rng.uniform(0.5, 1.5), 2),
+            "category": template["category"],
+            "image": template["image"],
+            "stock": rng.randint(0, 500),
+            "created_at": now - timedelta(seconds=i),
+        }
+
+
+async def insert_batched(collection, documents):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= BATCH_SIZE:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def generate(db, products=10_000, users=100, cart_size=20, bcrypt_rounds=12, seed=42):
+    """Populate ``db`` and return ``{"product_ids", "categories", "users"}`` for workload drivers.
+
+    ``users`` is a list of ``{"id", "email", "name"}``; every user's password is ``PASSWORD``.
+    """
+    rng = random.Random(seed)
+    product_ids = []
+
+    def tracked(documents):
+        for document in documents:
+            product_ids.append(document["id"])
+            yield document
+
+    await insert_batched(db.products, tracked(generate_products(products, seed)))
+
+    hasher = PasswordHasher(rounds=bcrypt_rounds, max_workers=0)
+    password_hash = await hasher.hash(PASSWORD)
+    now = datetime.now(timezone.utc)
+    accounts = [
+        {"id": str(uuid.UUID(int=rng.getrandbits(128), version=4)), "email": f"loadtest-{i}@example.com", "name": f"Load Test {i}"}
+        for i in range(users)
+    ]
+    await insert_batched(
+        db.users, ({**account, "password_hash": password_hash, "created_at": now} for account in accounts)
+    )
+
+    def cart_rows():
+        for account in accounts:
+            for product_id in rng.sample(product_ids, min(cart_size, len(product_ids))):
+                yield {
+                    "id": str(uuid.uuid4()),
+                    "user_id": account["id"],
+                    "product_id": product_id,
+                    "quantity": rng.randint(1, 3),
+                    "created_at": now,
+                    "updated_at": now,
+                }
+
+    await insert_batched(db.cart, cart_rows())
+    await bump_catalog_version(db)
+    return {
+        "product_ids": product_ids,
+        "categories": sorted({product["category"] for product in SEED_PRODUCTS}),
+        "users": accounts,
+    }
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[args.db]
+    try:
+        data = await generate(db, args.products, args.users, args.cart_size, args.bcrypt_rounds)
+        print(f"Seeded {len(data['product_ids'])} products and {len(data['users'])} users into {args.db}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--cart-size", type=int, default=20)
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.environ.get('BCRYPT_ROUNDS', 12)))
+    parser.add_argument("--db", default=f"{os.environ['DB_NAME']}_bench")
+    asyncio.run(main(parser.parse_args()))
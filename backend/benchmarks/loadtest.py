@@ -0,0 +1,330 @@
+"""Mixed-workload load test for the API, with a JSON report and baseline regression check.
+
+Seeds a synthetic dataset with benchmarks/datagen.py, then drives the FastAPI
+app in-process (httpx ASGI transport, no network) with ``--concurrency``
+virtual users for ``--duration`` seconds. Each request is drawn from a weighted
+mix of operations:
+
+    browse  GET  /api/products?category=..&limit=24 (sometimes the next page)
+    search  GET  /api/products?search=..
+    detail  GET  /api/products/{id}
+    cart    GET  /api/cart
+    add     POST /api/cart
+    sync    POST /api/cart/sync (five guest lines)
+    login   POST /api/auth/login (real bcrypt verify)
+
+Two database backends:
+
+* ``mongomock`` (default) - mongomock-motor in memory. Needs no server, so it
+  is reproducible anywhere, but it measures the app's Python overhead rather
+  than MongoDB.
+* ``mongo`` - the MongoDB in backend/.env, using a throwaway
+  ``<DB_NAME>_bench`` database. Use this for 100k-1M product runs.
+
+The report has RPS, error count and p50/p95/p99 latency per operation. With
+``--baseline``, the run fails (exit 1) when an operation's p95 rises, or its RPS
+falls, by more than ``--tolerance`` against the stored report. Baselines only
+compare like with like: regenerate one with ``--write-baseline`` on the machine
+and backend that will run the check.
+
+Usage:
+    python benchmarks/loadtest.py [--backend mongomock] [--products 2000] [--users 100]
+        [--cart-size 20] [--concurrency 16] [--duration 20] [--bcrypt-rounds N]
+        [--mix browse=35,search=20,detail=15,cart=10,add=10,sync=5,login=5]
+        [--report report.json] [--baseline benchmarks/baselines/loadtest.json] [--tolerance 0.25]
+        [--write-baseline]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+from _common import elapsed_ms, percentile
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+sys.path.insert(0, str(ROOT_DIR))
+
+DEFAULT_MIX = "browse=35,search=20,detail=15,cart=10,add=10,sync=5,login=5"
+DEFAULT_BASELINE = ROOT_DIR / "benchmarks" / "baselines" / "loadtest.json"
+# p95 changes smaller than this are noise at any tolerance
+MIN_P95_DELTA_MS = 1.0
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        weights[name] = float(weight)
+    return weights
+
+
+def load_app(backend):
+    """Import the app after pointing it at the chosen database backend."""
+    if backend == "mongomock":
+        import mongomock_motor
+        import motor.motor_asyncio
+
+        motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+        # mongomock has no explain() or hello, so skip the plan check and the transaction and change stream probes
+        os.environ.setdefault('INDEX_PLAN_CHECK', 'off')
+        os.environ.setdefault('ORDER_TRANSACTIONS', 'off')
+        os.environ.setdefault('CATALOG_WATCH', 'poll')
+    os.environ['DB_NAME'] = f"{os.environ['DB_NAME']}_bench"
+    # Every simulated client shares one IP, so per-client rate limits would throttle the run itself
+    os.environ.setdefault('RATE_LIMIT_BACKEND', 'off')
+
+    import server
+    import datagen
+    # One INFO line per request would swamp the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return server, datagen
+
+
+class Workload:
+    def __init__(self, client, data, tokens, search_terms, rng):
+        self.client = client
+        self.data = data
+        self.tokens = tokens
+        self.search_terms = search_terms
+        self.rng = rng
+
+    def _user(self):
+        index = self.rng.randrange(len(self.data["users"]))
+        return self.data["users"][index], {"Authorization": f"Bearer {self.tokens[index]}"}
+
+    async def browse(self):
+        params = {"category": self.rng.choice(self.data["categories"]), "limit": 24}
+        response = await self.client.get("/api/products", params=params)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor and self.rng.random() < 0.3:
+            response = await self.client.get("/api/products", params={**params, "cursor": cursor})
+        return response
+
+    async def search(self):
+        return await self.client.get("/api/products", params={"search": self.rng.choice(self.search_terms), "limit": 24})
+
+    async def detail(self):
+        return await self.client.get(f"/api/products/{self.rng.choice(self.data['product_ids'])}")
+
+    async def cart(self):
+        _, headers = self._user()
+        return await self.client.get("/api/cart", headers=headers)
+
+    async def add(self):
+        _, headers = self._user()
+        body = {"product_id": self.rng.choice(self.data["product_ids"]), "quantity": 1}
+        return await self.client.post("/api/cart", json=body, headers=headers)
+
+    async def sync(self):
+        _, headers = self._user()
+        body = [{"product_id": self.rng.choice(self.data["product_ids"]), "quantity": 1} for _ in range(5)]
+        return await self.client.post("/api/cart/sync", json=body, headers=headers)
+
+    async def login(self):
+        user, _ = self._user()
+        return await self.client.post("/api/auth/login", json={"email": user["email"], "password": self.data["password"]})
+
+
+OPERATIONS = ["browse", "search", "detail", "cart", "add", "sync", "login"]
+
+
+async def virtual_user(workload, weights, stop_at, results):
+    names, cumulative = list(weights), list(weights.values())
+    while time.perf_counter() < stop_at:
+        name = workload.rng.choices(names, cumulative)[0]
+        start = time.perf_counter()
+        try:
+            status = (await getattr(workload, name)()).status_code
+        except httpx.HTTPError:
+            status = 0
+        results[name].append((status, elapsed_ms(start)))
+
+
+def summarize(results, elapsed):
+    endpoints = {}
+    for name, samples in sorted(results.items()):
+        latencies = [ms for _, ms in samples]
+        statuses = [status for status, _ in samples]
+        endpoints[name] = {
+            "requests": len(samples),
+            "errors": sum(1 for status in statuses if status == 0 or (status >= 400 and status != 429)),
+            "throttled": statuses.count(429),
+            "rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+        }
+    everything = [ms for samples in results.values() for _, ms in samples]
+    total = {
+        "requests": len(everything),
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "rps": round(len(everything) / elapsed, 1),
+        "p50_ms": round(percentile(everything, 50), 3),
+        "p95_ms": round(percentile(everything, 95), 3),
+        "p99_ms": round(percentile(everything, 99), 3),
+    }
+    return endpoints, total
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Return a list of regression messages; empty means the run passes."""
+    regressions = []
+    for name, base in baseline["endpoints"].items():
+        current = report["endpoints"].get(name)
+        if current is None:
+            continue
+        p95_limit = base["p95_ms"] * (1 + tolerance)
+        if current["p95_ms"] > p95_limit and current["p95_ms"] - base["p95_ms"] > MIN_P95_DELTA_MS:
+            regressions.append(f"{name}: p95 {current['p95_ms']:.2f} ms > {p95_limit:.2f} ms (baseline {base['p95_ms']:.2f})")
+        rps_floor = base["rps"] * (1 - tolerance)
+        if current["rps"] < rps_floor:
+            regressions.append(f"{name}: {current['rps']:.0f} rps < {rps_floor:.0f} rps (baseline {base['rps']:.0f})")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: {current['errors']} errors (baseline {base['errors']})")
+    return regressions
+
+
+async def run(args, weights):
+    server, datagen = load_app(args.backend)
+    from db_indexes import REQUIRED_INDEXES, ensure_indexes
+    from migrate_cart_layout import migrate_rows_to_embedded
+    rng = random.Random(args.seed)
+    if args.bcrypt_rounds is not None:
+        server.password_hasher = server.PasswordHasher(
+            rounds=args.bcrypt_rounds, max_workers=server.password_hasher.max_workers,
+            max_queue=server.password_hasher.max_queue,
+        )
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.lifespan(server.app), httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+        try:
+            # Bulk load without indexes and build them afterwards; mongomock checks
+            # unique indexes per insert, which makes seeding quadratic
+            start = time.perf_counter()
+            for collection in REQUIRED_INDEXES:
+                await server.db[collection].drop_indexes()
+            data = await datagen.generate(
+                server.db, args.products, args.users, args.cart_size, server.password_hasher.rounds, args.seed
+            )
+            await ensure_indexes(server.db)
+            if server.carts.name == "embedded":
+                # datagen writes cart rows; move them into the layout the API reads
+                await migrate_rows_to_embedded(server.db)
+            data["password"] = datagen.PASSWORD
+            print(f"Seeded {args.products} products, {args.users} users in {time.perf_counter() - start:.1f}s")
+
+            tokens = [
+                server.create_access_token(server.user_token_claims(server.User(**user, password_hash="")))
+                for user in data["users"]
+            ]
+            words = {word.lower() for product in datagen.SEED_PRODUCTS for word in product["name"].split()}
+            search_terms = sorted(words) + [word[:3] for word in sorted(words) if len(word) > 3]
+
+            results = defaultdict(list)
+            stop_at = time.perf_counter() + args.duration
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                virtual_user(Workload(client, data, tokens, search_terms, random.Random(rng.random())), weights, stop_at, results)
+                for _ in range(args.concurrency)
+            ))
+            elapsed = time.perf_counter() - started
+        finally:
+            await server.client.drop_database(server.db.name)
+
+    endpoints, total = summarize(results, elapsed)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "backend": args.backend,
+            "products": args.products,
+            "users": args.users,
+            "cart_size": args.cart_size,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": weights,
+            "bcrypt_rounds": server.password_hasher.rounds,
+            "cart_store": server.carts.name,
+        },
+        "endpoints": endpoints,
+        "total": total,
+    }
+
+
+def print_report(report):
+    print(f"\n{'operation':<8} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    for name, row in rows:
+        print(
+            f"{name:<8} {row['requests']:>9} {row['errors']:>7} {row['rps']:>8.1f} "
+            f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["mongomock", "mongo"], default="mongomock")
+    parser.add_argument("--products", type=int, help="default 2000 on mongomock, 10000 on mongo")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--cart-size", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--bcrypt-rounds", type=int, help="override BCRYPT_ROUNDS for the run")
+    parser.add_argument("--report", type=Path, help="write the JSON report here")
+    parser.add_argument("--baseline", type=Path, help="fail on regressions against this report")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--write-baseline", action="store_true", help=f"store this run as {DEFAULT_BASELINE.name}")
+    args = parser.parse_args()
+    if args.products is None:
+        # mongomock scans every document per query, so keep its catalog small
+        args.products = 2000 if args.backend == "mongomock" else 10_000
+
+    report = asyncio.run(run(args, parse_mix(args.mix)))
+    print_report(report)
+
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"\nReport written to {args.report}")
+    if args.write_baseline:
+        DEFAULT_BASELINE.parent.mkdir(exist_ok=True)
+        DEFAULT_BASELINE.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline written to {DEFAULT_BASELINE}")
+    if args.baseline:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print(f"\nRegressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Keep the cart collection small: expire abandoned carts and compact what is left.
+
+    python cart_compaction.py
+
+Expiry is MongoDB's job. Every cart mutation sets ``updated_at``, and a TTL
+index on it (see db_indexes.py) deletes cart rows, or with CART_STORE=embedded
+whole carts, that nobody has changed for CART_TTL_DAYS. Documents written
+before ``updated_at`` existed would never expire, so compaction stamps them
+with the time it first sees them.
+
+``CartCompactor`` does the rest. A run:
+
+* merges repeated lines for one product in one cart into the oldest line,
+  adding up their quantities. Rows can only repeat where the unique
+  ``(user_id, product_id)`` index could not be built; once the duplicates are
+  gone, the unique index replaces its non-unique fallback.
+* removes lines for products that no longer exist or were soft-deleted
+* deletes embedded carts left with no lines
+
+Every step is safe to run from several API workers at once. A duplicate row is
+deleted before its quantity moves, so only one process can move it, and an
+embedded cart is rewritten only if it is unchanged since it was read.
+
+A run reports the documents and bytes reclaimed, as the change in the
+collection's document count and data size from ``$collStats``. Writes made by
+the API during the run are part of that change. MongoDB reuses the freed
+space for new documents; the files on disk only shrink with ``compact``.
+
+The API runs a compaction every CART_COMPACTION_INTERVAL_SECONDS (0 leaves it
+to cron and this script).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+
+from cart_store import cart_store_from_env
+from catalog_admin import ACTIVE
+from db_indexes import restore_unique_indexes
+from periodic import PeriodicTask
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+# Product ids checked against the catalog per query
+PRODUCT_BATCH_SIZE = 1000
+STARTUP_DELAY_SECONDS = 60
+NAMESPACE_NOT_FOUND = 26
+
+
+class CartCompactor:
+    def __init__(self, db, carts, interval: float = 21600.0):
+        self.db = db
+        self.carts = carts
+        self.interval = interval
+        self._periodic = PeriodicTask("Cart compaction", self.run, interval, first_delay=STARTUP_DELAY_SECONDS)
+
+        self.runs = 0
+        self.documents_reclaimed = 0
+        self.bytes_reclaimed = 0
+
+    @classmethod
+    def from_env(cls, db, carts) -> "CartCompactor":
+        return cls(db, carts, interval=float(os.environ.get('CART_COMPACTION_INTERVAL_SECONDS', 21600)))
+
+    @property
+    def errors(self) -> int:
+        return self._periodic.errors
+
+    async def start(self) -> None:
+        self._periodic.start()
+
+    async def stop(self) -> None:
+        await self._periodic.stop()
+
+    async def run(self) -> dict:
+        """Compact the carts once; return what was done and reclaimed."""
+        started = time.perf_counter()
+        before = await collection_size(self.carts.collection)
+        stamped = await self.carts.stamp_untimed(datetime.now(timezone.utc))
+        merged = await self.carts.merge_duplicates()
+        restored = await restore_unique_indexes(self.db, self.carts.collection_name)
+        missing = await self._missing_products()
+        orphaned = await self.carts.remove_products(missing) if missing else 0
+        emptied = await self.carts.drop_empty()
+        after = await collection_size(self.carts.collection)
+
+        report = {
+            "stamped": stamped,
+            "merged_lines": merged,
+            "orphaned_lines": orphaned,
+            "empty_carts": emptied,
+            "indexes_restored": restored,
+            "documents_reclaimed": max(before["count"] - after["count"], 0),
+            "bytes_reclaimed": max(before["size"] - after["size"], 0),
+            "seconds": time.perf_counter() - started,
+        }
+        self.runs += 1
+        self.documents_reclaimed += report["documents_reclaimed"]
+        self.bytes_reclaimed += report["bytes_reclaimed"]
+        logger.info(
+            "Cart compaction in %.2fs: %d lines merged, %d orphaned lines and %d empty carts removed, "
+            "%d documents and %d bytes reclaimed",
+            report["seconds"], merged, orphaned, emptied, report["documents_reclaimed"], report["bytes_reclaimed"],
+        )
+        return report
+
+    async def _missing_products(self) -> List[str]:
+        """Product ids in carts that are not in the catalog, or were deleted from it."""
+        product_ids = await self.carts.product_ids()
+        missing = []
+        for start in range(0, len(product_ids), PRODUCT_BATCH_SIZE):
+            batch = product_ids[start:start + PRODUCT_BATCH_SIZE]
+            active = set(await self.db.products.distinct("id", {"id": {"$in": batch}, **ACTIVE}))
+            missing.extend(product_id for product_id in batch if product_id not in active)
+        return missing
+
+
+async def collection_size(collection) -> dict:
+    """``{"count", "size"}``: documents and uncompressed bytes of data in the collection."""
+    try:
+        stats = await collection.aggregate([{"$collStats": {"storageStats": {}}}]).to_list(None)
+    except OperationFailure as e:
+        if e.code != NAMESPACE_NOT_FOUND:
+            raise
+        stats = []
+    if not stats:
+        # The collection does not exist yet
+        return {"count": 0, "size": 0}
+    # Sharded collections report one document per shard
+    return {
+        "count": sum(stat["storageStats"]["count"] for stat in stats),
+        "size": sum(stat["storageStats"]["size"] for stat in stats),
+    }
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        carts = cart_store_from_env(db)
+        report = await CartCompactor(db, carts).run()
+        print(
+            f"Compacted {carts.collection_name} in {report['seconds']:.1f}s: "
+            f"{report['stamped']} documents given an updated_at, {report['merged_lines']} duplicate lines merged, "
+            f"{report['orphaned_lines']} lines for deleted products and {report['empty_carts']} empty carts removed"
+        )
+        for name in report["indexes_restored"]:
+            print(f"  Restored unique index {name}")
+        print(f"Reclaimed {report['documents_reclaimed']} documents, {report['bytes_reclaimed']} bytes of data")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description="Merge duplicate cart lines and remove lines for deleted products").parse_args()
+    asyncio.run(main())
@@ -0,0 +1,450 @@
+"""Cart storage engines behind one small repository interface.
+
+Two layouts are supported. CART_STORE picks one; ``rows`` is the default.
+
+* ``rows`` (``RowCartStore``) - the original layout: one document per
+  ``(user_id, product_id)`` in ``cart``, with a unique index on that pair.
+* ``embedded`` (``EmbeddedCartStore``) - one document per user in ``carts``,
+  ``{"_id": user_id, "items": [...]}``. Every mutation is a single atomic
+  update (``$inc`` with array filters, conditional ``$push``, ``$pull``), and
+  a single ``find_one`` returns the whole cart.
+
+Both expose cart lines as ``{"id", "product_id", "quantity", "created_at"}``.
+Line ids stay stable, so the API's ``/cart/{cart_id}`` routes work with either
+engine. ``migrate_cart_layout.py`` copies the rows layout into the embedded one.
+
+Every mutation sets ``updated_at`` on the whole cart: all of the user's rows,
+or the embedded cart document. A TTL index on it (see db_indexes.py) expires
+carts nobody has changed for CART_TTL_DAYS. In the rows layout the index
+still works row by row, so touching every row is what keeps a line the user
+has not changed in a while from expiring out of a cart that is still in use.
+The compaction methods at the end of each store serve ``cart_compaction.py``.
+"""
+import os
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+LINE_FIELDS = {"_id": 0, "id": 1, "product_id": 1, "quantity": 1, "created_at": 1}
+BASKET_FIELDS = {"_id": 0, "user_id": 1, "product_id": 1, "created_at": 1}
+# Users whose carts are read per query by baskets_since
+BASKET_BATCH_SIZE = 500
+
+# Conditional pushes retry when a concurrent request added the same product first,
+# and checkout's removals when a concurrent request changed the line's quantity
+MAX_PUSH_ATTEMPTS = 5
+
+
+def cart_ttl_seconds() -> int:
+    """Seconds a cart survives without a change; 0 keeps carts forever."""
+    return int(float(os.environ.get('CART_TTL_DAYS', 30)) * 86400)
+
+
+class CartStore(ABC):
+    """Repository interface used by the cart routes, checkout and the cart summary."""
+
+    name = ""
+    collection_name = ""
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db[self.collection_name]
+
+    @abstractmethod
+    async def list_items(self, user_id: str, session=None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def add_item(self, user_id: str, product_id: str, quantity: int) -> dict:
+        """Add ``quantity`` to the product's line, creating it if needed; return the line."""
+
+    @abstractmethod
+    async def set_quantity(self, user_id: str, item_id: str, quantity: int) -> Optional[dict]:
+        """Return the updated line, or None if the user has no such line."""
+
+    @abstractmethod
+    async def remove_item(self, user_id: str, item_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def remove_purchased(self, user_id: str, lines: List[dict], session=None) -> None:
+        """Take checked-out ``{"id", "quantity"}`` lines out of the cart.
+
+        A line still holding the quantity that was bought is removed. One that
+        grew since it was read, by an add during checkout, keeps the difference.
+        """
+
+    @abstractmethod
+    async def merge_items(self, user_id: str, quantities: Dict[str, int]) -> Tuple[Dict[str, dict], Set[str]]:
+        """Add several products at once; return ``({product_id: line}, product ids of new lines)``."""
+
+    @abstractmethod
+    def line_stages(self, user_id: str) -> List[dict]:
+        """Aggregation stages that emit the user's cart lines as documents, for ``cart_summary``."""
+
+    @abstractmethod
+    def baskets_since(self, since: datetime, until: datetime) -> AsyncIterator[List[dict]]:
+        """Every cart with a line added in ``(since, until]``, as its ``{"product_id", "created_at"}`` lines."""
+
+    async def stamp_untimed(self, now: datetime) -> int:
+        """Give documents written before ``updated_at`` existed one, so the TTL index can expire them."""
+        result = await self.collection.update_many({"updated_at": {"$exists": False}}, {"$set": {"updated_at": now}})
+        return result.modified_count
+
+    @abstractmethod
+    async def product_ids(self) -> List[str]:
+        """Every product id in any cart."""
+
+    @abstractmethod
+    async def remove_products(self, product_ids: List[str]) -> int:
+        """Remove every line for these products; return the number of lines removed."""
+
+    @abstractmethod
+    async def merge_duplicates(self) -> int:
+        """Fold repeated lines for one product in one cart into the oldest; return the lines folded away."""
+
+    async def drop_empty(self) -> int:
+        """Delete carts with no lines left; return how many."""
+        return 0
+
+    @staticmethod
+    def new_line(product_id: str, quantity: int, now: Optional[datetime] = None) -> dict:
+        return {
+            "id": str(uuid.uuid4()),
+            "product_id": product_id,
+            "quantity": quantity,
+            "created_at": now or datetime.now(timezone.utc),
+        }
+
+
+class RowCartStore(CartStore):
+    name = "rows"
+    collection_name = "cart"
+
+    async def list_items(self, user_id, session=None):
+        return await self.collection.find({"user_id": user_id}, LINE_FIELDS, session=session).to_list(1000)
+
+    async def add_item(self, user_id, product_id, quantity):
+        line = self.new_line(product_id, quantity)
+        # The unique (user_id, product_id) index turns concurrent first adds into one insert and one $inc
+        row = await self.collection.find_one_and_update(
+            {"user_id": user_id, "product_id": product_id},
+            {
+                "$inc": {"quantity": quantity},
+                "$set": {"updated_at": line["created_at"]},
+                "$setOnInsert": {"id": line["id"], "created_at": line["created_at"]},
+            },
+            projection=LINE_FIELDS,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        await self._touch(user_id, line["created_at"])
+        return row
+
+    async def set_quantity(self, user_id, item_id, quantity):
+        now = datetime.now(timezone.utc)
+        row = await self.collection.find_one_and_update(
+            {"id": item_id, "user_id": user_id},
+            {"$set": {"quantity": quantity, "updated_at": now}},
+            projection=LINE_FIELDS,
+            return_document=ReturnDocument.AFTER,
+        )
+        if row is not None:
+            await self._touch(user_id, now)
+        return row
+
+    async def remove_item(self, user_id, item_id):
+        result = await self.collection.delete_one({"id": item_id, "user_id": user_id})
+        if result.deleted_count:
+            await self._touch(user_id, datetime.now(timezone.utc))
+        return result.deleted_count > 0
+
+    async def remove_purchased(self, user_id, lines, session=None):
+        for line in lines:
+            query = {"id": line["id"], "user_id": user_id}
+            for _ in range(MAX_PUSH_ATTEMPTS):
+                result = await self.collection.delete_one(
+                    {**query, "quantity": {"$lte": line["quantity"]}}, session=session
+                )
+                if result.deleted_count:
+                    break
+                result = await self.collection.update_one(
+                    {**query, "quantity": {"$gt": line["quantity"]}},
+                    {"$inc": {"quantity": -line["quantity"]}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+                    session=session,
+                )
+                # Otherwise the line changed between the two updates, or is gone
+                if result.matched_count or not await self.collection.find_one(query, {"_id": 1}, session=session):
+                    break
+        await self._touch(user_id, datetime.now(timezone.utc), session=session)
+
+    async def merge_items(self, user_id, quantities):
+        product_ids = list(quantities)
+        now = datetime.now(timezone.utc)
+        # $inc makes concurrent syncs add up instead of overwriting
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "product_id": product_id},
+                {
+                    "$inc": {"quantity": quantities[product_id]},
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now},
+                },
+                upsert=True,
+            )
+            for product_id in product_ids
+        ]
+        result = await self.collection.bulk_write(operations, ordered=False)
+        await self._touch(user_id, now)
+        added = {product_ids[index] for index in result.upserted_ids}
+        rows = await self.collection.find(
+            {"user_id": user_id, "product_id": {"$in": product_ids}}, LINE_FIELDS
+        ).to_list(None)
+        return {row["product_id"]: row for row in rows}, added
+
+    def line_stages(self, user_id):
+        return [{"$match": {"user_id": user_id}}]
+
+    async def baskets_since(self, since, until):
+        user_ids = await self.collection.distinct("user_id", {"created_at": {"$gt": since, "$lte": until}})
+        for start in range(0, len(user_ids), BASKET_BATCH_SIZE):
+            baskets = defaultdict(list)
+            async for row in self.collection.find(
+                {"user_id": {"$in": user_ids[start:start + BASKET_BATCH_SIZE]}}, BASKET_FIELDS
+            ):
+                baskets[row["user_id"]].append(row)
+            for lines in baskets.values():
+                yield lines
+
+    async def product_ids(self):
+        return await self.collection.distinct("product_id")
+
+    async def remove_products(self, product_ids):
+        result = await self.collection.delete_many({"product_id": {"$in": product_ids}})
+        return result.deleted_count
+
+    async def merge_duplicates(self):
+        # Only possible where the unique index could not be built (see db_indexes.py)
+        groups = self.collection.aggregate([
+            {"$group": {"_id": {"user_id": "$user_id", "product_id": "$product_id"}, "rows": {"$push": "$_id"}}},
+            {"$match": {"rows.1": {"$exists": True}}},
+        ])
+        merged = 0
+        async for group in groups:
+            keeper, *extras = sorted(group["rows"])
+            for row_id in extras:
+                # Deleted before its quantity moves, so two compactions cannot both move it
+                row = await self.collection.find_one_and_delete({"_id": row_id}, {"quantity": 1})
+                if row is None:
+                    continue
+                await self.collection.update_one(
+                    {"_id": keeper},
+                    {"$inc": {"quantity": row["quantity"]}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+                )
+                merged += 1
+        return merged
+
+    async def _touch(self, user_id: str, now: datetime, session=None) -> None:
+        # The TTL index expires rows one by one; a change to any line keeps the whole cart alive
+        await self.collection.update_many({"user_id": user_id}, {"$set": {"updated_at": now}}, session=session)
+
+
+class EmbeddedCartStore(CartStore):
+    name = "embedded"
+    collection_name = "carts"
+
+    async def list_items(self, user_id, session=None):
+        cart = await self.collection.find_one({"_id": user_id}, {"items": 1}, session=session)
+        return cart["items"] if cart else []
+
+    async def add_item(self, user_id, product_id, quantity):
+        projection = {"_id": 0, "items": {"$elemMatch": {"product_id": product_id}}}
+        for _ in range(MAX_PUSH_ATTEMPTS):
+            now = datetime.now(timezone.utc)
+            cart = await self.collection.find_one_and_update(
+                {"_id": user_id, "items.product_id": product_id},
+                {"$inc": {"items.$.quantity": quantity}, "$set": {"updated_at": now}},
+                projection=projection,
+                return_document=ReturnDocument.AFTER,
+            )
+            if cart is not None:
+                return cart["items"][0]
+            line = self.new_line(product_id, quantity, now)
+            try:
+                # The guard makes this a no-op match (and, with upsert, a duplicate _id) if the line exists
+                await self.collection.update_one(
+                    {"_id": user_id, "items.product_id": {"$ne": product_id}},
+                    {"$push": {"items": line}, "$set": {"updated_at": now}},
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                # A concurrent add created the line between our two updates; increment it instead
+                continue
+            return line
+        raise RuntimeError(f"Could not update cart for user {user_id}: too many concurrent writes")
+
+    async def set_quantity(self, user_id, item_id, quantity):
+        cart = await self.collection.find_one_and_update(
+            {"_id": user_id, "items.id": item_id},
+            {"$set": {"items.$.quantity": quantity, "updated_at": datetime.now(timezone.utc)}},
+            projection={"items": {"$elemMatch": {"id": item_id}}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return cart["items"][0] if cart else None
+
+    async def remove_item(self, user_id, item_id):
+        result = await self.collection.update_one(
+            {"_id": user_id, "items.id": item_id},
+            {"$pull": {"items": {"id": item_id}}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        )
+        return result.modified_count > 0
+
+    async def remove_purchased(self, user_id, lines, session=None):
+        for line in lines:
+            bought = {"id": line["id"], "quantity": {"$lte": line["quantity"]}}
+            grown = {"id": line["id"], "quantity": {"$gt": line["quantity"]}}
+            for _ in range(MAX_PUSH_ATTEMPTS):
+                now = datetime.now(timezone.utc)
+                result = await self.collection.update_one(
+                    {"_id": user_id, "items": {"$elemMatch": bought}},
+                    {"$pull": {"items": bought}, "$set": {"updated_at": now}},
+                    session=session,
+                )
+                if result.modified_count:
+                    break
+                result = await self.collection.update_one(
+                    {"_id": user_id, "items": {"$elemMatch": grown}},
+                    {"$inc": {"items.$.quantity": -line["quantity"]}, "$set": {"updated_at": now}},
+                    session=session,
+                )
+                # Otherwise the line changed between the two updates, or is gone
+                if result.modified_count or not await self.collection.find_one(
+                    {"_id": user_id, "items.id": line["id"]}, {"_id": 1}, session=session
+                ):
+                    break
+
+    async def merge_items(self, user_id, quantities):
+        """Increment existing lines with one array-filtered ``$inc``, then push the
+        missing ones with a ``$push`` guarded on none of them being present yet."""
+        pending = dict(quantities)
+        added: Set[str] = set()
+        for _ in range(MAX_PUSH_ATTEMPTS):
+            cart = await self.collection.find_one({"_id": user_id}, {"items.product_id": 1})
+            present = {item["product_id"] for item in cart["items"]} if cart else set()
+            to_increment = [pid for pid in pending if pid in present]
+            to_push = [pid for pid in pending if pid not in present]
+            now = datetime.now(timezone.utc)
+
+            if to_increment:
+                result = await self.collection.update_one(
+                    {"_id": user_id},
+                    {
+                        "$inc": {f"items.$[p{i}].quantity": pending[pid] for i, pid in enumerate(to_increment)},
+                        "$set": {"updated_at": now},
+                    },
+                    array_filters=[{f"p{i}.product_id": pid} for i, pid in enumerate(to_increment)],
+                )
+                if result.modified_count == 0:
+                    # The cart was emptied in between; look again and push instead
+                    continue
+                for pid in to_increment:
+                    del pending[pid]
+            if not to_push:
+                break
+
+            try:
+                result = await self.collection.update_one(
+                    {"_id": user_id, "items.product_id": {"$nin": to_push}},
+                    {
+                        "$push": {"items": {"$each": [self.new_line(pid, pending[pid], now) for pid in to_push]}},
+                        "$set": {"updated_at": now},
+                    },
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                # The cart exists and already has one of these products: the guard missed and the upsert collided
+                continue
+            if result.matched_count or result.upserted_id is not None:
+                added.update(to_push)
+                break
+        else:
+            raise RuntimeError(f"Could not update cart for user {user_id}: too many concurrent writes")
+
+        cart = await self.collection.find_one({"_id": user_id}, {"items": 1})
+        lines = {item["product_id"]: item for item in cart["items"] if item["product_id"] in quantities}
+        return lines, added
+
+    def line_stages(self, user_id):
+        return [
+            {"$match": {"_id": user_id}},
+            {"$unwind": "$items"},
+            {"$replaceRoot": {"newRoot": "$items"}},
+        ]
+
+    async def baskets_since(self, since, until):
+        async for cart in self.collection.find(
+            {"items.created_at": {"$gt": since, "$lte": until}}, {"items.product_id": 1, "items.created_at": 1}
+        ):
+            yield cart["items"]
+
+    async def product_ids(self):
+        return await self.collection.distinct("items.product_id")
+
+    async def remove_products(self, product_ids):
+        query = {"items.product_id": {"$in": product_ids}}
+        # An update only reports carts modified, so count the lines first
+        counted = await self.collection.aggregate([
+            {"$match": query},
+            {"$unwind": "$items"},
+            {"$match": query},
+            {"$count": "lines"},
+        ]).to_list(1)
+        await self.collection.update_many(
+            query,
+            {"$pull": {"items": {"product_id": {"$in": product_ids}}}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        )
+        return counted[0]["lines"] if counted else 0
+
+    async def merge_duplicates(self):
+        # The guarded pushes never create these, but carts written by other tools may hold them
+        carts = self.collection.aggregate([
+            {"$match": {"items.1": {"$exists": True}}},
+            {"$project": {"items": 1, "lines": {"$size": "$items"}, "products": {"$size": {"$setUnion": ["$items.product_id", []]}}}},
+            {"$match": {"$expr": {"$lt": ["$products", "$lines"]}}},
+        ])
+        merged = 0
+        async for cart in carts:
+            lines: Dict[str, dict] = {}
+            for item in cart["items"]:
+                line = lines.get(item["product_id"])
+                if line is None:
+                    lines[item["product_id"]] = dict(item)
+                else:
+                    line["quantity"] += item["quantity"]
+            # Only if nobody changed the cart since it was read; otherwise the next run merges it
+            result = await self.collection.update_one(
+                {"_id": cart["_id"], "items": cart["items"]},
+                {"$set": {"items": list(lines.values()), "updated_at": datetime.now(timezone.utc)}},
+            )
+            if result.modified_count:
+                merged += len(cart["items"]) - len(lines)
+        return merged
+
+    async def drop_empty(self):
+        result = await self.collection.delete_many({"items": {"$size": 0}})
+        return result.deleted_count
+
+
+CART_STORES = {store.name: store for store in (RowCartStore, EmbeddedCartStore)}
+
+
+def cart_store_from_env(db) -> CartStore:
+    name = os.environ.get('CART_STORE', 'rows').lower()
+    if name not in CART_STORES:
+        raise ValueError(f"CART_STORE must be one of {', '.join(CART_STORES)}, not {name!r}")
+    return CART_STORES[name](db)
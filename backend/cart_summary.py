@@ -0,0 +1,172 @@
+"""Cart totals computed on the server, for the navbar badge and order summary.
+
+A summary is built by one aggregation over the user's cart lines, in whichever
+layout the cart store uses. The aggregation joins each line to its product,
+keeps only the name, price and stock, and counts the items. The client never
+has to download full product documents to show a total. Totals use the same
+rounding, shipping and tax rules as checkout.
+
+Summaries are cached per user, in each API process. A product invalidation
+drops the entries of every cart holding that product, so price changes and
+stock moves show up at once. A cart mutation drops the user's entry here and
+writes a new random stamp for the user to the CART_SUMMARY_BACKEND state (see
+shared_state.py). Every lookup reads the stamp and only serves an entry built
+under the same one, so a mutation handled by another process is seen at once
+too. A stamp lives as long as a summary, so stamps expire instead of piling up.
+"""
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Set
+
+from orders import order_totals
+from shared_state import state_for
+
+logger = logging.getLogger(__name__)
+
+# Never equal to a stored stamp: what a lookup compares against when the state backend fails
+UNKNOWN_STAMP = object()
+
+
+def summary_pipeline(carts, user_id: str) -> list:
+    return carts.line_stages(user_id) + [
+        {"$match": {"quantity": {"$gt": 0}}},
+        {"$lookup": {"from": "products", "localField": "product_id", "foreignField": "id", "as": "product"}},
+        # Rows whose product was deleted, or soft-deleted, drop out here, as they do in GET /api/cart
+        {"$unwind": "$product"},
+        {"$match": {"product.deleted_at": None}},
+        {"$project": {
+            "_id": 0,
+            "cart_item_id": "$id",
+            "product_id": 1,
+            "quantity": 1,
+            "name": "$product.name",
+            "price": "$product.price",
+            "stock": "$product.stock",
+        }},
+        {"$group": {"_id": None, "lines": {"$push": "$$ROOT"}, "item_count": {"$sum": "$quantity"}}},
+    ]
+
+
+async def load_cart_summary(carts, user_id: str) -> dict:
+    result = await carts.collection.aggregate(summary_pipeline(carts, user_id)).to_list(1)
+    lines = result[0]["lines"] if result else []
+    warnings = []
+    for line in lines:
+        line["line_total"] = round(line["price"] * line["quantity"], 2)
+        if line["quantity"] > line["stock"]:
+            warnings.append({
+                "product_id": line["product_id"],
+                "requested": line["quantity"],
+                "available": max(line["stock"], 0),
+            })
+    if lines:
+        totals = order_totals(line["line_total"] for line in lines)
+    else:
+        totals = {"subtotal": 0.0, "shipping": 0.0, "tax": 0.0, "total": 0.0}
+    return {
+        "item_count": result[0]["item_count"] if result else 0,
+        "lines": lines,
+        **totals,
+        "stock_warnings": warnings,
+    }
+
+
+class CartSummaryCache:
+    def __init__(self, ttl_seconds: float = 10.0, max_entries: int = 10_000, shared=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Holds the per-user cart stamps; None leaves other processes' mutations to the TTL
+        self.shared = shared
+        # user_id -> (expires_at, cart stamp, summary), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # product_id -> users whose cached summary contains it
+        self._users_by_product: Dict[str, Set[str]] = defaultdict(set)
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, shared=None) -> "CartSummaryCache":
+        return cls(
+            ttl_seconds=float(os.environ.get('CART_SUMMARY_TTL_SECONDS', 10)),
+            max_entries=int(os.environ.get('CART_SUMMARY_MAX_ENTRIES', 10_000)),
+            shared=state_for('CART_SUMMARY_BACKEND', shared),
+        )
+
+    async def get(self, carts, user_id: str) -> dict:
+        stamp = await self._stamp(user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic() and entry[1] == stamp:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        generation = self._generation
+        summary = await load_cart_summary(carts, user_id)
+        # An invalidation landed while we were loading; the summary may already be stale.
+        # One in another process changed the stamp, so the next lookup misses anyway.
+        if generation == self._generation and stamp is not UNKNOWN_STAMP:
+            self._put(user_id, stamp, summary)
+        return summary
+
+    async def invalidate(self, user_id: str) -> None:
+        """Cart mutation hook: drop the user's summary in this process and every other one."""
+        self._generation += 1
+        self._discard(user_id)
+        if self.shared is None or self.ttl_seconds <= 0:
+            return
+        try:
+            await self.shared.set(_stamp_key(user_id), uuid.uuid4().bytes, self.ttl_seconds)
+        except Exception:
+            logger.exception("Could not update the cart stamp; other processes keep the old summary until it expires")
+
+    def invalidate_product(self, product_id: Optional[str]) -> None:
+        """Product invalidation hook: ``None`` means the whole catalog changed."""
+        self._generation += 1
+        if product_id is None:
+            self._entries.clear()
+            self._users_by_product.clear()
+            return
+        for user_id in list(self._users_by_product.get(product_id, ())):
+            self._discard(user_id)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    async def _stamp(self, user_id: str):
+        if self.shared is None:
+            return None
+        try:
+            return await self.shared.get(_stamp_key(user_id))
+        except Exception:
+            # A state outage degrades to uncached summaries, never to errors
+            logger.exception("Cart stamp read failed")
+            return UNKNOWN_STAMP
+
+    def _put(self, user_id: str, stamp: Optional[bytes], summary: dict) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._discard(user_id)
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, stamp, summary)
+        for line in summary["lines"]:
+            self._users_by_product[line["product_id"]].add(user_id)
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, user_id: str) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        for line in entry[2]["lines"]:
+            users = self._users_by_product.get(line["product_id"])
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._users_by_product[line["product_id"]]
+
+
+def _stamp_key(user_id: str) -> str:
+    return f"cart_summary:stamp:{user_id}"
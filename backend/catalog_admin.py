@@ -0,0 +1,139 @@
+"""Product writes behind the admin API: create, patch, bulk patch and soft delete.
+
+Every write increments the product's ``version`` and sets ``updated_at``.
+Patches and deletes name the version they were based on and only apply if
+the product still has it (optimistic concurrency). A write based on a stale
+read gets ``VersionConflict`` with the current version, so two admins editing
+one product cannot silently overwrite each other. Products written before
+versioning have no ``version`` field; they count as version 0.
+
+Deletes are soft: the document stays, with ``deleted_at`` set, so orders and
+carts that reference it keep working. Every read path filters with ``ACTIVE``.
+
+Bulk patches go through ``bulk_write`` in batches of ``batch_size``
+unordered updates. A bulk write only reports counts, so every update also
+stamps the request's ``last_write_id``. One read after each batch then sorts
+its items into updated, conflicting and missing.
+
+These functions only touch ``products``. Bumping the catalog version and
+invalidating caches is the caller's job, once per request (see server.py).
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from errors import ApiError
+
+ACTIVE = {"deleted_at": None}
+VERSION_FIELDS = {"_id": 0, "id": 1, "version": 1, "last_write_id": 1}
+
+
+class CatalogWriteError(ApiError):
+    pass
+
+
+class ProductNotFound(CatalogWriteError):
+    status_code = 404
+
+
+class VersionConflict(CatalogWriteError):
+    status_code = 409
+
+
+class DuplicateProduct(CatalogWriteError):
+    status_code = 409
+
+
+def version_filter(version: int) -> dict:
+    # Version 0 also matches products that predate the field
+    return {"version": {"$in": [0, None]}} if version == 0 else {"version": version}
+
+
+def versioned_update(changes: dict, now: datetime) -> dict:
+    return {"$set": {**changes, "updated_at": now}, "$inc": {"version": 1}}
+
+
+async def create_product(db, document: dict) -> dict:
+    """Insert a new product at version 1; return it as stored, without ``_id``."""
+    document = {**document, "version": 1, "updated_at": datetime.now(timezone.utc)}
+    try:
+        await db.products.insert_one(dict(document))
+    except DuplicateKeyError:
+        raise DuplicateProduct(f"Product {document['id']} already exists")
+    return document
+
+
+async def patch_product(db, product_id: str, version: int, changes: dict, projection: dict) -> dict:
+    """Apply ``changes`` if the product is still at ``version``; return the updated product."""
+    product = await db.products.find_one_and_update(
+        {"id": product_id, **version_filter(version), **ACTIVE},
+        versioned_update(changes, datetime.now(timezone.utc)),
+        projection=projection,
+        return_document=ReturnDocument.AFTER,
+    )
+    if product is None:
+        await _raise_for_missed_write(db, product_id)
+    return product
+
+
+async def delete_product(db, product_id: str, version: Optional[int] = None) -> None:
+    """Soft-delete a product; with ``version``, only if it is still at that version."""
+    now = datetime.now(timezone.utc)
+    query = {"id": product_id, **ACTIVE}
+    if version is not None:
+        query.update(version_filter(version))
+    product = await db.products.find_one_and_update(
+        query, {"$set": {"deleted_at": now, "updated_at": now}, "$inc": {"version": 1}}, projection=VERSION_FIELDS
+    )
+    if product is None:
+        await _raise_for_missed_write(db, product_id)
+
+
+async def bulk_patch(db, patches: List[Tuple[str, int, dict]], batch_size: int = 500) -> Dict[str, list]:
+    """Apply ``(product_id, version, changes)`` patches; return the ids updated, in conflict and missing.
+
+    A product bulk-patched again by another request between a batch and its
+    read back is reported as a conflict even though this patch applied; the
+    caller re-reads it either way.
+    """
+    now = datetime.now(timezone.utc)
+    write_id = str(uuid.uuid4())
+    result = {"updated": [], "conflicts": [], "not_found": []}
+    for start in range(0, len(patches), batch_size):
+        batch = patches[start:start + batch_size]
+        await db.products.bulk_write(
+            [
+                UpdateOne(
+                    {"id": product_id, **version_filter(version), **ACTIVE},
+                    versioned_update({**changes, "last_write_id": write_id}, now),
+                )
+                for product_id, version, changes in batch
+            ],
+            ordered=False,
+        )
+        current = await db.products.find(
+            {"id": {"$in": [product_id for product_id, _, _ in batch]}, **ACTIVE}, VERSION_FIELDS
+        ).to_list(None)
+        found = {doc["id"]: doc for doc in current}
+        for product_id, _, _ in batch:
+            doc = found.get(product_id)
+            if doc is None:
+                result["not_found"].append(product_id)
+            elif doc.get("last_write_id") == write_id:
+                result["updated"].append(product_id)
+            else:
+                result["conflicts"].append({"id": product_id, "current_version": doc.get("version", 0)})
+    return result
+
+
+async def _raise_for_missed_write(db, product_id: str) -> None:
+    current = await db.products.find_one({"id": product_id, **ACTIVE}, VERSION_FIELDS)
+    if current is None:
+        raise ProductNotFound("Product not found")
+    raise VersionConflict({
+        "message": "Product was changed by another write; re-read it and retry",
+        "current_version": current.get("version", 0),
+    })
@@ -0,0 +1,278 @@
+"""Follow writes to ``products`` made outside this process, and push stock changes to browsers.
+
+``CatalogWatcher`` runs as a background task started in the API lifespan and
+turns every product write, whoever made it, into a ``ProductChange`` for the
+in-process caches. It has two ways to learn about writes:
+
+* ``change_stream`` - tails a MongoDB change stream on ``products``. Needs a
+  replica set or sharded cluster. Changes arrive within milliseconds. After a
+  dropped connection the stream resumes from the last token. If the token has
+  aged out of the oplog, the watcher reports a whole-catalog change and starts
+  over.
+* ``poll`` - for standalone servers. Every ``poll_interval`` seconds it reads
+  products whose ``updated_at`` is past a watermark. Writers that want to be
+  seen must set ``updated_at``; checkout and the catalog import do. Deleted
+  products are not visible to a poll, so writers that delete still bump the
+  catalog version (see product_cache.py). A poll only sees documents, not what
+  was written, so the watcher keeps a fingerprint of each polled product's
+  fields other than stock. A product whose fingerprint is unchanged is reported
+  as a stock-only change, like a checkout in change stream mode. The first poll
+  of a product, and one after a whole-catalog change, reports all its fields.
+
+CATALOG_WATCH=auto (the default) picks ``change_stream`` when the deployment
+supports it and ``poll`` otherwise; ``off`` disables the watcher.
+
+``StockEvents`` fans stock changes out to Server-Sent Events subscribers, one
+small queue per open product page. A subscriber only ever needs the latest
+figure, so a slow client's queue keeps the newest value and drops the rest.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, FrozenSet, NamedTuple, Optional, Set
+
+import orjson
+from pymongo.errors import OperationFailure, PyMongoError
+
+from mongo_pool import is_replicated
+from periodic import PeriodicTask, cancel
+
+logger = logging.getLogger(__name__)
+
+# Change stream events that say nothing about single products: the collection is gone or replaced
+CATALOG_WIDE_EVENTS = {"drop", "rename", "dropDatabase", "invalidate"}
+CHANGE_STREAM_HISTORY_LOST = 286
+WATCHED_FIELDS = {"_id": 0, "id": 1, "stock": 1, "updated_at": 1}
+# What a stock move writes; a change to nothing else keeps cached lists
+STOCK_FIELDS = frozenset({"stock", "updated_at"})
+
+
+class ProductChange(NamedTuple):
+    product_id: Optional[str]  # None: anything in the catalog may have changed
+    stock: Optional[int] = None  # new stock, when the change carries it
+    fields: Optional[FrozenSet[str]] = None  # fields written, when known; None means any
+
+    @property
+    def stock_only(self) -> bool:
+        return self.fields is not None and self.fields <= STOCK_FIELDS
+
+
+class CatalogWatcher:
+    def __init__(
+        self,
+        collection,
+        on_change: Callable[[ProductChange], None],
+        mode: str = "auto",
+        poll_interval: float = 2.0,
+        retry_interval: float = 5.0,
+        batch_size: int = 1000,
+        max_fingerprints: int = 100_000,
+    ):
+        if mode not in ("auto", "change_stream", "poll", "off"):
+            raise ValueError(f"CATALOG_WATCH must be auto, change_stream, poll or off, not {mode!r}")
+        self.collection = collection
+        self.on_change = on_change
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.batch_size = batch_size
+        self.max_fingerprints = max_fingerprints
+        self._stream_task: Optional[asyncio.Task] = None
+        self._poll = PeriodicTask("Catalog poll", self.poll, poll_interval)
+        self._resume_token = None
+        self._watermark: Optional[datetime] = None
+        # product id -> updated_at already reported, for documents still inside the poll overlap
+        self._seen: Dict[str, datetime] = {}
+        # product id -> hash of its non-stock fields at the last poll, least recently polled first
+        self._fingerprints: "OrderedDict[str, int]" = OrderedDict()
+
+        self.changes = 0
+        self.stream_errors = 0
+
+    @classmethod
+    def from_env(cls, collection, on_change: Callable[[ProductChange], None]) -> "CatalogWatcher":
+        return cls(
+            collection,
+            on_change,
+            mode=os.environ.get('CATALOG_WATCH', 'auto').lower(),
+            poll_interval=float(os.environ.get('CATALOG_WATCH_POLL_SECONDS', 2)),
+        )
+
+    @property
+    def errors(self) -> int:
+        return self.stream_errors + self._poll.errors
+
+    async def start(self) -> None:
+        if self.mode == "auto":
+            self.mode = "change_stream" if await is_replicated(self.collection.database.client) else "poll"
+        if self.mode == "off":
+            return
+        if self.mode == "poll":
+            self._watermark = await self._latest_update()
+            self._poll.start()
+        else:
+            self._stream_task = asyncio.create_task(self._follow_stream(), name="catalog-watch")
+        logger.info("Watching the product catalog by %s", self.mode.replace("_", " "))
+
+    async def stop(self) -> None:
+        await cancel(self._stream_task)
+        self._stream_task = None
+        await self._poll.stop()
+
+    # ---------- change stream ----------
+
+    async def _follow_stream(self) -> None:
+        while True:
+            try:
+                async with self.collection.watch(
+                    full_document="updateLookup", resume_after=self._resume_token
+                ) as stream:
+                    async for event in stream:
+                        # A stream resumed after an invalidate would be invalidated again
+                        self._resume_token = stream.resume_token if event["operationType"] != "invalidate" else None
+                        self._apply_event(event)
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_HISTORY_LOST:
+                    # Writes between the last token and now are unknown
+                    logger.warning("Catalog change stream history lost; invalidating the whole catalog")
+                    self._resume_token = None
+                    self._emit(ProductChange(None))
+                    continue
+                self.stream_errors += 1
+                logger.exception("Catalog change stream failed; resuming in %.0fs", self.retry_interval)
+                await asyncio.sleep(self.retry_interval)
+
+    def _apply_event(self, event: dict) -> None:
+        operation = event["operationType"]
+        if operation in CATALOG_WIDE_EVENTS:
+            self._emit(ProductChange(None))
+            return
+        document = event.get("fullDocument") or {}
+        if operation == "delete" or not document.get("id"):
+            # A delete only carries _id, and the caches are keyed by the product id
+            self._emit(ProductChange(None))
+            return
+        fields = None
+        if operation == "update":
+            description = event.get("updateDescription", {})
+            fields = frozenset(description.get("updatedFields", {})) | frozenset(description.get("removedFields", []))
+        self._emit(ProductChange(document["id"], document.get("stock"), fields))
+
+    # ---------- polling ----------
+
+    async def poll(self) -> None:
+        """Report products written since the last poll."""
+        # Overlap the window so writers with a lagging clock, or slow to commit, are not missed
+        since = self._watermark - timedelta(seconds=self.poll_interval)
+        docs = await self.collection.find(
+            {"updated_at": {"$gt": since}}, {"_id": 0}
+        ).sort("updated_at", 1).to_list(self.batch_size)
+        if len(docs) >= self.batch_size:
+            # A bulk write (an import); reloading everything is cheaper than reporting it product by product
+            self._watermark = await self._latest_update()
+            self._seen.clear()
+            self._fingerprints.clear()
+            self._emit(ProductChange(None))
+            return
+        for doc in docs:
+            updated_at = doc["updated_at"]
+            if self._seen.get(doc["id"]) != updated_at:
+                self._seen[doc["id"]] = updated_at
+                self._emit(ProductChange(doc["id"], doc.get("stock"), self._fields_changed(doc)))
+            self._watermark = max(self._watermark, updated_at)
+        for product_id in [p for p, seen in self._seen.items() if seen <= since]:
+            del self._seen[product_id]
+
+    def _fields_changed(self, doc: dict) -> Optional[FrozenSet[str]]:
+        """``STOCK_FIELDS`` if nothing else changed since the product's last poll; None if unknown."""
+        fingerprint = hash(orjson.dumps(
+            {field: value for field, value in doc.items() if field not in STOCK_FIELDS},
+            option=orjson.OPT_SORT_KEYS, default=str,
+        ))
+        previous = self._fingerprints.pop(doc["id"], None)
+        self._fingerprints[doc["id"]] = fingerprint
+        if len(self._fingerprints) > self.max_fingerprints:
+            self._fingerprints.popitem(last=False)
+        return STOCK_FIELDS if previous == fingerprint else None
+
+    async def _latest_update(self) -> datetime:
+        doc = await self.collection.find_one(
+            {"updated_at": {"$exists": True}}, WATCHED_FIELDS, sort=[("updated_at", -1)]
+        )
+        return doc["updated_at"] if doc else datetime.now(timezone.utc)
+
+    def _emit(self, change: ProductChange) -> None:
+        self.changes += 1
+        try:
+            self.on_change(change)
+        except Exception:
+            logger.exception("Applying a catalog change failed")
+
+
+class StockEvents:
+    def __init__(self, max_subscribers: int = 1000, heartbeat_interval: float = 15.0):
+        self.max_subscribers = max_subscribers
+        self.heartbeat_interval = heartbeat_interval
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.subscribers = 0
+        self.published = 0
+
+    @classmethod
+    def from_env(cls) -> "StockEvents":
+        return cls(
+            max_subscribers=int(os.environ.get('STOCK_EVENTS_MAX_SUBSCRIBERS', 1000)),
+            heartbeat_interval=float(os.environ.get('STOCK_EVENTS_HEARTBEAT_SECONDS', 15)),
+        )
+
+    @property
+    def full(self) -> bool:
+        return self.subscribers >= self.max_subscribers
+
+    def subscribe(self, product_id: str) -> asyncio.Queue:
+        """A queue that receives the product's new stock figures."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(product_id, set()).add(queue)
+        self.subscribers += 1
+        return queue
+
+    def unsubscribe(self, product_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(product_id)
+        if queues is None or queue not in queues:
+            return
+        queues.discard(queue)
+        self.subscribers -= 1
+        if not queues:
+            del self._subscribers[product_id]
+
+    def publish(self, product_id: str, stock: int) -> None:
+        for queue in self._subscribers.get(product_id, ()):
+            if queue.full():
+                # Only the latest figure matters to a product page
+                queue.get_nowait()
+            queue.put_nowait(stock)
+            self.published += 1
+
+    async def stream(self, product_id: str, stock: int) -> AsyncIterator[bytes]:
+        """SSE frames for one subscriber: the current stock, then every change, with heartbeats."""
+        # Subscribed only once the response starts, so a stream never sent never holds a slot
+        queue = self.subscribe(product_id)
+        try:
+            yield b"retry: 3000\n" + _stock_frame(product_id, stock)
+            while True:
+                try:
+                    new_stock = await asyncio.wait_for(queue.get(), self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield b": keep-alive\n\n"
+                    continue
+                if new_stock != stock:
+                    stock = new_stock
+                    yield _stock_frame(product_id, stock)
+        finally:
+            self.unsubscribe(product_id, queue)
+
+
+def _stock_frame(product_id: str, stock: int) -> bytes:
+    return b"event: stock\ndata: " + orjson.dumps({"product_id": product_id, "stock": stock}) + b"\n\n"
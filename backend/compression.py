@@ -0,0 +1,207 @@
+"""gzip/brotli response compression negotiated from ``Accept-Encoding``.
+
+``CompressionMiddleware`` compresses complete JSON and text responses once
+they reach a size threshold. Smaller bodies cost more CPU to compress than
+they save on the wire, so they go out as they are. Brotli is preferred when
+the client accepts it and the ``brotli`` package is installed; gzip is the
+fallback.
+
+Levels are set per route through ``CompressionPolicy``. Catalog responses are
+stored in the HTTP response cache after compression (see http_cache.py), so
+they are compressed once per cache entry and can afford a higher level than
+per-user cart responses, which are compressed on every request.
+
+Streaming responses (several body messages) are passed through untouched, so
+event streams are never buffered. A compressed response gets a weak ETag:
+its bytes differ from the identity encoding, but it carries the same data.
+"""
+import gzip
+import os
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = (b"application/json", b"text/", b"application/javascript")
+
+
+class CompressionPolicy(NamedTuple):
+    min_size: int = 1024
+    gzip_level: int = 6
+    brotli_level: int = 4
+
+
+def parse_accept_encoding(header: bytes) -> dict:
+    """``{coding: q}`` for each coding listed in an Accept-Encoding header."""
+    accepted = {}
+    for part in header.decode("latin-1").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip()] = q
+    return accepted
+
+
+class ResponseCompressor:
+    """Policies and counters shared by the middleware, the response cache and metrics."""
+
+    def __init__(
+        self,
+        default: CompressionPolicy = CompressionPolicy(),
+        routes: Sequence[Tuple[Pattern, CompressionPolicy]] = (),
+        enabled: bool = True,
+    ):
+        self.default = default
+        self.routes = list(routes)
+        self.enabled = enabled
+        self.encodings = (("br",) if brotli is not None else ()) + ("gzip",)
+
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    @classmethod
+    def from_env(cls, routes: Optional[Dict[str, Tuple[str, CompressionPolicy]]] = None) -> "ResponseCompressor":
+        """``routes`` maps a name to ``(path regex, default policy)``; the first match wins.
+
+        COMPRESSION_GZIP_LEVEL and COMPRESSION_BROTLI_LEVEL set the levels for
+        other paths, and COMPRESSION_<NAME>_GZIP_LEVEL and
+        COMPRESSION_<NAME>_BROTLI_LEVEL override a named route's.
+        """
+        min_size = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+        rules = []
+        for name, (pattern, policy) in (routes or {}).items():
+            prefix = f"COMPRESSION_{name.upper()}"
+            rules.append((re.compile(pattern), CompressionPolicy(
+                min_size=min_size,
+                gzip_level=int(os.environ.get(f'{prefix}_GZIP_LEVEL', policy.gzip_level)),
+                brotli_level=int(os.environ.get(f'{prefix}_BROTLI_LEVEL', policy.brotli_level)),
+            )))
+        return cls(
+            default=CompressionPolicy(
+                min_size=min_size,
+                gzip_level=int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6)),
+                brotli_level=int(os.environ.get('COMPRESSION_BROTLI_LEVEL', 4)),
+            ),
+            routes=rules,
+            enabled=os.environ.get('COMPRESSION', 'on').lower() != 'off',
+        )
+
+    @property
+    def variants(self) -> Tuple[str, ...]:
+        """Every value ``negotiate`` can return, for caches keyed by it."""
+        return ("",) + self.encodings if self.enabled else ("",)
+
+    def policy_for(self, path: str) -> CompressionPolicy:
+        for pattern, policy in self.routes:
+            if pattern.match(path):
+                return policy
+        return self.default
+
+    def negotiate(self, headers: dict) -> str:
+        """The coding to use for a request's raw ASGI headers, or ``""`` for identity."""
+        if not self.enabled:
+            return ""
+        header = headers.get(b"accept-encoding")
+        if not header:
+            return ""
+        accepted = parse_accept_encoding(header)
+        wildcard = accepted.get("*", 0.0)
+        best, best_q = "", 0.0
+        # Ties keep the earlier, preferred coding
+        for coding in self.encodings:
+            q = accepted.get(coding, wildcard)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, body: bytes, encoding: str, policy: CompressionPolicy) -> bytes:
+        start = time.perf_counter()
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=policy.brotli_level)
+        else:
+            compressed = gzip.compress(body, compresslevel=policy.gzip_level, mtime=0)
+        self.seconds += time.perf_counter() - start
+        self.compressed += 1
+        self.bytes_in += len(body)
+        self.bytes_out += len(compressed)
+        return compressed
+
+
+def weak_etag(etag: bytes) -> bytes:
+    return etag if etag.startswith(b"W/") else b"W/" + etag
+
+
+class CompressionMiddleware:
+    def __init__(self, app, compressor: ResponseCompressor):
+        self.app = app
+        self.compressor = compressor
+
+    async def __call__(self, scope, receive, send):
+        compressor = self.compressor
+        if scope["type"] != "http" or not compressor.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = compressor.negotiate(dict(scope["headers"]))
+        policy = compressor.policy_for(scope["path"])
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether it is worth compressing
+                start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            vary = [value for name, value in start["headers"] if name.lower() == b"vary"]
+            headers: List[Tuple[bytes, bytes]] = [(b"vary", b", ".join(vary + [b"Accept-Encoding"]))]
+            headers += [(name, value) for name, value in start["headers"] if name.lower() != b"vary"]
+            body = message.get("body", b"")
+            if encoding and self._should_compress(start, headers, message, policy):
+                body = compressor.compress(body, encoding, policy)
+                headers = [
+                    (name, weak_etag(value) if name.lower() == b"etag" else value)
+                    for name, value in headers
+                    if name.lower() != b"content-length"
+                ]
+                headers += [(b"content-encoding", encoding.encode()), (b"content-length", str(len(body)).encode())]
+                message = {**message, "body": body}
+            elif encoding and start["status"] == 304:
+                # Same validator the compressed 200 would have carried
+                headers = [(name, weak_etag(value) if name.lower() == b"etag" else value) for name, value in headers]
+            await send({**start, "headers": headers})
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _should_compress(start, headers, message, policy: CompressionPolicy) -> bool:
+        if message.get("more_body", False) or len(message.get("body", b"")) < policy.min_size:
+            return False
+        if start["status"] < 200 or start["status"] in (204, 304):
+            return False
+        content_type = b""
+        for name, value in headers:
+            name = name.lower()
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value.lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
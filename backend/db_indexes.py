@@ -0,0 +1,257 @@
+"""Create the MongoDB indexes the API relies on and verify hot queries use them.
+
+Runs automatically from the API lifespan, and can be run by hand:
+
+    python db_indexes.py            # create indexes, warn about COLLSCAN plans
+    python db_indexes.py --strict   # exit non-zero if any hot query still scans
+
+INDEX_PLAN_CHECK controls what the API does at startup: ``strict`` refuses to
+start on a COLLSCAN plan, ``warn`` (the default) logs it, ``off`` skips the
+explain step entirely. Index creation is idempotent in every mode.
+
+Carts also get a TTL index on ``updated_at`` unless CART_TTL_DAYS is 0. A
+changed CART_TTL_DAYS is applied to the existing index with ``collMod``, and
+setting it to 0 drops the index, so carts stop expiring.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from cart_store import cart_ttl_seconds
+from catalog_admin import ACTIVE
+
+ROOT_DIR = Path(__file__).parent
+logger = logging.getLogger(__name__)
+
+# collection -> list of (keys, options)
+REQUIRED_INDEXES = {
+    "users": [
+        ([("email", ASCENDING)], {"unique": True, "name": "email_unique"}),
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+    ],
+    "products": [
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+        ([("category", ASCENDING)], {"name": "category"}),
+        # Keyset pagination order for GET /api/products, with and without a category filter
+        ([("name", ASCENDING), ("id", ASCENDING)], {"name": "name_id"}),
+        ([("category", ASCENDING), ("name", ASCENDING), ("id", ASCENDING)], {"name": "category_name_id"}),
+        # Watermark of the catalog watcher's poll on standalone servers
+        ([("updated_at", ASCENDING)], {"name": "updated_at"}),
+    ],
+    "cart": [
+        ([("user_id", ASCENDING), ("product_id", ASCENDING)], {"unique": True, "name": "user_product_unique"}),
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+        # New cart lines since the recommendation job's last run
+        ([("created_at", ASCENDING)], {"name": "created_at"}),
+    ],
+    "carts": [
+        ([("items.created_at", ASCENDING)], {"name": "items_created_at"}),
+    ],
+    "orders": [
+        # Claims the Idempotency-Key of POST /api/orders
+        ([("user_id", ASCENDING), ("idempotency_key", ASCENDING)], {"unique": True, "name": "user_idempotency_key_unique"}),
+        ([("id", ASCENDING)], {"unique": True, "name": "id_unique"}),
+        ([("user_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)], {"name": "user_status_created_at"}),
+        ([("created_at", ASCENDING)], {"name": "created_at"}),
+    ],
+    # Read and written by the recommendation job (see recommendations.py)
+    "product_pairs": [
+        ([("product_id", ASCENDING), ("related_id", ASCENDING)], {"unique": True, "name": "product_related_unique"}),
+    ],
+    "token_revocations": [
+        ([("created_at", ASCENDING)], {"name": "created_at"}),
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0, "name": "expires_at_ttl"}),
+    ],
+}
+
+INDEX_NOT_FOUND = 27
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+CART_TTL_INDEX = "updated_at_ttl"
+CART_COLLECTIONS = ("cart", "carts")
+
+
+def required_indexes():
+    """``REQUIRED_INDEXES`` plus the cart TTL indexes CART_TTL_DAYS asks for."""
+    ttl = cart_ttl_seconds()
+    if ttl <= 0:
+        return REQUIRED_INDEXES
+    expiry = ([("updated_at", ASCENDING)], {"expireAfterSeconds": ttl, "name": CART_TTL_INDEX})
+    return {
+        **REQUIRED_INDEXES,
+        **{collection: REQUIRED_INDEXES[collection] + [expiry] for collection in CART_COLLECTIONS},
+    }
+
+
+PRODUCT_PAGE_SORT = [("name", ASCENDING), ("id", ASCENDING)]
+_AFTER_CURSOR = {"$or": [{"name": {"$gt": "name"}}, {"name": "name", "id": {"$gt": "product-id"}}]}
+
+# (collection, filter, sort) issued on every request; values are placeholders
+HOT_QUERIES = [
+    ("users", {"email": "user@example.com"}, None),
+    ("users", {"id": "user-id"}, None),
+    # Product reads skip soft-deleted products; the few there are get filtered out after the index
+    ("products", {"id": "product-id", **ACTIVE}, None),
+    ("products", {"id": {"$in": ["product-id-1", "product-id-2"]}, **ACTIVE}, None),
+    ("products", ACTIVE, PRODUCT_PAGE_SORT),
+    ("products", {**_AFTER_CURSOR, **ACTIVE}, PRODUCT_PAGE_SORT),
+    ("products", {"category": "Electronics", **ACTIVE}, PRODUCT_PAGE_SORT),
+    ("products", {"category": "Electronics", **_AFTER_CURSOR, **ACTIVE}, PRODUCT_PAGE_SORT),
+    ("products", {"updated_at": {"$gt": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, [("updated_at", ASCENDING)]),
+    ("cart", {"user_id": "user-id"}, None),
+    ("cart", {"user_id": "user-id", "product_id": "product-id"}, None),
+    ("cart", {"id": "cart-id", "user_id": "user-id"}, None),
+    ("orders", {"user_id": "user-id", "idempotency_key": "key"}, None),
+    ("orders", {"user_id": "user-id", "status": "placed"}, [("created_at", DESCENDING)]),
+    ("orders", {"id": "order-id", "user_id": "user-id", "status": "placed"}, None),
+    ("token_revocations", {"created_at": {"$gt": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, None),
+]
+
+
+async def ensure_indexes(db):
+    """Create every required index; safe to call on each startup."""
+    created = []
+    for collection, indexes in required_indexes().items():
+        for keys, options in indexes:
+            try:
+                created.append(await db[collection].create_index(keys, **options))
+            except DuplicateKeyError:
+                if not options.get("unique"):
+                    raise
+                # Existing duplicates block the unique index; keep lookups indexed anyway
+                logger.error(
+                    "Duplicate values in %s %s; creating a non-unique index instead",
+                    collection, [k for k, _ in keys],
+                )
+                fallback = {**options, "unique": False, "name": f"{options['name']}_nonunique"}
+                created.append(await db[collection].create_index(keys, **fallback))
+            except OperationFailure as e:
+                if e.code == INDEX_OPTIONS_CONFLICT and "expireAfterSeconds" in options:
+                    # The TTL changed; collMod updates it in place instead of rebuilding the index
+                    await db.command({
+                        "collMod": collection,
+                        "index": {"keyPattern": dict(keys), "expireAfterSeconds": options["expireAfterSeconds"]},
+                    })
+                    logger.info("Set %s %s TTL to %ss", collection, options["name"], options["expireAfterSeconds"])
+                    created.append(options["name"])
+                    continue
+                # IndexOptionsConflict / IndexKeySpecsConflict: an equivalent index exists under another name
+                if e.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+                    raise
+                logger.info("Keeping existing index on %s %s: %s", collection, [k for k, _ in keys], e)
+    if cart_ttl_seconds() <= 0:
+        await drop_cart_ttl_indexes(db)
+    return created
+
+
+async def drop_cart_ttl_indexes(db) -> list:
+    """Drop the cart TTL indexes left from a CART_TTL_DAYS above 0; return the collections changed."""
+    dropped = []
+    for collection in CART_COLLECTIONS:
+        if CART_TTL_INDEX not in await db[collection].index_information():
+            continue
+        try:
+            await db[collection].drop_index(CART_TTL_INDEX)
+        except OperationFailure as e:
+            # Another API worker dropped it first
+            if e.code != INDEX_NOT_FOUND:
+                raise
+            continue
+        logger.info("Dropped %s %s; CART_TTL_DAYS is 0, so carts no longer expire", collection, CART_TTL_INDEX)
+        dropped.append(collection)
+    return dropped
+
+
+async def restore_unique_indexes(db, collection: str) -> list:
+    """Swap non-unique fallbacks made by ``ensure_indexes`` for the unique index, once no duplicates remain.
+
+    Returns the names of the unique indexes restored. The fallback is dropped
+    first, so lookups go unindexed while the unique index builds; if new
+    duplicates appeared meanwhile, the fallback is built again.
+    """
+    existing = await db[collection].index_information()
+    restored = []
+    for keys, options in REQUIRED_INDEXES[collection]:
+        fallback = f"{options['name']}_nonunique"
+        if not options.get("unique") or fallback not in existing:
+            continue
+        await db[collection].drop_index(fallback)
+        try:
+            restored.append(await db[collection].create_index(keys, **options))
+        except DuplicateKeyError:
+            await db[collection].create_index(keys, **{**options, "unique": False, "name": fallback})
+    return restored
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+async def find_collection_scans(db):
+    """Return the hot queries whose winning plan still contains a COLLSCAN."""
+    scans = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in set(_plan_stages(winning_plan)):
+            scans.append((collection, query))
+    return scans
+
+
+async def bootstrap_indexes(db, mode: str = "warn"):
+    """Ensure indexes, then check query plans according to ``mode``."""
+    await ensure_indexes(db)
+    if mode == "off":
+        return []
+
+    scans = await find_collection_scans(db)
+    for collection, query in scans:
+        logger.warning("Query on %s plans a COLLSCAN: %s", collection, query)
+    if scans and mode == "strict":
+        raise RuntimeError(f"{len(scans)} hot queries plan a COLLSCAN; refusing to start")
+    return scans
+
+
+async def main(strict: bool):
+    load_dotenv(ROOT_DIR / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        names = await ensure_indexes(db)
+        print(f"Ensured {len(names)} indexes")
+        scans = await find_collection_scans(db)
+        for collection, query in scans:
+            print(f"  COLLSCAN on {collection}: {query}")
+        if not scans:
+            print(f"All {len(HOT_QUERIES)} hot queries use an index")
+        return 1 if scans and strict else 0
+    except OperationFailure as e:
+        print(f"Error bootstrapping indexes: {e}")
+        return 1
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create and verify MongoDB indexes")
+    parser.add_argument("--strict", action="store_true", help="exit non-zero on any COLLSCAN plan")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.strict)))
@@ -0,0 +1,14 @@
+"""Errors the API's domain modules raise for a request they refuse.
+
+Each carries the HTTP ``status_code`` and ``detail`` to answer with. server.py
+registers one handler for ``ApiError``, so routes let these propagate instead
+of translating them.
+"""
+
+
+class ApiError(Exception):
+    status_code = 400
+
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
@@ -0,0 +1,236 @@
+"""In-process facet counts for catalog browsing.
+
+The catalog is reduced to cells keyed by ``(category, price bucket, in stock)``.
+Each cell keeps the sorted prices of the products in it. Counts for any
+combination of category, price range and stock filter are sums over cells.
+Only cells cut by a price bound need a bisect. A facet request costs
+O(categories x buckets), however large the catalog is.
+
+Facets are disjunctive: each facet is counted with every filter except its own,
+so the category chips still show the other categories while one is selected.
+
+Like the search index, this is loaded once after a catalog-wide invalidation
+and patched one product at a time when individual products are invalidated.
+"""
+import asyncio
+import bisect
+import math
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+FACET_FIELDS = {"_id": 0, "id": 1, "category": 1, "price": 1, "stock": 1}
+
+# Lower edges of the price histogram; the last bucket is open-ended
+PRICE_BUCKETS = (0, 25, 50, 100, 200, 500)
+
+Cell = Tuple[str, int, bool]
+
+
+def price_bucket(price: float) -> int:
+    return max(0, bisect.bisect_right(PRICE_BUCKETS, price) - 1)
+
+
+class CatalogFilter(NamedTuple):
+    """Price range and stock filters for listings and facets; hashable, so it can be part of a cache key."""
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    in_stock: Optional[bool] = None
+
+    @property
+    def active(self) -> bool:
+        return self != CatalogFilter()
+
+    def mongo_query(self) -> dict:
+        query = {}
+        price = {}
+        if self.min_price is not None:
+            price["$gte"] = self.min_price
+        if self.max_price is not None:
+            price["$lte"] = self.max_price
+        if price:
+            query["price"] = price
+        if self.in_stock is not None:
+            query["stock"] = {"$gt": 0} if self.in_stock else {"$lte": 0}
+        return query
+
+    def matches(self, price: float, in_stock: bool) -> bool:
+        if self.min_price is not None and price < self.min_price:
+            return False
+        if self.max_price is not None and price > self.max_price:
+            return False
+        return self.in_stock is None or in_stock == self.in_stock
+
+
+class ProductFacets:
+    def __init__(self):
+        self._cells: Dict[Cell, List[float]] = defaultdict(list)
+        self._products: Dict[str, Tuple[Cell, float]] = {}
+
+        self._needs_rebuild = True
+        self._stale_ids: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    # ---------- maintenance ----------
+
+    def build(self, products: Iterable[dict]) -> None:
+        """Replace every cell with counts for ``products``."""
+        self._cells = defaultdict(list)
+        self._products = {}
+        for product in products:
+            cell, price = self._cell(product)
+            self._cells[cell].append(price)
+            self._products[product["id"]] = (cell, price)
+        for prices in self._cells.values():
+            prices.sort()
+
+    def add(self, product: dict) -> None:
+        """Insert or move a single product."""
+        self.remove(product["id"])
+        cell, price = self._cell(product)
+        bisect.insort(self._cells[cell], price)
+        self._products[product["id"]] = (cell, price)
+
+    def remove(self, product_id: str) -> None:
+        entry = self._products.pop(product_id, None)
+        if entry is None:
+            return
+        cell, price = entry
+        prices = self._cells[cell]
+        del prices[bisect.bisect_left(prices, price)]
+        if not prices:
+            del self._cells[cell]
+
+    def mark_stale(self, product_id: Optional[str] = None) -> None:
+        """Invalidation hook: ``None`` schedules a full reload, an id a single update."""
+        if product_id is None:
+            self._needs_rebuild = True
+            self._stale_ids.clear()
+        else:
+            self._stale_ids.add(product_id)
+
+    async def refresh(
+        self,
+        load_all: Callable[[], Awaitable[List[dict]]],
+        load_some: Callable[[List[str]], Awaitable[Dict[str, dict]]],
+    ) -> None:
+        """Apply pending invalidations; concurrent callers wait for one refresh."""
+        if not self._needs_rebuild and not self._stale_ids:
+            return
+        async with self._lock:
+            if self._needs_rebuild:
+                self._needs_rebuild = False
+                self._stale_ids.clear()
+                try:
+                    self.build(await load_all())
+                except BaseException:
+                    self._needs_rebuild = True
+                    raise
+            elif self._stale_ids:
+                stale_ids = list(self._stale_ids)
+                self._stale_ids.clear()
+                try:
+                    found = await load_some(stale_ids)
+                except BaseException:
+                    self._stale_ids.update(stale_ids)
+                    raise
+                for product_id in stale_ids:
+                    if product_id in found:
+                        self.add(found[product_id])
+                    else:
+                        self.remove(product_id)
+
+    @staticmethod
+    def _cell(product: dict) -> Tuple[Cell, float]:
+        price = float(product.get("price") or 0)
+        in_stock = (product.get("stock") or 0) > 0
+        return (product.get("category") or "", price_bucket(price), in_stock), price
+
+    # ---------- querying ----------
+
+    def matcher(self, filters: CatalogFilter) -> Callable[[str], bool]:
+        """Predicate over product ids, for filtering search results without loading documents."""
+        def matches(product_id: str) -> bool:
+            entry = self._products.get(product_id)
+            return entry is not None and filters.matches(entry[1], entry[0][2])
+        return matches
+
+    def facets(self, category: Optional[str] = None, filters: CatalogFilter = CatalogFilter(),
+               product_ids: Optional[Iterable[str]] = None) -> dict:
+        """Facet counts for the catalog, or only for ``product_ids`` (e.g. search matches)."""
+        cells = self._cells.items() if product_ids is None else self._cells_for(product_ids)
+        categories: Dict[str, int] = defaultdict(int)
+        buckets = [0] * len(PRICE_BUCKETS)
+        stock = {True: 0, False: 0}
+        total = 0
+        low, high = math.inf, -math.inf
+        no_price = filters._replace(min_price=None, max_price=None)
+        no_stock = filters._replace(in_stock=None)
+
+        for (cell_category, bucket, in_stock), prices in cells:
+            count = self._count(prices, filters)
+            in_category = category is None or cell_category == category
+            stock_ok = filters.in_stock is None or in_stock == filters.in_stock
+            if stock_ok:
+                categories[cell_category] += count
+            if in_category and stock_ok:
+                buckets[bucket] += self._count(prices, no_price)
+            if in_category:
+                stock[in_stock] += self._count(prices, no_stock)
+            if in_category and stock_ok and count:
+                total += count
+                low = min(low, self._lowest(prices, filters))
+                high = max(high, self._highest(prices, filters))
+
+        return {
+            "total": total,
+            "categories": [
+                {"value": name, "count": count}
+                for name, count in sorted(categories.items(), key=lambda item: (-item[1], item[0]))
+                if count
+            ],
+            "price_buckets": [
+                {
+                    "min": edge,
+                    "max": PRICE_BUCKETS[index + 1] if index + 1 < len(PRICE_BUCKETS) else None,
+                    "count": buckets[index],
+                }
+                for index, edge in enumerate(PRICE_BUCKETS)
+            ],
+            "stock": {"in_stock": stock[True], "out_of_stock": stock[False]},
+            "price_range": {"min": low, "max": high} if total else None,
+        }
+
+    def _cells_for(self, product_ids: Iterable[str]):
+        """Group an explicit id set into the same shape as the materialized cells."""
+        grouped: Dict[Cell, List[float]] = defaultdict(list)
+        for product_id in product_ids:
+            entry = self._products.get(product_id)
+            if entry is not None:
+                grouped[entry[0]].append(entry[1])
+        for prices in grouped.values():
+            prices.sort()
+        return grouped.items()
+
+    @staticmethod
+    def _bounds(prices: List[float], filters: CatalogFilter) -> Tuple[int, int]:
+        start = 0 if filters.min_price is None else bisect.bisect_left(prices, filters.min_price)
+        end = len(prices) if filters.max_price is None else bisect.bisect_right(prices, filters.max_price)
+        return start, max(start, end)
+
+    @classmethod
+    def _count(cls, prices: List[float], filters: CatalogFilter) -> int:
+        start, end = cls._bounds(prices, filters)
+        return end - start
+
+    @classmethod
+    def _lowest(cls, prices: List[float], filters: CatalogFilter) -> float:
+        start, end = cls._bounds(prices, filters)
+        return prices[start] if end > start else math.inf
+
+    @classmethod
+    def _highest(cls, prices: List[float], filters: CatalogFilter) -> float:
+        start, end = cls._bounds(prices, filters)
+        return prices[end - 1] if end > start else -math.inf
@@ -0,0 +1,30 @@
+"""gunicorn settings for running the API as uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py server:app
+
+The same choices as serve.py: one worker per core unless WEB_CONCURRENCY
+says otherwise, and a graceful drain of GRACEFUL_TIMEOUT_SECONDS on
+shutdown. The app is not preloaded, so each worker imports it after the
+fork and opens its own MongoDB and Redis connections. With more than one
+worker, metrics are summed across them through PROMETHEUS_MULTIPROC_DIR.
+"""
+import os
+
+from serve import configure_worker_env, default_workers
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 8001)}"
+workers = default_workers()
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = False
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT_SECONDS', 30))
+# A worker busy for longer than this is killed and replaced
+timeout = int(os.environ.get('WORKER_TIMEOUT_SECONDS', 60))
+
+configure_worker_env(workers)
+
+
+def child_exit(server, worker):
+    # A worker that died without its lifespan shutdown still holds live gauges (see metrics.py)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client.multiprocess import mark_process_dead
+        mark_process_dead(worker.pid)
@@ -0,0 +1,228 @@
+"""Response cache for the public catalog routes.
+
+``HTTPCacheMiddleware`` sits in front of GET /api/products,
+/api/products/facets, /api/products/{id} and /api/products/{id}/related. It keeps each route's serialized
+response (status, headers and body bytes) in a byte cache. Keys are the path
+plus the sorted query string, prefixed with the catalog version and the
+negotiated Content-Encoding, so a compressed body is stored compressed. A catalog
+write bumps the version, which makes every older entry unreachable in every
+process at once. Old entries are then left to expire.
+
+On a hit the stored bytes are replayed as they are. A matching
+``If-None-Match`` gets a bodiless 304. Neither touches MongoDB beyond the
+product cache's periodic version poll. On a miss the route runs as usual and
+its 200 response is stored on the way out. ETags are the routes' own body
+hashes, so a validator is exact even for changes that do not bump the version.
+Checkout stock moves are such changes; they drop the affected product's entry
+through the product cache's invalidation listeners. A miss that was already
+running when its path was invalidated may have rendered the old stock, so its
+response is sent but not stored. Related product lists are
+another: a recommendation refresh reaches them once their entries expire.
+
+Every response from these routes carries ``Cache-Control: public, max-age=N,
+stale-while-revalidate=M``, so browsers and CDNs can reuse and revalidate it.
+
+Entries are kept in the shared state backend (see shared_state.py), so with
+SHARED_STATE=redis every API process serves from, and fills, one cache.
+HTTP_CACHE_BACKEND=memory keeps a private cache per process instead, and
+``off`` disables the cache; either way the headers are still added.
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Pattern, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+import orjson
+
+from shared_state import state_for
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_PATHS = re.compile(r"^/api/products(?:/[^/]+(?:/related)?)?$")
+# Response headers that are stored and replayed; the rest are per-response
+STORED_HEADERS = {b"content-type", b"content-encoding", b"vary", b"etag", b"x-next-cursor"}
+
+
+def cache_key(path: str, query_string: bytes) -> str:
+    """Path plus the query with its parameters sorted, so ``?a=1&b=2`` and ``?b=2&a=1`` share an entry."""
+    query = urlencode(sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)))
+    return f"{path}?{query}" if query else path
+
+
+def pack(status: int, headers: List[Tuple[bytes, bytes]], body: bytes) -> bytes:
+    meta = {"status": status, "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers]}
+    return orjson.dumps(meta) + b"\n" + body
+
+
+def unpack(value: bytes) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    meta, _, body = value.partition(b"\n")
+    meta = orjson.loads(meta)
+    return meta["status"], [(name.encode("latin-1"), value.encode("latin-1")) for name, value in meta["headers"]], body
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match ``header`` matches ``etag``; used by this middleware and the routes alike."""
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+class ResponseCache:
+    """Cache settings and counters shared by the middleware and the invalidation hook."""
+
+    def __init__(
+        self,
+        cache,
+        version: Callable[[], Awaitable[int]],
+        max_age: int = 30,
+        stale_while_revalidate: int = 60,
+        ttl_seconds: Optional[float] = None,
+        max_entry_bytes: int = 4 * 1024 * 1024,
+        paths: Pattern = CACHEABLE_PATHS,
+        variant: Optional[Callable[[dict], str]] = None,
+        variants: Sequence[str] = ("",),
+    ):
+        self.cache = cache
+        self.version = version
+        self.cache_control = f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}".encode()
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else max_age + stale_while_revalidate
+        self.max_entry_bytes = max_entry_bytes
+        self.paths = paths
+        # Responses that differ by request header (the negotiated Content-Encoding) are stored per variant
+        self.variant = variant
+        self.variants = tuple(variants)
+        self._pending: set = set()
+        # path -> invalidations so far; bounded by the product pages ever invalidated
+        self._generations: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @classmethod
+    def from_env(cls, shared, version: Callable[[], Awaitable[int]], **kwargs) -> "ResponseCache":
+        ttl = os.environ.get('HTTP_CACHE_TTL_SECONDS')
+        return cls(
+            state_for('HTTP_CACHE_BACKEND', shared),
+            version,
+            max_age=int(os.environ.get('HTTP_CACHE_MAX_AGE', 30)),
+            stale_while_revalidate=int(os.environ.get('HTTP_CACHE_STALE_WHILE_REVALIDATE', 60)),
+            ttl_seconds=float(ttl) if ttl else None,
+            **kwargs,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache is not None
+
+    def key(self, version: int, path: str, query_string: bytes = b"", variant: str = "") -> str:
+        return f"http:v{version}:{variant}:{cache_key(path, query_string)}"
+
+    def generation(self, path: str) -> int:
+        return self._generations.get(path, 0)
+
+    def invalidate_path(self, version: int, path: str) -> None:
+        """Drop a cached page changed without a version bump; the delete runs in the background."""
+        if not self.enabled:
+            return
+        # Misses in flight for the path see the bump and skip storing what they rendered
+        self._generations[path] = self.generation(path) + 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self.cache.delete([self.key(version, path, variant=variant) for variant in self.variants]))
+        # Keep a reference until it finishes so the task is not garbage collected
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def drain(self) -> None:
+        """Wait for background deletes, so a shutting-down worker leaves no stale entry behind."""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def stats(self) -> dict:
+        stats = self.cache.stats() if self.enabled else {}
+        return {**stats, "hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
+
+
+class HTTPCacheMiddleware:
+    def __init__(self, app, response_cache: ResponseCache):
+        self.app = app
+        self.rc = response_cache
+
+    async def __call__(self, scope, receive, send):
+        rc = self.rc
+        if scope["type"] != "http" or scope["method"] != "GET" or not rc.paths.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        if not rc.enabled or b"no-cache" in request_headers.get(b"cache-control", b""):
+            await self._forward(scope, receive, send, key=None)
+            return
+
+        variant = rc.variant(request_headers) if rc.variant is not None else ""
+        key = rc.key(await rc.version(), scope["path"], scope["query_string"], variant)
+        try:
+            stored = await rc.cache.get(key)
+        except Exception:
+            # A cache outage degrades to uncached responses, never to errors
+            logger.exception("HTTP cache read failed")
+            stored = None
+        if stored is None:
+            rc.misses += 1
+            await self._forward(scope, receive, send, key)
+            return
+
+        rc.hits += 1
+        status, headers, body = unpack(stored)
+        etag = next((value for name, value in headers if name == b"etag"), None)
+        if_none_match = request_headers.get(b"if-none-match", b"").decode("latin-1")
+        if etag is not None and etag_matches(if_none_match, etag.decode("latin-1")):
+            rc.not_modified += 1
+            status, headers, body = 304, [(b"etag", etag)], b""
+        else:
+            headers = headers + [(b"content-length", str(len(body)).encode())]
+        headers = headers + [(b"cache-control", rc.cache_control), (b"x-cache", b"HIT")]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _forward(self, scope, receive, send, key: Optional[str]):
+        """Run the route, add Cache-Control, and store a 200 response under ``key``."""
+        rc = self.rc
+        start_message = None
+        chunks: Optional[List[bytes]] = [] if key is not None else None
+        size = 0
+        generation = rc.generation(scope["path"])
+
+        async def send_and_capture(message):
+            nonlocal start_message, chunks, size
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = [(name, value) for name, value in message["headers"] if name.lower() != b"cache-control"]
+                message = {**message, "headers": headers + [(b"cache-control", rc.cache_control), (b"x-cache", b"MISS")]}
+            elif message["type"] == "http.response.body" and chunks is not None:
+                body = message.get("body", b"")
+                size += len(body)
+                if size > rc.max_entry_bytes:
+                    chunks = None
+                else:
+                    chunks.append(body)
+            await send(message)
+
+        await self.app(scope, receive, send_and_capture)
+
+        if chunks is None or start_message is None or start_message["status"] != 200:
+            return
+        if rc.generation(scope["path"]) != generation:
+            # Invalidated while the route ran; the body may predate the change
+            return
+        headers = [(name.lower(), value) for name, value in start_message["headers"] if name.lower() in STORED_HEADERS]
+        try:
+            await rc.cache.set(key, pack(200, headers, b"".join(chunks)), rc.ttl_seconds)
+        except Exception:
+            logger.exception("HTTP cache write failed")
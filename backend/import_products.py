@@ -0,0 +1,248 @@
+"""Stream a product catalog from CSV or NDJSON into MongoDB.
+
+    python import_products.py catalog.csv [--batch-size 1000] [--mode upsert|replace]
+                                          [--rejects rejects.ndjson] [--max-rejects N] [--dry-run]
+
+Rows are read one at a time and validated against the API's ``Product`` model.
+CSV columns are coerced to the model's types. Rows that fail are counted and,
+with ``--rejects``, written out with their line number and errors. Valid rows
+are written in bounded batches of ``--batch-size`` with unordered bulk writes.
+Memory use stays flat no matter how large the file is.
+
+Modes:
+
+* ``upsert`` (default) - update products in place, keyed on ``id``. Products
+  not in the file are left alone. Columns a row leaves empty keep their stored
+  values. Model defaults such as ``stock`` only fill in new products. Every
+  imported row increments the product's ``version`` and restores it if the
+  admin API had deleted it.
+* ``replace`` - load into a shadow collection, build its indexes, then rename
+  it over ``products`` in one atomic step. Readers see the old catalog until the
+  swap and the new one after it, never a partial or empty one. The swap is
+  skipped if more than ``--max-rejects`` rows were rejected.
+
+Both modes bump the catalog version afterwards, so running API processes drop
+their cached products.
+
+Every row needs an ``id``: upserts are keyed on it, so a generated id would
+duplicate the product on each import.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import orjson
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import ValidationError
+from pymongo import UpdateOne
+
+from db_indexes import REQUIRED_INDEXES
+from models import Product
+from product_cache import bump_catalog_version
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+PROGRESS_EVERY = 50_000
+# Set by every write rather than read from the file
+WRITE_FIELDS = {"version", "updated_at"}
+
+
+def open_text(path: str):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_rows(path: str, fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Yield ``(line_number, row, parse_error)``; exactly one of row/parse_error is set."""
+    with open_text(path) as handle:
+        if fmt == "csv":
+            reader = csv.DictReader(handle)
+            for row in reader:
+                # Empty cells mean "not given", so model defaults apply
+                yield reader.line_num, {k: v for k, v in row.items() if k and v not in ("", None)}, None
+        else:
+            for line_number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    yield line_number, None, f"invalid JSON: {e}"
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, None, "expected a JSON object"
+                    continue
+                yield line_number, row, None
+
+
+def validate(row: dict) -> Tuple[Optional[UpdateOne], Optional[str]]:
+    """Return an upsert for a valid row, or the reason it was rejected."""
+    if not row.get("id"):
+        return None, "id is required"
+    try:
+        product = Product.model_validate(row)
+    except ValidationError as e:
+        return None, "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+        )
+    document = product.model_dump(exclude=WRITE_FIELDS)
+    given = {field: document[field] for field in product.model_fields_set - WRITE_FIELDS}
+    # Model defaults (stock, created_at) only apply to new products, never over existing values
+    defaults = {field: value for field, value in document.items() if field not in given}
+    # updated_at tells the API's catalog watcher which products changed (see catalog_watch.py);
+    # a row in the file also restores a product the admin API soft-deleted
+    update = {
+        "$set": {**given, "updated_at": datetime.now(timezone.utc)},
+        "$inc": {"version": 1},
+        "$unset": {"deleted_at": ""},
+    }
+    if defaults:
+        update["$setOnInsert"] = defaults
+    return UpdateOne({"id": document["id"]}, update, upsert=True), None
+
+
+class ImportStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.rejected = 0
+        self.upserted = 0
+        self.modified = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def rate(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+
+async def write_batch(collection, operations, stats: ImportStats, dry_run: bool) -> None:
+    if dry_run:
+        return
+    result = await collection.bulk_write(operations, ordered=False)
+    stats.upserted += result.upserted_count
+    stats.modified += result.modified_count
+
+
+async def stream_into(collection, rows, batch_size, rejects, dry_run) -> ImportStats:
+    stats = ImportStats()
+    operations = []
+    # At most one batch is being written while the next one is parsed
+    pending: Optional[asyncio.Task] = None
+
+    for line_number, row, error in rows:
+        stats.read += 1
+        operation = None
+        if error is None:
+            operation, error = validate(row)
+        if error is not None:
+            stats.rejected += 1
+            if rejects is not None:
+                rejects.write(orjson.dumps({"line": line_number, "error": error, "row": row}, default=str) + b"\n")
+            continue
+
+        operations.append(operation)
+        if len(operations) >= batch_size:
+            if pending is not None:
+                await pending
+            pending = asyncio.create_task(write_batch(collection, operations, stats, dry_run))
+            operations = []
+        if stats.read % PROGRESS_EVERY == 0:
+            print(f"  {stats.read} rows read, {stats.rejected} rejected, {stats.rate():.0f} rows/s")
+
+    if pending is not None:
+        await pending
+    if operations:
+        await write_batch(collection, operations, stats, dry_run)
+    return stats
+
+
+async def create_product_indexes(collection) -> None:
+    for keys, options in REQUIRED_INDEXES["products"]:
+        await collection.create_index(keys, **options)
+
+
+async def import_products(db, rows, mode="upsert", batch_size=1000,
+                          rejects=None, max_rejects=None, dry_run=False) -> ImportStats:
+    """Import ``rows`` as yielded by ``read_rows``: ``(line_number, row, parse_error)`` tuples."""
+    if mode == "upsert":
+        stats = await stream_into(db.products, rows, batch_size, rejects, dry_run)
+    else:
+        shadow = db[f"products_import_{uuid.uuid4().hex[:12]}"]
+        # The id index makes every upsert a point lookup; the rest are cheaper to build once at the end
+        id_index = next(index for index in REQUIRED_INDEXES["products"] if index[1]["name"] == "id_unique")
+        if not dry_run:
+            await shadow.create_index(id_index[0], **id_index[1])
+        try:
+            stats = await stream_into(shadow, rows, batch_size, rejects, dry_run)
+            if dry_run:
+                return stats
+            if max_rejects is not None and stats.rejected > max_rejects:
+                raise SystemExit(f"{stats.rejected} rows rejected (limit {max_rejects}); catalog left unchanged")
+            if stats.upserted + stats.modified == 0:
+                raise SystemExit("No valid rows; refusing to replace the catalog with an empty one")
+            await create_product_indexes(shadow)
+            await shadow.rename("products", dropTarget=True)
+            print(f"  Swapped {shadow.name} in as products")
+        except BaseException:
+            await shadow.drop()
+            raise
+
+    if not dry_run:
+        version = await bump_catalog_version(db)
+        print(f"  Catalog version bumped to {version}")
+    return stats
+
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    return "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    rejects = open(args.rejects, "wb") if args.rejects else None
+    try:
+        rows = read_rows(args.path, args.format or detect_format(args.path))
+        stats = await import_products(
+            db, rows, args.mode, args.batch_size, rejects, args.max_rejects, args.dry_run
+        )
+        verb = "Validated" if args.dry_run else "Imported"
+        print(
+            f"{verb} {stats.read - stats.rejected} of {stats.read} rows in {stats.elapsed:.1f}s "
+            f"({stats.rate():.0f} rows/s): {stats.upserted} new, {stats.modified} updated, {stats.rejected} rejected"
+        )
+    finally:
+        if rejects is not None:
+            rejects.close()
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a CSV/NDJSON product catalog into MongoDB")
+    parser.add_argument("path", help="CSV or NDJSON file, optionally .gz; - reads stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    parser.add_argument("--mode", choices=["upsert", "replace"], default="upsert")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rejects", help="write rejected rows here as NDJSON")
+    parser.add_argument("--max-rejects", type=int, help="replace mode: abort the swap above this many rejects")
+    parser.add_argument("--dry-run", action="store_true", help="validate only, write nothing")
+    args = parser.parse_args()
+    print("Starting product import...")
+    asyncio.run(main(args))
+    print("Product import complete!")
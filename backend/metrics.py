@@ -0,0 +1,254 @@
+"""Prometheus metrics for the API, served at /metrics.
+
+Four sources feed the default prometheus_client registry:
+
+* ``MetricsMiddleware`` - a plain ASGI middleware that counts requests and
+  observes their latency. It is labelled by method, route template (not the raw
+  path, so ids do not explode cardinality) and status.
+* ``CommandMetrics`` - a pymongo command listener that times every database
+  command by collection and command name, using the driver's own duration.
+* ``StatsCollector`` - reads the counters that caches, the password pool and
+  the connection pool already keep, at scrape time. The hot paths do no extra
+  work for these.
+* Module-level metrics such as ``AUTH_FAILURES``, ``PASSWORD_HASH_SECONDS``
+  and ``JSON_ENCODE_SECONDS``, updated directly by the code they describe.
+
+METRICS_ENABLED=false turns off the middleware and the command listener.
+
+With several worker processes (serve.py, gunicorn.conf.py), each worker
+would answer /metrics with only its own counts. Those launchers therefore set
+PROMETHEUS_MULTIPROC_DIR, which puts prometheus_client in multiprocess mode.
+Every worker writes its metrics to files in that directory, and /metrics
+sums them across workers. ``StatsCollector`` readings live in each worker's
+memory, so each worker publishes them into that directory every
+METRICS_PUBLISH_SECONDS. The worker answering a scrape publishes first. In
+this mode the process CPU and memory metrics are not exported.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+from pymongo import monitoring
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+# Read by prometheus_client when it is imported, so it must be set before the workers start
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+METRICS_PUBLISH_SECONDS = float(os.environ.get('METRICS_PUBLISH_SECONDS', 5))
+
+# Request latencies sit around a few ms; bcrypt-bound logins reach hundreds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being handled", multiprocess_mode="livesum")
+
+DB_COMMAND_SECONDS = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency as reported by the driver",
+    ["collection", "command"], buckets=DB_BUCKETS,
+)
+DB_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures", "MongoDB commands that returned an error", ["collection", "command"]
+)
+
+AUTH_FAILURES = Counter("auth_failures", "Rejected authentication attempts", ["reason"])
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "bcrypt work including time queued for a worker",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+JSON_ENCODE_SECONDS = Histogram(
+    "json_encode_duration_seconds", "orjson response encoding time", buckets=DB_BUCKETS
+)
+
+UNMATCHED_ROUTE = "unmatched"
+# stats() key -> cache_requests_total result label
+CACHE_RESULTS = {"hits": "hit", "misses": "miss", "coalesced": "coalesced", "not_modified": "not_modified"}
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._route_names: Optional[Dict[Callable, str]] = None
+
+    def _route(self, scope) -> str:
+        # The router leaves the matched endpoint in the scope; map it back to its path template
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        if self._route_names is None:
+            self._route_names = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._route_names.get(endpoint, UNMATCHED_ROUTE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_PROGRESS.dec()
+            route = self._route(scope)
+            HTTP_LATENCY.labels(scope["method"], route).observe(elapsed)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status_code)).inc()
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Per-collection, per-command timings from pymongo command events.
+
+    Only the started event names the collection, so it is remembered by request
+    id until the matching succeeded or failed event arrives.
+    """
+
+    def __init__(self):
+        self._collections: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        command = event.command
+        target = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        with self._lock:
+            self._collections[event.request_id] = target if isinstance(target, str) else "-"
+
+    def _finish(self, event) -> str:
+        with self._lock:
+            return self._collections.pop(event.request_id, "-")
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        DB_COMMAND_SECONDS.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        DB_COMMAND_SECONDS.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        DB_COMMAND_FAILURES.labels(collection, event.command_name).inc()
+
+
+class StatsCollector:
+    """Exports counters that components already keep, read when /metrics is scraped."""
+
+    def __init__(self):
+        self._caches: Dict[str, Callable[[], dict]] = {}
+        self._gauges: Dict[str, tuple] = {}
+        self._counters: Dict[str, tuple] = {}
+        # Multiprocess mode: the metrics readings are published into, and the counter values already added
+        self._published: Dict[str, object] = {}
+        self._published_counts: Dict[tuple, float] = {}
+
+    def add_cache(self, name: str, stats: Callable[[], dict]) -> None:
+        """``stats()`` returns ``hits``, ``misses`` and ``entries``, plus any of ``coalesced``/``evictions``/``bytes``."""
+        self._caches[name] = stats
+
+    def add_gauge(self, name: str, documentation: str, read: Callable[[], float], combine: str = "livesum") -> None:
+        """``combine`` is how multiprocess mode merges the workers' values: a prometheus_client ``multiprocess_mode``."""
+        self._gauges[name] = (documentation, read, combine)
+
+    def add_counter(self, name: str, documentation: str, read: Callable[[], float]) -> None:
+        self._counters[name] = (documentation, read)
+
+    def readings(self):
+        """Yield ``(kind, name, documentation, label names, label values, value)`` for every reading."""
+        for cache, read in self._caches.items():
+            stats = read()
+            for key, result in CACHE_RESULTS.items():
+                if key in stats:
+                    yield (
+                        "counter", "cache_requests", "Cache lookups by result",
+                        ("cache", "result"), (cache, result), stats[key],
+                    )
+            if "evictions" in stats:
+                yield (
+                    "counter", "cache_evictions", "Entries evicted to respect cache limits",
+                    ("cache",), (cache,), stats["evictions"],
+                )
+            if "entries" in stats:
+                yield "gauge", "cache_entries", "Entries currently cached", ("cache",), (cache,), stats["entries"]
+            if "bytes" in stats:
+                yield "gauge", "cache_bytes", "Estimated size of cached entries", ("cache",), (cache,), stats["bytes"]
+        for name, (documentation, read, _) in self._gauges.items():
+            yield "gauge", name, documentation, (), (), read()
+        for name, (documentation, read) in self._counters.items():
+            yield "counter", name, documentation, (), (), read()
+
+    def collect(self):
+        families = {}
+        for kind, name, documentation, label_names, labels, value in self.readings():
+            if name not in families:
+                family_class = CounterMetricFamily if kind == "counter" else GaugeMetricFamily
+                families[name] = family_class(name, documentation, labels=label_names)
+            families[name].add_metric(labels, value)
+        yield from families.values()
+
+    def publish(self) -> None:
+        """Write the current readings to this worker's multiprocess metric files."""
+        for kind, name, documentation, label_names, labels, value in self.readings():
+            metric = self._published.get(name)
+            if metric is None:
+                # Not registered: MultiProcessCollector reads them back from the files
+                if kind == "counter":
+                    metric = Counter(name, documentation, label_names, registry=None)
+                else:
+                    combine = self._gauges[name][2] if name in self._gauges else "livesum"
+                    metric = Gauge(name, documentation, label_names, registry=None, multiprocess_mode=combine)
+                self._published[name] = metric
+            child = metric.labels(*labels) if label_names else metric
+            if kind == "counter":
+                # Counters only go up, so add what the reading gained since the last publish
+                key = (name, labels)
+                gained = value - self._published_counts.get(key, 0)
+                if gained > 0:
+                    child.inc(gained)
+                self._published_counts[key] = value
+            else:
+                child.set(value)
+
+
+stats_collector = StatsCollector()
+if not MULTIPROCESS:
+    REGISTRY.register(stats_collector)
+
+
+async def publish_stats() -> None:
+    """Run by each worker every METRICS_PUBLISH_SECONDS in multiprocess mode."""
+    stats_collector.publish()
+
+
+def retire_worker() -> None:
+    """On shutdown in multiprocess mode: publish final counts, and drop this worker's live gauges."""
+    if not MULTIPROCESS:
+        return
+    stats_collector.publish()
+    mark_process_dead(os.getpid())
+
+
+def render_metrics() -> tuple:
+    """Return ``(body, content_type)`` for the /metrics endpoint."""
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    stats_collector.publish()
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,99 @@
+"""Copy carts from the one-row-per-line ``cart`` layout into per-user ``carts`` documents.
+
+Run this once before switching the API to CART_STORE=embedded:
+
+    python migrate_cart_layout.py [--batch-size 500] [--drop-rows] [--dry-run]
+
+Rows are streamed in ``user_id`` order, so the ``(user_id, product_id)`` index
+serves the read and memory holds only one batch of carts. Line ids,
+quantities and timestamps are kept, so cart item ids the client already holds
+stay valid.
+
+The migration only creates carts that do not exist yet. Re-running it, or
+running it after some users already have an embedded cart, never overwrites
+those carts. ``--drop-rows`` drops the old ``cart`` collection once the copy
+has finished.
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, UpdateOne
+
+from cart_store import EmbeddedCartStore, LINE_FIELDS, RowCartStore
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def cart_upsert(user_id: str, items: list) -> UpdateOne:
+    return UpdateOne(
+        {"_id": user_id},
+        {"$setOnInsert": {"items": items, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def migrate_rows_to_embedded(db, batch_size: int = 500, dry_run: bool = False) -> dict:
+    """Return ``{"carts", "lines", "created"}`` counts."""
+    rows = db[RowCartStore.collection_name]
+    carts = db[EmbeddedCartStore.collection_name]
+    counts = {"carts": 0, "lines": 0, "created": 0}
+    operations = []
+    user_id, items = None, []
+
+    async def flush():
+        if operations and not dry_run:
+            result = await carts.bulk_write(operations, ordered=False)
+            counts["created"] += result.upserted_count
+        operations.clear()
+
+    cursor = rows.find({}, {**LINE_FIELDS, "user_id": 1}).sort([("user_id", ASCENDING), ("product_id", ASCENDING)])
+    async for row in cursor:
+        row_user_id = row.pop("user_id")
+        if row_user_id != user_id:
+            if items:
+                operations.append(cart_upsert(user_id, items))
+                counts["carts"] += 1
+            user_id, items = row_user_id, []
+            if len(operations) >= batch_size:
+                await flush()
+        items.append(row)
+        counts["lines"] += 1
+    if items:
+        operations.append(cart_upsert(user_id, items))
+        counts["carts"] += 1
+    await flush()
+    return counts
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        counts = await migrate_rows_to_embedded(db, args.batch_size, args.dry_run)
+        print(f"  Read {counts['lines']} lines in {counts['carts']} carts")
+        if args.dry_run:
+            print("  Dry run: nothing written")
+        else:
+            print(f"  Created {counts['created']} embedded carts; existing ones were left alone")
+        if args.drop_rows and not args.dry_run:
+            await db[RowCartStore.collection_name].drop()
+            print(f"  Dropped {RowCartStore.collection_name}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy row-per-line carts into per-user cart documents")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--drop-rows", action="store_true", help="drop the old cart collection afterwards")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    print("Starting cart layout migration...")
+    asyncio.run(main(args))
+    print("Cart layout migration complete!")
@@ -0,0 +1,87 @@
+"""Convert ISO-8601 string timestamps to native BSON dates.
+
+Older versions of the API stored ``created_at`` as ``datetime.isoformat()``
+strings. The API now writes native dates and serializes them without
+re-parsing, so existing string values should be converted once:
+
+    python migrate_dates.py [--batch-size 1000] [--dry-run]
+
+The migration is idempotent: only documents whose field is still a string are
+touched, so it is safe to re-run or to interrupt.
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# collection -> timestamp fields that may hold strings
+DATE_FIELDS = {
+    "users": ["created_at"],
+    "products": ["created_at"],
+    "cart": ["created_at"],
+}
+
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def migrate_field(db, collection, field, batch_size, dry_run):
+    converted = skipped = 0
+    operations = []
+    cursor = db[collection].find({field: {"$type": "string"}}, {field: 1})
+    async for doc in cursor:
+        try:
+            value = parse_timestamp(doc[field])
+        except ValueError:
+            skipped += 1
+            continue
+        # Guard on the old value so a concurrent rewrite of the field is not clobbered
+        operations.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+        if len(operations) >= batch_size:
+            converted += await flush(db, collection, operations, dry_run)
+            operations = []
+    if operations:
+        converted += await flush(db, collection, operations, dry_run)
+    return converted, skipped
+
+
+async def flush(db, collection, operations, dry_run):
+    if dry_run:
+        return len(operations)
+    result = await db[collection].bulk_write(operations, ordered=False)
+    return result.modified_count
+
+
+async def migrate(batch_size, dry_run):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        for collection, fields in DATE_FIELDS.items():
+            for field in fields:
+                converted, skipped = await migrate_field(db, collection, field, batch_size, dry_run)
+                verb = "Would convert" if dry_run else "Converted"
+                print(f"  {collection}.{field}: {verb} {converted}, skipped {skipped} unparseable")
+    except Exception as e:
+        print(f"Error migrating timestamps: {e}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert string timestamps to native BSON dates")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    print("Starting timestamp migration...")
+    asyncio.run(migrate(args.batch_size, args.dry_run))
+    print("Timestamp migration complete!")
@@ -0,0 +1,193 @@
+"""Pydantic models for the API's request and response bodies and stored documents.
+
+Kept apart from server.py so tools such as import_products.py can validate
+products without importing, and configuring, the whole API.
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+
+
+class User(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    email: EmailStr
+    name: str
+    password_hash: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class UserCreate(BaseModel):
+    email: EmailStr
+    name: str
+    password: str
+
+
+class UserLogin(BaseModel):
+    email: EmailStr
+    password: str
+
+
+class UserResponse(BaseModel):
+    id: str
+    email: str
+    name: str
+
+
+class AuthenticatedUser(BaseModel):
+    """Identity of the caller, as carried by a verified access token."""
+    id: str
+    email: str
+    name: str
+
+
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str
+    user: UserResponse
+
+
+class Product(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    description: str
+    price: float
+    category: str
+    image: str
+    stock: int = 100
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Incremented by every write; products that predate versioning are version 0
+    version: int = 0
+    updated_at: Optional[datetime] = None
+
+
+class ProductCreate(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()), min_length=1)
+    name: str = Field(min_length=1)
+    description: str
+    price: float = Field(ge=0)
+    category: str = Field(min_length=1)
+    image: str
+    stock: int = Field(100, ge=0)
+
+
+class ProductPatch(BaseModel):
+    """Fields to change, plus the version they were read at; omitted fields keep their values."""
+    model_config = ConfigDict(extra="forbid")
+    version: int = Field(ge=0)
+    name: Optional[str] = Field(None, min_length=1)
+    description: Optional[str] = None
+    price: Optional[float] = Field(None, ge=0)
+    category: Optional[str] = Field(None, min_length=1)
+    image: Optional[str] = None
+    stock: Optional[int] = Field(None, ge=0)
+
+    def changes(self) -> dict:
+        return self.model_dump(exclude_unset=True, exclude_none=True, exclude={"id", "version"})
+
+
+class ProductBulkPatch(ProductPatch):
+    id: str
+
+
+class VersionConflictItem(BaseModel):
+    id: str
+    current_version: int
+
+
+class BulkPatchResponse(BaseModel):
+    updated: List[str]
+    conflicts: List[VersionConflictItem]
+    not_found: List[str]
+    catalog_version: int
+
+
+class CartItem(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    product_id: str
+    quantity: int
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class CartItemCreate(BaseModel):
+    product_id: str
+    quantity: int = 1
+
+
+class CartItemUpdate(BaseModel):
+    quantity: int
+
+
+class CartSummaryLine(BaseModel):
+    cart_item_id: str
+    product_id: str
+    name: str
+    price: float
+    quantity: int
+    stock: int
+    line_total: float
+
+
+class StockWarning(BaseModel):
+    product_id: str
+    requested: int
+    available: int
+
+
+class CartSummary(BaseModel):
+    item_count: int
+    lines: List[CartSummaryLine]
+    subtotal: float
+    shipping: float
+    tax: float
+    total: float
+    stock_warnings: List[StockWarning]
+
+
+class CartItemResponse(BaseModel):
+    id: str
+    product: Product
+    quantity: int
+    summary: Optional[CartSummary] = None
+
+
+class CartDeleteResponse(BaseModel):
+    message: str
+    summary: Optional[CartSummary] = None
+
+
+class CartSyncItemResult(BaseModel):
+    product_id: str
+    status: str  # "added", "merged" or "skipped"
+    quantity: int = 0
+    cart_item_id: Optional[str] = None
+
+
+class CartSyncResponse(BaseModel):
+    message: str
+    items: List[CartSyncItemResult]
+
+
+class OrderItem(BaseModel):
+    product_id: str
+    name: str
+    price: float
+    quantity: int
+    line_total: float
+
+
+class OrderResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    status: str
+    items: List[OrderItem]
+    subtotal: float
+    shipping: float
+    tax: float
+    total: float
+    created_at: datetime
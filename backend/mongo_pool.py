@@ -0,0 +1,200 @@
+"""Motor client construction, pool warmup and pool wait-time monitoring.
+
+Pool size, timeouts, wire compression and read preference come from the
+environment (see ``MongoPoolSettings.from_env``). The client is built from the
+API lifespan, not at import time, and ``warm_pool`` opens connections before the
+app takes traffic. Without warmup the first requests after a deploy pay for TCP,
+TLS and auth handshakes.
+
+``PoolMonitor`` is a pymongo pool listener that records how long each
+connection checkout waited. Long waits mean ``maxPoolSize`` is too small for the
+request concurrency. /api/health reports the figures.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+WAIT_SAMPLES = 1024
+
+
+@dataclass
+class MongoPoolSettings:
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_connecting: int = 2
+    wait_queue_timeout_ms: Optional[int] = None
+    server_selection_timeout_ms: int = 30_000
+    connect_timeout_ms: int = 20_000
+    compressors: Optional[str] = None  # e.g. "zstd,snappy,zlib"; zstd/snappy need extra packages
+    read_preference: str = "primary"
+    warmup_connections: int = 0
+
+    @classmethod
+    def from_env(cls) -> "MongoPoolSettings":
+        def optional_int(name):
+            value = os.environ.get(name)
+            return int(value) if value else None
+
+        min_pool_size = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+        return cls(
+            max_pool_size=int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+            min_pool_size=min_pool_size,
+            max_connecting=int(os.environ.get('MONGO_MAX_CONNECTING', 2)),
+            wait_queue_timeout_ms=optional_int('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+            server_selection_timeout_ms=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30_000)),
+            connect_timeout_ms=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 20_000)),
+            compressors=os.environ.get('MONGO_COMPRESSORS') or None,
+            read_preference=os.environ.get('MONGO_READ_PREFERENCE', 'primary'),
+            warmup_connections=int(os.environ.get('MONGO_WARMUP_CONNECTIONS', min_pool_size)),
+        )
+
+    def client_options(self) -> dict:
+        options = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "maxConnecting": self.max_connecting,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "readPreference": self.read_preference,
+        }
+        if self.wait_queue_timeout_ms is not None:
+            options["waitQueueTimeoutMS"] = self.wait_queue_timeout_ms
+        if self.compressors:
+            options["compressors"] = self.compressors
+        return options
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection counts and checkout wait times, fed by pymongo's pool events.
+
+    pymongo checks a connection out synchronously on the thread running the
+    operation, so the start time is kept per thread and matched to the
+    checked-out or failed event that follows it.
+    """
+
+    def __init__(self, samples: int = WAIT_SAMPLES):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)  # seconds, most recent checkouts
+        self.open_connections = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_timeouts = 0
+        self.pool_clears = 0
+
+    def _elapsed(self) -> Optional[float]:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return None if started is None else time.perf_counter() - started
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._elapsed()
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            if wait is not None:
+                self._waits.append(wait)
+
+    def connection_check_out_failed(self, event):
+        self._elapsed()
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def connection_ready(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections = max(0, self.open_connections - 1)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    # Unused pool events
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            counters = {
+                "open_connections": self.open_connections,
+                "in_use": self.in_use,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_timeouts": self.checkout_timeouts,
+                "pool_clears": self.pool_clears,
+            }
+
+        def at(pct):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(pct / 100 * len(waits)))] * 1000, 3)
+
+        return {
+            **counters,
+            "checkout_wait_ms": {
+                "samples": len(waits),
+                "p50": at(50),
+                "p99": at(99),
+                "max": at(100),
+            },
+        }
+
+
+def create_client(mongo_url: str, settings: MongoPoolSettings, event_listeners: Sequence = ()) -> AsyncIOMotorClient:
+    # tz_aware so native BSON dates come back as UTC-aware datetimes
+    return AsyncIOMotorClient(
+        mongo_url,
+        tz_aware=True,
+        event_listeners=list(event_listeners),
+        **settings.client_options(),
+    )
+
+
+async def warm_pool(client: AsyncIOMotorClient, connections: int) -> None:
+    """Open ``connections`` pooled connections by pinging on that many at once."""
+    if connections <= 0:
+        return
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+
+
+async def is_replicated(client: AsyncIOMotorClient) -> bool:
+    """True on a replica set or through mongos: the deployments with transactions and change streams."""
+    hello = await client.admin.command("hello")
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+async def ping_latency_ms(client: AsyncIOMotorClient, timeout: float = 5.0) -> float:
+    """Round trip of a ping; gives up after ``timeout`` rather than the server selection timeout."""
+    start = time.perf_counter()
+    await asyncio.wait_for(client.admin.command("ping"), timeout)
+    return round((time.perf_counter() - start) * 1000, 3)
@@ -0,0 +1,183 @@
+"""Server-side checkout: price the cart, reserve stock, record the order, clear the cart.
+
+Stock is reserved with one conditional update per line,
+``{"id": product_id, "stock": {"$gte": quantity}}`` + ``$inc: -quantity``, so
+concurrent checkouts can never take a product below zero. The update also
+skips products soft-deleted since the cart was priced. If any line cannot be
+reserved, the lines already reserved are released again.
+
+When the deployment supports multi-document transactions (a replica set or
+sharded cluster), cart read, reservation, order write and cart clear run in one
+transaction. On a standalone server they run in sequence with compensation on
+failure, and the cart clear only removes what was bought: a line that an add
+grew during checkout keeps the added quantity.
+
+Orders are idempotent per ``(user_id, idempotency_key)``. The key is claimed by
+inserting a ``pending`` order under a unique index before any stock is touched,
+so a retried or duplicated request either replays the finished order or is told
+the original is still in progress.
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from catalog_admin import ACTIVE
+from errors import ApiError
+
+FREE_SHIPPING_THRESHOLD = 50.0
+SHIPPING_FEE = 9.99
+TAX_RATE = 0.08
+
+ORDER_PRODUCT_FIELDS = {"_id": 0, "id": 1, "name": 1, "price": 1}
+
+
+class OrderError(ApiError):
+    pass
+
+
+class EmptyCart(OrderError):
+    pass
+
+
+class OrderInProgress(OrderError):
+    status_code = 409
+
+
+class InsufficientStock(OrderError):
+    status_code = 409
+
+
+def price_lines(cart_rows: List[dict], products_by_id: Dict[str, dict]) -> Tuple[List[dict], dict]:
+    """Build order lines from current product prices; rows for deleted products are dropped."""
+    lines = []
+    for row in cart_rows:
+        product = products_by_id.get(row["product_id"])
+        if product is None or row["quantity"] <= 0:
+            continue
+        lines.append({
+            "product_id": product["id"],
+            "name": product["name"],
+            "price": product["price"],
+            "quantity": row["quantity"],
+            "line_total": round(product["price"] * row["quantity"], 2),
+        })
+
+    return lines, order_totals(line["line_total"] for line in lines)
+
+
+def order_totals(line_totals) -> dict:
+    """Subtotal, shipping, tax and total for already-rounded line totals."""
+    subtotal = round(sum(line_totals), 2)
+    shipping = 0.0 if subtotal > FREE_SHIPPING_THRESHOLD else SHIPPING_FEE
+    tax = round(subtotal * TAX_RATE, 2)
+    return {
+        "subtotal": subtotal,
+        "shipping": shipping,
+        "tax": tax,
+        "total": round(subtotal + shipping + tax, 2),
+    }
+
+
+async def reserve_stock(db, lines: List[dict], session=None) -> None:
+    """Decrement stock for every line or for none of them."""
+    reserved = []
+    # Fixed order keeps concurrent transactions from conflicting in opposite orders
+    for line in sorted(lines, key=lambda line: line["product_id"]):
+        # A product soft-deleted since the cart was priced is not sold
+        result = await db.products.update_one(
+            {"id": line["product_id"], "stock": {"$gte": line["quantity"]}, **ACTIVE},
+            # updated_at lets the catalog watcher's poll see the move (see catalog_watch.py)
+            {"$inc": {"stock": -line["quantity"]}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            session=session,
+        )
+        if result.modified_count == 0:
+            await release_stock(db, reserved, session=session)
+            product = await db.products.find_one(
+                {"id": line["product_id"], **ACTIVE}, {"_id": 0, "stock": 1}, session=session
+            )
+            raise InsufficientStock({
+                "message": "Insufficient stock",
+                "items": [{
+                    "product_id": line["product_id"],
+                    "requested": line["quantity"],
+                    "available": product["stock"] if product else 0,
+                }],
+            })
+        reserved.append(line)
+
+
+async def release_stock(db, lines: List[dict], session=None) -> None:
+    for line in lines:
+        await db.products.update_one(
+            {"id": line["product_id"]},
+            {"$inc": {"stock": line["quantity"]}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            session=session,
+        )
+
+
+async def _existing_order(db, user_id: str, idempotency_key: str) -> Optional[dict]:
+    order = await db.orders.find_one(
+        {"user_id": user_id, "idempotency_key": idempotency_key}, {"_id": 0}
+    )
+    if order is not None and order["status"] == "pending":
+        raise OrderInProgress("An order with this idempotency key is still being processed")
+    return order
+
+
+async def place_order(db, client, carts, user_id: str, idempotency_key: str, use_transaction: bool) -> Tuple[dict, bool]:
+    """Check out the user's cart, read and cleared through the ``carts`` store; return ``(order, created)``."""
+    existing = await _existing_order(db, user_id, idempotency_key)
+    if existing is not None:
+        return existing, False
+
+    order = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "idempotency_key": idempotency_key,
+        "status": "pending",
+        "created_at": datetime.now(timezone.utc),
+    }
+    try:
+        await db.orders.insert_one(dict(order))
+    except DuplicateKeyError:
+        # Lost the race with an identical request
+        return await _existing_order(db, user_id, idempotency_key), False
+
+    async def commit(session=None) -> dict:
+        # Read inside the transaction, so an add landing during checkout is either ordered or kept
+        cart_rows = await carts.list_items(user_id, session=session)
+        products = await db.products.find(
+            {"id": {"$in": list({row["product_id"] for row in cart_rows})}, **ACTIVE}, ORDER_PRODUCT_FIELDS,
+            session=session,
+        ).to_list(None)
+        lines, totals = price_lines(cart_rows, {product["id"]: product for product in products})
+        if not lines:
+            raise EmptyCart("Cart is empty")
+
+        placed = {**totals, "items": lines, "status": "placed"}
+        await reserve_stock(db, lines, session=session)
+        try:
+            await db.orders.update_one({"id": order["id"]}, {"$set": placed}, session=session)
+        except BaseException:
+            if session is None:
+                await release_stock(db, lines)
+            raise
+        # Without a transaction, lines changed since the read keep what was added to them
+        await carts.remove_purchased(user_id, cart_rows, session=session)
+        return placed
+
+    try:
+        if use_transaction:
+            async with await client.start_session() as session:
+                placed = await session.with_transaction(commit)
+        else:
+            placed = await commit()
+    except BaseException:
+        # Free the key so the client can retry once the problem is fixed
+        await db.orders.delete_one({"id": order["id"], "status": "pending"})
+        raise
+
+    order.update(placed)
+    return order, True
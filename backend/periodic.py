@@ -0,0 +1,62 @@
+"""Background loops for the API's periodic jobs.
+
+``PeriodicTask`` calls a coroutine function every ``interval`` seconds in an
+asyncio task, from ``start()`` until ``stop()``. A failed call is logged and
+counted in ``errors``; the loop carries on at the next interval. The
+recommendation refresh, cart compaction and the catalog watcher's poll all run
+this way.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+async def cancel(task: Optional[asyncio.Task]) -> None:
+    """Cancel ``task`` and wait until it has stopped."""
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+class PeriodicTask:
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[], Awaitable[object]],
+        interval: float,
+        first_delay: Optional[float] = None,
+    ):
+        self.name = name
+        self.run = run
+        # 0 or less disables the loop
+        self.interval = interval
+        self.first_delay = interval if first_delay is None else min(first_delay, interval)
+        self._task: Optional[asyncio.Task] = None
+
+        self.errors = 0
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run_forever(), name=self.name)
+
+    async def stop(self) -> None:
+        await cancel(self._task)
+        self._task = None
+
+    async def _run_forever(self) -> None:
+        delay = self.first_delay
+        while True:
+            await asyncio.sleep(delay)
+            delay = self.interval
+            try:
+                await self.run()
+            except Exception:
+                self.errors += 1
+                logger.exception("%s failed", self.name)
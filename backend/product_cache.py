@@ -0,0 +1,328 @@
+"""In-process product catalog cache.
+
+Product documents are read on every catalog and cart request but change rarely,
+so they are kept in a bounded LRU cache with a TTL and an approximate memory
+ceiling. Concurrent misses for the same key share a single database fetch.
+
+Out-of-process writers (the seed script, import tools) cannot reach this cache
+directly; they bump a catalog version document instead, which the cache polls
+at most once every ``version_check_interval`` seconds and clears itself on change.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+CATALOG_META_COLLECTION = "catalog_meta"
+CATALOG_VERSION_ID = "catalog"
+
+# Per-object overhead used by the size estimate; exact accounting is not the goal
+_OBJECT_OVERHEAD = 64
+
+_MISSING = object()
+
+
+def _estimate_size(value: Any) -> int:
+    if isinstance(value, dict):
+        return _OBJECT_OVERHEAD + sum(
+            _estimate_size(k) + _estimate_size(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return _OBJECT_OVERHEAD + sum(_estimate_size(v) for v in value)
+    if isinstance(value, (str, bytes)):
+        return _OBJECT_OVERHEAD + len(value)
+    return _OBJECT_OVERHEAD
+
+
+def normalize_list_query(search: Optional[str], category: Optional[str]):
+    """Collapse equivalent list queries onto one cache key."""
+    # Search is case-insensitive and word-based, so case and spacing do not matter
+    search = " ".join(search.casefold().split()) if search else None
+    category = category.strip() if category else None
+    return search or None, category or None
+
+
+async def load_catalog_version(db) -> int:
+    doc = await db[CATALOG_META_COLLECTION].find_one({"_id": CATALOG_VERSION_ID})
+    return doc["version"] if doc else 0
+
+
+async def bump_catalog_version(db) -> int:
+    """Record a product write so every API process drops its cached catalog."""
+    doc = await db[CATALOG_META_COLLECTION].find_one_and_update(
+        {"_id": CATALOG_VERSION_ID},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=True,
+    )
+    return doc["version"]
+
+
+class ProductCache:
+    def __init__(
+        self,
+        ttl_seconds: float = 60.0,
+        max_entries: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        version_loader: Optional[Callable[[], Awaitable[int]]] = None,
+        version_check_interval: float = 5.0,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version_loader = version_loader
+        self.version_check_interval = version_check_interval
+
+        # key -> (expires_at, value, size), least recently used first
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._bytes = 0
+        self._generation = 0
+        self._version: Optional[int] = None
+        self._next_version_check = 0.0
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, version_loader=None) -> "ProductCache":
+        return cls(
+            ttl_seconds=float(os.environ.get('PRODUCT_CACHE_TTL_SECONDS', 60)),
+            max_entries=int(os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', 10_000)),
+            max_bytes=int(os.environ.get('PRODUCT_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+            version_loader=version_loader,
+            version_check_interval=float(os.environ.get('PRODUCT_CACHE_VERSION_CHECK_SECONDS', 5)),
+        )
+
+    # ---------- public API ----------
+
+    async def get_product(self, product_id: str, loader: Callable[[str], Awaitable[Optional[dict]]]):
+        """Return the product document (or None if it does not exist)."""
+        return await self._get(("product", product_id), lambda: loader(product_id))
+
+    async def get_products(
+        self,
+        product_ids: Iterable[str],
+        loader: Callable[[List[str]], Awaitable[Dict[str, dict]]],
+    ) -> Dict[str, dict]:
+        """Return ``{product_id: document}`` for the ids that exist, loading misses in one call."""
+        await self._check_version()
+        product_ids = list(dict.fromkeys(product_ids))
+        found: Dict[str, Any] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        missing: List[str] = []
+
+        for product_id in product_ids:
+            key = ("product", product_id)
+            value = self._lookup(key)
+            if value is not _MISSING:
+                found[product_id] = value
+            elif key in self._inflight:
+                self.coalesced += 1
+                waiting[product_id] = self._inflight[key]
+            else:
+                missing.append(product_id)
+
+        if missing:
+            self.misses += len(missing)
+            generation = self._generation
+            futures = {pid: self._begin(("product", pid)) for pid in missing}
+            try:
+                loaded = await loader(missing)
+            except BaseException as exc:
+                for pid, future in futures.items():
+                    self._fail(("product", pid), future, exc)
+                raise
+            for pid, future in futures.items():
+                self._finish(("product", pid), future, loaded.get(pid), generation)
+                found[pid] = loaded.get(pid)
+
+        for product_id, future in waiting.items():
+            found[product_id] = await future
+
+        return {pid: doc for pid, doc in found.items() if doc is not None}
+
+    async def get_product_page(
+        self,
+        search: Optional[str],
+        category: Optional[str],
+        filters: Hashable,
+        cursor: Optional[str],
+        limit: int,
+        loader: Callable[[Optional[str], Optional[str], Hashable, Optional[str], int], Awaitable[Any]],
+    ):
+        """Return one page of a product listing as produced by ``loader``."""
+        search, category = normalize_list_query(search, category)
+        return await self._get(
+            ("list", search, category, filters, cursor, limit),
+            lambda: loader(search, category, filters, cursor, limit),
+        )
+
+    async def check_version(self) -> None:
+        """Poll the catalog version if it is due, for readers that keep their own derived state."""
+        await self._check_version()
+
+    @property
+    def version(self) -> int:
+        """Last catalog version seen; 0 before the first poll or any catalog write."""
+        return self._version or 0
+
+    async def current_version(self) -> int:
+        """Poll the catalog version if it is due and return it."""
+        await self._check_version()
+        return self.version
+
+    def advance_version(self, version: int) -> None:
+        """Adopt the catalog version this process's own write produced.
+
+        The caller has already invalidated what it changed, so the next poll
+        need not clear the whole cache. If another write came in between, the
+        version skipped a number and the poll clears everything as usual.
+        """
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+
+    def add_invalidation_listener(self, callback: Callable[[Optional[str]], None]) -> None:
+        """Call ``callback(product_id)`` on every invalidation; ``None`` means the whole catalog."""
+        self._listeners.append(callback)
+
+    def invalidate_product(self, product_id: str) -> None:
+        """Drop one product and every cached list, since any list may contain it."""
+        self._generation += 1
+        self.invalidations += 1
+        self._discard(("product", product_id))
+        for key in [k for k in self._entries if k[0] == "list"]:
+            self._discard(key)
+        for callback in self._listeners:
+            callback(product_id)
+
+    def invalidate_products(self, product_ids: Iterable[str], lists: bool = True) -> None:
+        """Drop several products at once; ``lists=False`` keeps cached lists for
+        changes, such as stock moves, that callers accept seeing late in listings."""
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        self._generation += 1
+        self.invalidations += 1
+        for product_id in product_ids:
+            self._discard(("product", product_id))
+        if lists:
+            for key in [k for k in self._entries if k[0] == "list"]:
+                self._discard(key)
+        for product_id in product_ids:
+            for callback in self._listeners:
+                callback(product_id)
+
+    def invalidate_all(self) -> None:
+        self._generation += 1
+        self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+        for callback in self._listeners:
+            callback(None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    # ---------- internals ----------
+
+    async def _get(self, key: Hashable, load: Callable[[], Awaitable[Any]]):
+        await self._check_version()
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await inflight
+
+        self.misses += 1
+        generation = self._generation
+        future = self._begin(key)
+        try:
+            value = await load()
+        except BaseException as exc:
+            self._fail(key, future, exc)
+            raise
+        self._finish(key, future, value, generation)
+        return value
+
+    async def _check_version(self) -> None:
+        if self.version_loader is None:
+            return
+        now = time.monotonic()
+        if now < self._next_version_check:
+            return
+        # Set before awaiting so concurrent requests do not all poll
+        self._next_version_check = now + self.version_check_interval
+        version = await self.version_loader()
+        if self._version is not None and version != self._version:
+            self.invalidate_all()
+        self._version = version
+
+    def _lookup(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self.expirations += 1
+            self._discard(key)
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _begin(self, key: Hashable) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def _finish(self, key: Hashable, future: asyncio.Future, value: Any, generation: int) -> None:
+        self._inflight.pop(key, None)
+        future.set_result(value)
+        # A write landed while we were loading; the value may already be stale
+        if generation == self._generation:
+            self._store(key, value)
+
+    def _fail(self, key: Hashable, future: asyncio.Future, exc: BaseException) -> None:
+        self._inflight.pop(key, None)
+        if isinstance(exc, asyncio.CancelledError):
+            future.cancel()
+            return
+        future.set_exception(exc)
+        # Mark retrieved so a failure with no waiters does not log a warning
+        future.exception()
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
@@ -0,0 +1,437 @@
+"""Related products and per-category best sellers, precomputed for the product page.
+
+    python recommendations.py [--full]
+
+``RecommendationJob`` turns shopping baskets into two read models. The API
+serves each with a single ``_id`` lookup:
+
+* ``related_products`` - ``{_id: product_id, related: [...], scores: [...]}``,
+  the ``top_k`` products most often bought or carted together with it
+* ``popular_products`` - ``{_id: category, products: [...], scores: [...]}``,
+  the category's ``popular_k`` best sellers
+
+A basket is a placed order, or a cart that had a line added. Cart lines count
+``cart_weight`` as much as ordered ones. Running weights live in
+``product_pairs`` (one document per ordered pair of products seen together)
+and ``product_stats`` (per product: weight of the baskets holding it,
+popularity, category). Related products are ranked by cosine similarity,
+``pair / sqrt(baskets_a * baskets_b)``, damped for pairs seen only once or
+twice so two rarely sold products do not top each other's lists.
+
+Runs are incremental. A run reads only the orders and cart lines created since
+the previous one, adds their weights with ``$inc``, and re-ranks the products
+those baskets touched. A product's list therefore follows its own baskets
+straight away, and shifts in its neighbours' popularity at the next full
+rebuild. A run that fails after writing weights counts its baskets again on
+the retry; ``--full`` resets everything.
+
+Weights halve every ``half_life_days``. Rather than shrinking every stored
+weight on each run, a basket from time ``t`` adds
+``2 ** ((t - epoch) / half_life)``. Old weights lose ground to new ones, and
+the scale, common to all of them, cancels out of the rankings. A full rebuild
+reads the last ``HISTORY_HALF_LIVES`` half-lives of baskets and restarts the
+epoch. It runs on ``--full``, on the first run, and before the factor grows
+large enough to lose precision.
+
+Pairing baskets, summing duplicate pairs, scoring and picking each product's
+top K are vectorized with NumPy.
+
+The API runs the job in the background every RECOMMENDATIONS_REFRESH_SECONDS
+(0 leaves it to cron and this script). A lease in ``recommendation_state``
+lets only one run at a time, whether from API workers or cron. A run releases
+the lease only if it still holds it, so one that outlived its lease cannot free
+the lease of the run that took over.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from cart_store import cart_store_from_env
+from catalog_admin import ACTIVE
+from periodic import PeriodicTask
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+STATE_ID = "job"
+# A full rebuild reads this many half-lives back; older baskets would weigh under 1/256
+HISTORY_HALF_LIVES = 8
+# Rebuild before weights pass 2**40 and sums start to lose precision
+MAX_WEIGHT_EXPONENT = 40
+# Larger baskets keep their newest lines, so one basket adds at most 50 * 49 pairs
+MAX_BASKET_LINES = 50
+# Baskets' worth of weight added to every pair's denominator
+PAIR_SHRINK = 1.0
+# Weights gathered in memory are written once a run has this many pairs pending
+FLUSH_PAIRS = 500_000
+WRITE_BATCH_SIZE = 1000
+RANK_BATCH_SIZE = 1000
+STARTUP_DELAY_SECONDS = 30
+
+ORDER_FIELDS = {"_id": 0, "items.product_id": 1, "items.quantity": 1, "created_at": 1}
+PAIR_FIELDS = {"_id": 0, "product_id": 1, "related_id": 1, "weight": 1}
+
+
+def similarity(pair_weight: np.ndarray, baskets_a: np.ndarray, baskets_b: np.ndarray, shrink: float) -> np.ndarray:
+    """Cosine similarity of two products' baskets, damped for pairs with little weight."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosine = np.nan_to_num(pair_weight / np.sqrt(baskets_a * baskets_b))
+    return cosine * pair_weight / (pair_weight + shrink)
+
+
+def top_k_by_group(groups: np.ndarray, scores: np.ndarray, k: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield ``(group, positions of its k highest scores, best first)`` for every group."""
+    order = np.lexsort((-scores, groups))
+    ordered = groups[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    for start, end in zip(starts, ends):
+        yield ordered[start], order[start:min(end, start + k)]
+
+
+class BasketWeights:
+    """Pair and product weights gathered from baskets, summed before they are written."""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.pairs: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.products: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.baskets = 0
+        self.pair_count = 0
+
+    def add_basket(self, product_ids: List[str], weights: np.ndarray, popularity: np.ndarray, new: np.ndarray) -> None:
+        """One basket's lines: product, weight, popularity, and whether the line is new since the last run.
+
+        Every pair with at least one new line is counted, at the newer line's weight.
+        """
+        codes = np.fromiter(
+            (self.index.setdefault(product_id, len(self.index)) for product_id in product_ids),
+            dtype=np.int64, count=len(product_ids),
+        )
+        self.baskets += 1
+        self.products.append((codes[new], weights[new], popularity[new]))
+        if len(codes) < 2:
+            return
+        first, second = np.triu_indices(len(codes), 1)
+        keep = (new[first] | new[second]) & (codes[first] != codes[second])
+        first, second = first[keep], second[keep]
+        weight = np.maximum(weights[first], weights[second])
+        # Both directions, so a product's pairs are one indexed range of product_pairs
+        self.pairs.append((
+            np.concatenate([codes[first], codes[second]]),
+            np.concatenate([codes[second], codes[first]]),
+            np.concatenate([weight, weight]),
+        ))
+        self.pair_count += 2 * len(weight)
+
+    def pair_totals(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """``(product_ids, related_ids, weights)`` with repeated pairs summed."""
+        if not self.pairs:
+            empty = np.array([], dtype=object)
+            return empty, empty, np.array([])
+        owners, others, weights = (np.concatenate(parts) for parts in zip(*self.pairs))
+        size = len(self.index)
+        keys, inverse = np.unique(owners * size + others, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=weights)
+        ids = np.array(list(self.index), dtype=object)
+        return ids[keys // size], ids[keys % size], totals
+
+    def product_totals(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """``(product_ids, basket weights, popularity)`` for every product with a new line."""
+        codes, baskets, popularity = (np.concatenate(parts) for parts in zip(*self.products))
+        size = len(self.index)
+        baskets = np.bincount(codes, weights=baskets, minlength=size)
+        popularity = np.bincount(codes, weights=popularity, minlength=size)
+        seen = np.bincount(codes, minlength=size) > 0
+        ids = np.array(list(self.index), dtype=object)
+        return ids[seen], baskets[seen], popularity[seen]
+
+
+class RecommendationJob:
+    def __init__(
+        self,
+        db,
+        carts,
+        top_k: int = 20,
+        popular_k: int = 50,
+        half_life_days: float = 30.0,
+        cart_weight: float = 0.5,
+        settle_seconds: float = 60.0,
+        refresh_interval: float = 900.0,
+        lease_seconds: float = 1800.0,
+    ):
+        self.db = db
+        self.carts = carts
+        self.top_k = top_k
+        self.popular_k = popular_k
+        self.half_life = timedelta(days=half_life_days)
+        self.cart_weight = cart_weight
+        # Orders and cart lines younger than this are left to the next run, so slow commits are not skipped
+        self.settle = timedelta(seconds=settle_seconds)
+        self.refresh_interval = refresh_interval
+        self.lease = timedelta(seconds=lease_seconds)
+        self._periodic = PeriodicTask(
+            "Recommendation refresh", self.run, refresh_interval, first_delay=STARTUP_DELAY_SECONDS
+        )
+
+        self.runs = 0
+        self.last_run_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, db, carts) -> "RecommendationJob":
+        return cls(
+            db,
+            carts,
+            top_k=int(os.environ.get('RECOMMENDATIONS_TOP_K', 20)),
+            popular_k=int(os.environ.get('RECOMMENDATIONS_POPULAR_K', 50)),
+            half_life_days=float(os.environ.get('RECOMMENDATIONS_HALF_LIFE_DAYS', 30)),
+            cart_weight=float(os.environ.get('RECOMMENDATIONS_CART_WEIGHT', 0.5)),
+            refresh_interval=float(os.environ.get('RECOMMENDATIONS_REFRESH_SECONDS', 900)),
+        )
+
+    @property
+    def errors(self) -> int:
+        return self._periodic.errors
+
+    async def start(self) -> None:
+        self._periodic.start()
+
+    async def stop(self) -> None:
+        await self._periodic.stop()
+
+    async def run(self, full: bool = False) -> Optional[dict]:
+        """Refresh the recommendations; None if another process is already refreshing them."""
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        state = await self._take_lease(now)
+        if state is None:
+            logger.info("Recommendation refresh skipped: another process holds the lease")
+            return None
+        try:
+            summary = await self._refresh(state, now, full)
+        finally:
+            await self.db.recommendation_state.update_one(
+                {"_id": STATE_ID, "lease_until": state["lease_until"]}, {"$set": {"lease_until": None}}
+            )
+        self.runs += 1
+        self.last_run_seconds = time.perf_counter() - started
+        logger.info(
+            "Recommendations refreshed (%s) in %.2fs: %d baskets, %d products re-ranked",
+            "full" if summary["full"] else "incremental", self.last_run_seconds,
+            summary["baskets"], summary["products"],
+        )
+        return summary
+
+    async def _take_lease(self, now: datetime) -> Optional[dict]:
+        try:
+            return await self.db.recommendation_state.find_one_and_update(
+                {"_id": STATE_ID, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+                {"$set": {"lease_until": now + self.lease}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The state exists and its lease has not run out
+            return None
+
+    async def _refresh(self, state: dict, now: datetime, full: bool) -> dict:
+        until = now - self.settle
+        epoch = state["epoch"] if state.get("epoch") else None
+        full = full or epoch is None or self._exponent(until, epoch) > MAX_WEIGHT_EXPONENT
+        if full:
+            epoch = until
+            since = until - HISTORY_HALF_LIVES * self.half_life
+            await self.db.product_pairs.delete_many({})
+            await self.db.product_stats.delete_many({})
+        else:
+            since = state["since"]
+
+        weights = BasketWeights()
+        touched: Set[str] = set()
+        baskets = 0
+
+        async def flush_if_full():
+            nonlocal weights, baskets
+            if weights.pair_count >= FLUSH_PAIRS:
+                touched.update(await self._write(weights))
+                baskets += weights.baskets
+                weights = BasketWeights()
+
+        async for order in self.db.orders.find(
+            {"status": "placed", "created_at": {"$gt": since, "$lte": until}}, ORDER_FIELDS
+        ):
+            items = order["items"][:MAX_BASKET_LINES]
+            weight = np.exp2(self._exponent(order["created_at"], epoch))
+            weights.add_basket(
+                [item["product_id"] for item in items],
+                np.full(len(items), weight),
+                weight * np.array([item["quantity"] for item in items], dtype=float),
+                np.ones(len(items), dtype=bool),
+            )
+            await flush_if_full()
+
+        async for lines in self.carts.baskets_since(since, until):
+            lines = sorted(lines, key=lambda line: line["created_at"])[-MAX_BASKET_LINES:]
+            created = [line["created_at"] for line in lines]
+            line_weights = self.cart_weight * np.exp2(
+                np.array([self._exponent(at, epoch) for at in created])
+            )
+            weights.add_basket(
+                [line["product_id"] for line in lines],
+                line_weights,
+                line_weights,
+                np.array([since < at <= until for at in created]),
+            )
+            await flush_if_full()
+
+        touched.update(await self._write(weights))
+        baskets += weights.baskets
+        if full:
+            touched.update(await self.db.product_stats.distinct("_id"))
+
+        ranked = sorted(touched)
+        scale = np.exp2(self._exponent(until, epoch))
+        for start in range(0, len(ranked), RANK_BATCH_SIZE):
+            batch = ranked[start:start + RANK_BATCH_SIZE]
+            await self._set_categories(batch)
+            await self._rank_related(batch, scale, now)
+        if ranked:
+            await self._rank_popular(scale, now)
+        if full:
+            # Products with no baskets left in the history window
+            await self.db.related_products.delete_many({"updated_at": {"$lt": now}})
+
+        await self.db.recommendation_state.update_one(
+            {"_id": STATE_ID}, {"$set": {"epoch": epoch, "since": until, "refreshed_at": now}}
+        )
+        return {"full": full, "baskets": baskets, "products": len(ranked)}
+
+    def _exponent(self, at: datetime, epoch: datetime) -> float:
+        return (at - epoch) / self.half_life
+
+    async def _write(self, weights: BasketWeights) -> Set[str]:
+        """Add the gathered weights to the stored ones; return the products whose lists may have changed."""
+        if not weights.products:
+            return set()
+        owners, others, totals = weights.pair_totals()
+        await _bulk_write(self.db.product_pairs, [
+            UpdateOne({"product_id": owner, "related_id": other}, {"$inc": {"weight": float(total)}}, upsert=True)
+            for owner, other, total in zip(owners, others, totals)
+        ])
+        product_ids, baskets, popularity = weights.product_totals()
+        await _bulk_write(self.db.product_stats, [
+            UpdateOne({"_id": product_id}, {"$inc": {"baskets": float(b), "popularity": float(p)}}, upsert=True)
+            for product_id, b, p in zip(product_ids, baskets, popularity)
+        ])
+        return set(owners) | set(product_ids)
+
+    async def _set_categories(self, product_ids: List[str]) -> None:
+        """Copy each product's category onto its stats; deleted products get none, so they rank nowhere."""
+        products = await self.db.products.find(
+            {"id": {"$in": product_ids}, **ACTIVE}, {"_id": 0, "id": 1, "category": 1}
+        ).to_list(None)
+        categories = {product["id"]: product["category"] for product in products}
+        await _bulk_write(self.db.product_stats, [
+            UpdateOne({"_id": product_id}, {"$set": {"category": categories.get(product_id)}})
+            for product_id in product_ids
+        ])
+
+    async def _rank_related(self, product_ids: List[str], scale: float, now: datetime) -> None:
+        pairs = await self.db.product_pairs.find({"product_id": {"$in": product_ids}}, PAIR_FIELDS).to_list(None)
+        if not pairs:
+            return
+        index: Dict[str, int] = {}
+        owners = np.fromiter((index.setdefault(p["product_id"], len(index)) for p in pairs), np.int64, len(pairs))
+        others = np.fromiter((index.setdefault(p["related_id"], len(index)) for p in pairs), np.int64, len(pairs))
+        pair_weights = np.fromiter((p["weight"] for p in pairs), float, len(pairs))
+        ids = np.array(list(index), dtype=object)
+        baskets = np.zeros(len(ids))
+        async for stat in self.db.product_stats.find({"_id": {"$in": list(index)}}, {"baskets": 1}):
+            baskets[index[stat["_id"]]] = stat["baskets"]
+
+        # The shrink is in baskets as of now, the same scale as the stored weights
+        scores = similarity(pair_weights, baskets[owners], baskets[others], PAIR_SHRINK * scale)
+        await _bulk_write(self.db.related_products, [
+            ReplaceOne(
+                {"_id": ids[owner]},
+                {
+                    "related": ids[others[best]].tolist(),
+                    "scores": np.round(scores[best], 4).tolist(),
+                    "updated_at": now,
+                },
+                upsert=True,
+            )
+            for owner, best in top_k_by_group(owners, scores, self.top_k)
+        ])
+
+    async def _rank_popular(self, scale: float, now: datetime) -> None:
+        stats = await self.db.product_stats.find(
+            {"category": {"$ne": None}}, {"category": 1, "popularity": 1}
+        ).to_list(None)
+        if not stats:
+            await self.db.popular_products.delete_many({})
+            return
+        ids = np.array([stat["_id"] for stat in stats], dtype=object)
+        categories, codes = np.unique(np.array([stat["category"] for stat in stats]), return_inverse=True)
+        # Scores in units sold (carted ones at cart_weight) as of now, after decay
+        popularity = np.fromiter((stat["popularity"] for stat in stats), float, len(stats)) / scale
+        await _bulk_write(self.db.popular_products, [
+            ReplaceOne(
+                {"_id": str(categories[code])},
+                {"products": ids[best].tolist(), "scores": np.round(popularity[best], 3).tolist(), "updated_at": now},
+                upsert=True,
+            )
+            for code, best in top_k_by_group(codes.ravel(), popularity, self.popular_k)
+        ])
+        await self.db.popular_products.delete_many({"_id": {"$nin": categories.tolist()}})
+
+
+async def related_product_ids(db, product_id: str, category: str) -> List[str]:
+    """Products to show with ``product_id``: its related products, then its category's best sellers."""
+    related, popular = await asyncio.gather(
+        db.related_products.find_one({"_id": product_id}, {"related": 1}),
+        db.popular_products.find_one({"_id": category}, {"products": 1}),
+    )
+    candidates = (related or {}).get("related", []) + (popular or {}).get("products", [])
+    return [candidate for candidate in dict.fromkeys(candidates) if candidate != product_id]
+
+
+async def _bulk_write(collection, operations: list) -> None:
+    for start in range(0, len(operations), WRITE_BATCH_SIZE):
+        await collection.bulk_write(operations[start:start + WRITE_BATCH_SIZE], ordered=False)
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+    try:
+        job = RecommendationJob.from_env(db, cart_store_from_env(db))
+        summary = await job.run(full=args.full)
+        if summary is None:
+            print("Another process is refreshing recommendations; try again later")
+            return
+        print(
+            f"{'Rebuilt' if summary['full'] else 'Updated'} recommendations in {job.last_run_seconds:.1f}s: "
+            f"{summary['baskets']} baskets read, {summary['products']} products re-ranked"
+        )
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute related products and category best sellers")
+    parser.add_argument("--full", action="store_true", help="rebuild from the order and cart history")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,237 @@
+"""In-process inverted index for product search.
+
+Replaces the unanchored, case-insensitive ``$regex`` on product names. Products
+are tokenized over name, description and category; each term keeps a posting
+list of ``{product_id: weight}`` and the vocabulary is kept sorted so the last
+query word can be prefix-matched for type-ahead.
+
+User input is only ever tokenized, never compiled into a pattern, so there is
+nothing to escape and no way to send a pathological regex.
+
+The index is rebuilt lazily after a catalog-wide invalidation and patched
+incrementally when individual products are invalidated.
+"""
+import asyncio
+import bisect
+import heapq
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+SEARCH_FIELDS = {"_id": 0, "id": 1, **{field: 1 for field in FIELD_WEIGHTS}}
+
+# Prefix matches score lower than an exact word match
+PREFIX_FACTOR = 0.6
+# Shorter trailing words only match exactly, to keep "a" from expanding to the whole vocabulary
+MIN_PREFIX_LENGTH = 2
+MAX_QUERY_TOKENS = 8
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Casefold, strip accents and split on non-word characters."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN_RE.findall(text)
+
+
+class ProductSearchIndex:
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Set[str]] = {}
+        self._categories: Dict[str, str] = {}
+        self._names: Dict[str, str] = {}
+        self._terms: List[str] = []
+
+        self._needs_rebuild = True
+        self._stale_ids: Set[str] = set()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    # ---------- maintenance ----------
+
+    def build(self, products: Iterable[dict]) -> None:
+        """Replace the whole index with ``products``."""
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._categories = {}
+        self._names = {}
+        for product in products:
+            self._index(product)
+        self._terms = sorted(self._postings)
+
+    def add(self, product: dict) -> None:
+        """Insert or replace a single product."""
+        self.remove(product["id"])
+        for term in self._index(product):
+            bisect.insort(self._terms, term)
+
+    def remove(self, product_id: str) -> None:
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self._categories.pop(product_id, None)
+        self._names.pop(product_id, None)
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                index = bisect.bisect_left(self._terms, term)
+                if index < len(self._terms) and self._terms[index] == term:
+                    del self._terms[index]
+
+    def mark_stale(self, product_id: Optional[str] = None) -> None:
+        """Invalidation hook: ``None`` schedules a full rebuild, an id a single re-index."""
+        if product_id is None:
+            self._needs_rebuild = True
+            self._stale_ids.clear()
+        else:
+            self._stale_ids.add(product_id)
+
+    async def refresh(
+        self,
+        load_all: Callable[[], Awaitable[List[dict]]],
+        load_some: Callable[[List[str]], Awaitable[Dict[str, dict]]],
+    ) -> None:
+        """Apply pending invalidations; concurrent callers wait for one refresh."""
+        if not self._needs_rebuild and not self._stale_ids:
+            return
+        async with self._lock:
+            if self._needs_rebuild:
+                self._needs_rebuild = False
+                self._stale_ids.clear()
+                try:
+                    self.build(await load_all())
+                except BaseException:
+                    self._needs_rebuild = True
+                    raise
+            elif self._stale_ids:
+                stale_ids = list(self._stale_ids)
+                self._stale_ids.clear()
+                try:
+                    found = await load_some(stale_ids)
+                except BaseException:
+                    self._stale_ids.update(stale_ids)
+                    raise
+                for product_id in stale_ids:
+                    if product_id in found:
+                        self.add(found[product_id])
+                    else:
+                        self.remove(product_id)
+
+    def _index(self, product: dict) -> List[str]:
+        """Add postings for ``product``; return terms that are new to the vocabulary."""
+        product_id = product["id"]
+        weights: Dict[str, float] = defaultdict(float)
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for term in tokenize(product.get(field) or ""):
+                weights[term] += field_weight
+
+        new_terms = []
+        for term, weight in weights.items():
+            postings = self._postings[term]
+            if not postings:
+                new_terms.append(term)
+            postings[product_id] = weight
+        self._doc_terms[product_id] = set(weights)
+        self._categories[product_id] = product.get("category")
+        self._names[product_id] = product.get("name") or ""
+        return new_terms
+
+    # ---------- querying ----------
+
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        limit: int = 1000,
+        where: Optional[Callable[[str], bool]] = None,
+    ) -> List[str]:
+        """Return product ids matching every query word, best match first.
+
+        All words but the last must match a whole term; the last word also
+        matches as a prefix so results update while the user is typing.
+        ``where`` drops ids before ranking, e.g. to apply price and stock filters.
+        """
+        tokens = tokenize(query)[:MAX_QUERY_TOKENS]
+        if not tokens:
+            return []
+
+        matches = []
+        for position, token in enumerate(tokens):
+            is_last = position == len(tokens) - 1
+            terms = self._expand(token) if is_last else ([token] if token in self._postings else [])
+            if not terms:
+                return []
+            matches.append((sum(len(self._postings[t]) for t in terms), token, terms))
+
+        # Start from the rarest word so later words only score surviving candidates
+        matches.sort(key=lambda match: match[0])
+        scores: Optional[Dict[str, float]] = None
+        for _, token, terms in matches:
+            token_scores = self._score_terms(token, terms, candidates=scores)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: scores[pid] + s for pid, s in token_scores.items()}
+            if not scores:
+                return []
+
+        if category is not None:
+            scores = {pid: s for pid, s in scores.items() if self._categories.get(pid) == category}
+        if where is not None:
+            scores = {pid: s for pid, s in scores.items() if where(pid)}
+
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda kv: (-kv[1], self._names[kv[0]], kv[0]))
+        return [product_id for product_id, _ in ranked]
+
+    def _expand(self, token: str) -> List[str]:
+        if len(token) < MIN_PREFIX_LENGTH:
+            return [token] if token in self._postings else []
+        start = bisect.bisect_left(self._terms, token)
+        end = bisect.bisect_left(self._terms, token + "\U0010ffff", lo=start)
+        return self._terms[start:end]
+
+    def _score_terms(
+        self, token: str, terms: List[str], candidates: Optional[Dict[str, float]] = None
+    ) -> Dict[str, float]:
+        """Best-matching term per product, weighted by field and inverse document frequency.
+
+        With ``candidates``, only those products are scored; whichever of the
+        candidate set or the posting lists is smaller is the one iterated.
+        """
+        total = len(self._doc_terms)
+        if len(terms) == 1:
+            # Common case (whole word, or a prefix of exactly one term): no max() merging needed
+            postings = self._postings[terms[0]]
+            factor = math.log(1 + total / len(postings)) * (1.0 if terms[0] == token else PREFIX_FACTOR)
+            if candidates is None:
+                return {pid: weight * factor for pid, weight in postings.items()}
+            if len(candidates) < len(postings):
+                return {pid: postings[pid] * factor for pid in candidates if pid in postings}
+            return {pid: weight * factor for pid, weight in postings.items() if pid in candidates}
+
+        scores: Dict[str, float] = {}
+        for term in terms:
+            postings = self._postings[term]
+            factor = math.log(1 + total / len(postings))
+            if term != token:
+                factor *= PREFIX_FACTOR
+            if candidates is not None and len(candidates) < len(postings):
+                pairs = ((pid, postings[pid]) for pid in candidates if pid in postings)
+            else:
+                pairs = postings.items()
+            for product_id, weight in pairs:
+                if candidates is not None and product_id not in candidates:
+                    continue
+                score = weight * factor
+                if score > scores.get(product_id, 0.0):
+                    scores[product_id] = score
+        return scores
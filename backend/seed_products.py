@@ -7,6 +7,8 @@ from pathlib import Path
 from datetime import datetime, timezone
 import uuid
 
+from import_products import import_products
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -23,7 +25,7 @@ products = [
         "category": "Electronics",
         "image": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=500&h=500&fit=crop",
         "stock": 50,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -33,7 +35,7 @@ products = [
         "category": "Electronics",
         "image": "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=500&h=500&fit=crop",
         "stock": 30,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -43,7 +45,7 @@ products = [
         "category": "Fashion",
         "image": "https://images.unsplash.com/photo-1553062407-98eeb64c6a62?w=500&h=500&fit=crop",
         "stock": 25,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -53,7 +55,7 @@ products = [
         "category": "Fashion",
         "image": "https://images.unsplash.com/photo-1521572163474-6864f9cf17ab?w=500&h=500&fit=crop",
         "stock": 100,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -63,7 +65,7 @@ products = [
         "category": "Electronics",
         "image": "https://images.unsplash.com/photo-1606406308915-8cdb5d6d0d0f?w=500&h=500&fit=crop",
         "stock": 15,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -73,7 +75,7 @@ products = [
         "category": "Sports",
         "image": "https://images.unsplash.com/photo-1601925260368-ae2f83cf8b7f?w=500&h=500&fit=crop",
         "stock": 60,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -83,7 +85,7 @@ products = [
         "category": "Sports",
         "image": "https://images.unsplash.com/photo-1602143407151-7111542de6e8?w=500&h=500&fit=crop",
         "stock": 80,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -93,7 +95,7 @@ products = [
         "category": "Fashion",
         "image": "https://images.unsplash.com/photo-1572635196237-14b3f281503f?w=500&h=500&fit=crop",
         "stock": 40,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -103,7 +105,7 @@ products = [
         "category": "Electronics",
         "image": "https://images.unsplash.com/photo-1595225476474-87563907a212?w=500&h=500&fit=crop",
         "stock": 35,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -113,7 +115,7 @@ products = [
         "category": "Sports",
         "image": "https://images.unsplash.com/photo-1542291026-7eec264c27ff?w=500&h=500&fit=crop",
         "stock": 45,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -123,7 +125,7 @@ products = [
         "category": "Home",
         "image": "https://images.unsplash.com/photo-1507473885765-e6ed057f782c?w=500&h=500&fit=crop",
         "stock": 55,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     },
     {
         "id": str(uuid.uuid4()),
@@ -133,19 +135,17 @@ products = [
         "category": "Electronics",
         "image": "https://images.unsplash.com/photo-1608043152269-423dbba4e7e1?w=500&h=500&fit=crop",
         "stock": 70,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
 ]
 
 async def seed_database():
     try:
-        # Clear existing products
-        await db.products.delete_many({})
-        print("Cleared existing products")
-        
-        # Insert new products
-        result = await db.products.insert_many(products)
-        print(f"Successfully seeded {len(result.inserted_ids)} products")
+        # Swap the sample catalog in through a shadow collection, so the API never
+        # sees an empty products collection; this also bumps the catalog version
+        rows = ((line, product, None) for line, product in enumerate(products, start=1))
+        stats = await import_products(db, rows, mode="replace")
+        print(f"Successfully seeded {stats.upserted} products")
         
         # Display seeded products
         for product in products:
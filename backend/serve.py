@@ -0,0 +1,106 @@
+"""Run the API with one worker process per core.
+
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 8001] [--graceful-timeout 30]
+
+Each worker is a separate uvicorn process importing ``server:app``. The Motor
+client, the password hashing pool and the shared state connection are all
+created inside the worker (the Mongo client in the lifespan), so nothing
+opened before the fork is ever shared between processes.
+
+Workers only agree on rate limits, cached responses and token revocations
+through the shared state backend, so with more than one worker set
+SHARED_STATE=redis and SHARED_STATE_URL (see shared_state.py). Metrics are
+summed across workers through PROMETHEUS_MULTIPROC_DIR, a scratch directory
+created here unless it is set (see metrics.py).
+
+On SIGTERM or SIGINT the workers stop accepting connections, let in-flight
+requests finish for up to ``--graceful-timeout`` seconds, then run the
+lifespan shutdown: pending cache deletes are flushed and the Redis and Mongo
+clients are closed.
+
+gunicorn.conf.py runs the same app under gunicorn for deployments that
+prefer it as the process manager.
+"""
+import argparse
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import uvicorn
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers() -> int:
+    return int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+
+
+def configure_worker_env(workers: int) -> None:
+    """Settings that depend on how many processes share the machine; explicit values win."""
+    # Split the cores between the workers' bcrypt pools instead of giving each one min(4, cores)
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+    if workers > 1 and os.environ.get('SHARED_STATE', 'memory').lower() == 'memory':
+        logger.warning(
+            "Running %d workers with SHARED_STATE=memory: each worker keeps its own "
+            "rate limits and response cache. Set SHARED_STATE=redis to share them.",
+            workers,
+        )
+    if workers > 1:
+        configure_multiprocess_metrics()
+
+
+def configure_multiprocess_metrics() -> None:
+    """Point prometheus_client at an empty directory shared by the workers, before any of them starts."""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        # Files left by a previous run would be summed into this one
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        for stale in Path(directory).glob("*.db"):
+            stale.unlink()
+        return
+    directory = tempfile.mkdtemp(prefix="shophub-metrics-")
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = directory
+    launcher = os.getpid()
+
+    def remove_directory():
+        # Forked workers inherit atexit hooks; only the launcher removes the directory
+        if os.getpid() == launcher:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    atexit.register(remove_directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--host", default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument("--port", type=int, default=int(os.environ.get('PORT', 8001)))
+    parser.add_argument(
+        "--graceful-timeout", type=float, default=float(os.environ.get('GRACEFUL_TIMEOUT_SECONDS', 30))
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    configure_worker_env(args.workers)
+    # Workers re-import the app from its module path, so it must be given as a string
+    uvicorn.run(
+        "server:app",
+        app_dir=str(ROOT_DIR),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,136 +1,428 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, Body, HTTPException, Depends, Header, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Annotated, List, Optional, Tuple
+import base64
+import hashlib
+import json
+import time
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
+import orjson
+from product_cache import ProductCache, bump_catalog_version, load_catalog_version, normalize_list_query
+from auth_cache import VerifiedUserCache, TokenRevocationList
+from password_hashing import PasswordHasher, PasswordPoolSaturated
+from search_index import ProductSearchIndex, SEARCH_FIELDS
+from facet_index import CatalogFilter, FACET_FIELDS, ProductFacets
+from models import (
+    User, UserCreate, UserLogin, UserResponse, AuthenticatedUser, TokenResponse, Product, ProductCreate,
+    ProductPatch, ProductBulkPatch, BulkPatchResponse, CartItemCreate, CartItemUpdate, CartSummary,
+    CartItemResponse, CartDeleteResponse, CartSyncItemResult, CartSyncResponse, OrderResponse,
+)
+from cart_summary import CartSummaryCache
+from cart_compaction import CartCompactor
+from cart_store import CartStore, cart_store_from_env
+from http_cache import CACHEABLE_PATHS, HTTPCacheMiddleware, ResponseCache, etag_matches
+from compression import CompressionMiddleware, CompressionPolicy, ResponseCompressor
+from admission import AdmissionMiddleware, ConcurrencyLimiter, RateLimiter, RatePolicy, retry_after
+from shared_state import shared_state_from_env
+from catalog_watch import CatalogWatcher, ProductChange, StockEvents
+from db_indexes import bootstrap_indexes, PRODUCT_PAGE_SORT
+from orders import place_order
+from recommendations import RecommendationJob, related_product_ids
+from catalog_admin import ACTIVE, bulk_patch, create_product, delete_product, patch_product
+from mongo_pool import MongoPoolSettings, PoolMonitor, create_client, is_replicated, warm_pool, ping_latency_ms
+from metrics import (
+    METRICS_ENABLED, METRICS_PUBLISH_SECONDS, MULTIPROCESS, AUTH_FAILURES, JSON_ENCODE_SECONDS,
+    PASSWORD_HASH_SECONDS, CommandMetrics, MetricsMiddleware, publish_stats, render_metrics, retire_worker,
+    stats_collector,
+)
+from periodic import PeriodicTask
+from errors import ApiError
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection; the client is created in the lifespan, not at import
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+mongo_settings = MongoPoolSettings.from_env()
+pool_monitor = PoolMonitor()
+client = None
+db = None
+
+# Response cache entries, rate-limit buckets and revocation stamps; Redis when several workers run
+shared_state = shared_state_from_env()
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher.from_env()
 security = HTTPBearer()
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
-
-# Create the main app
-app = FastAPI()
+# "claims": trust verified token claims; "database": look the user up on every request
+AUTH_MODE = os.environ.get('AUTH_MODE', 'claims')
+
+# Guest carts larger than this are rejected by /api/cart/sync
+CART_SYNC_MAX_ITEMS = int(os.environ.get('CART_SYNC_MAX_ITEMS', 200))
+
+# Accounts allowed to write the catalog through /api/admin
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+# Bulk product patches larger than this are rejected; accepted ones are written in batches
+ADMIN_BULK_MAX_ITEMS = int(os.environ.get('ADMIN_BULK_MAX_ITEMS', 1000))
+ADMIN_BULK_BATCH_SIZE = int(os.environ.get('ADMIN_BULK_BATCH_SIZE', 500))
+
+# Checkout transactions: "auto" uses them when the deployment is a replica set
+ORDER_TRANSACTIONS = os.environ.get('ORDER_TRANSACTIONS', 'auto')
+use_order_transactions = ORDER_TRANSACTIONS == 'on'
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db, token_revocations, carts, use_order_transactions, catalog_watcher, recommendation_job, cart_compactor
+    client = create_client(
+        mongo_url, mongo_settings, [pool_monitor, CommandMetrics()] if METRICS_ENABLED else [pool_monitor]
+    )
+    db = client[os.environ['DB_NAME']]
+    token_revocations = TokenRevocationList.from_env(db, shared_state)
+    carts = cart_store_from_env(db)
+    # Open pooled connections before the first request has to
+    await warm_pool(client, mongo_settings.warmup_connections)
+    await bootstrap_indexes(db, mode=os.environ.get('INDEX_PLAN_CHECK', 'warn'))
+    if ORDER_TRANSACTIONS == 'auto':
+        use_order_transactions = await is_replicated(client)
+    # Product writes from other processes reach the caches and stock streams through the watcher
+    catalog_watcher = CatalogWatcher.from_env(db.products, apply_catalog_change)
+    await catalog_watcher.start()
+    recommendation_job = RecommendationJob.from_env(db, carts)
+    await recommendation_job.start()
+    cart_compactor = CartCompactor.from_env(db, carts)
+    await cart_compactor.start()
+    metrics_publisher.start()
+    yield
+    # The server has stopped accepting requests and finished the in-flight ones (see serve.py)
+    await metrics_publisher.stop()
+    await cart_compactor.stop()
+    await recommendation_job.stop()
+    await catalog_watcher.stop()
+    await response_cache.drain()
+    await shared_state.close()
+    password_hasher.shutdown()
+    retire_worker()
+    client.close()
+
+# Create the main app. Routes returning models are encoded by orjson instead of json.dumps
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
-# ============ MODELS ============
-
-class User(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    email: EmailStr
-    name: str
-    password_hash: str
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-
-class UserCreate(BaseModel):
-    email: EmailStr
-    name: str
-    password: str
-
-class UserLogin(BaseModel):
-    email: EmailStr
-    password: str
-
-class UserResponse(BaseModel):
-    id: str
-    email: str
-    name: str
-
-class TokenResponse(BaseModel):
-    access_token: str
-    token_type: str
-    user: UserResponse
-
-class Product(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    name: str
-    description: str
-    price: float
-    category: str
-    image: str
-    stock: int = 100
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-
-class CartItem(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    user_id: str
-    product_id: str
-    quantity: int
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-
-class CartItemCreate(BaseModel):
-    product_id: str
-    quantity: int = 1
-
-class CartItemUpdate(BaseModel):
-    quantity: int
-
-class CartItemResponse(BaseModel):
-    id: str
-    product: Product
-    quantity: int
+@app.exception_handler(ApiError)
+async def api_error_handler(request: Request, exc: ApiError):
+    # Refusals from orders.py and catalog_admin.py, answered like an HTTPException
+    return ORJSONResponse({"detail": exc.detail}, status_code=exc.status_code)
 
 # ============ AUTH UTILITIES ============
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def password_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many authentication requests, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def hash_password(password: str) -> str:
+    start = time.perf_counter()
+    try:
+        return await password_hasher.hash(password)
+    except PasswordPoolSaturated:
+        raise password_pool_busy()
+    finally:
+        PASSWORD_HASH_SECONDS.labels("hash").observe(time.perf_counter() - start)
+
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Return ``(valid, new_hash)``; ``new_hash`` is set when the bcrypt cost factor changed."""
+    start = time.perf_counter()
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordPoolSaturated:
+        raise password_pool_busy()
+    finally:
+        PASSWORD_HASH_SECONDS.labels("verify").observe(time.perf_counter() - start)
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # Sub-second iat so a token issued right after a revocation cutoff is not caught by it
+    to_encode.update({"exp": expire, "iat": now.timestamp(), "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+def user_token_claims(user: User) -> dict:
+    return {"sub": user.id, "email": user.email, "name": user.name}
+
+user_cache = VerifiedUserCache.from_env()
+token_revocations: Optional[TokenRevocationList] = None  # bound to the client in the lifespan
+carts: Optional[CartStore] = None  # CART_STORE engine, bound in the lifespan
+
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     try:
         token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
+            AUTH_FAILURES.labels("invalid_token").inc()
             raise HTTPException(status_code=401, detail="Invalid token")
     except jwt.ExpiredSignatureError:
+        AUTH_FAILURES.labels("expired_token").inc()
         raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
+        AUTH_FAILURES.labels("invalid_token").inc()
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if user_doc is None:
-        raise HTTPException(status_code=401, detail="User not found")
+    await token_revocations.sync()
+    if token_revocations.is_revoked(payload):
+        AUTH_FAILURES.labels("revoked_token").inc()
+        raise HTTPException(status_code=401, detail="Token revoked")
     
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
+    return payload
+
+async def get_verified_user(claims: dict = Depends(get_token_claims)) -> User:
+    """Full user record for endpoints that need more than the token claims."""
+    user_id = claims["sub"]
+    user_doc = user_cache.get(user_id)
+    if user_doc is None:
+        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
+        if user_doc is None:
+            AUTH_FAILURES.labels("unknown_user").inc()
+            raise HTTPException(status_code=401, detail="User not found")
+        user_cache.put(user_id, user_doc)
     
     return User(**user_doc)
 
+async def get_current_user(claims: dict = Depends(get_token_claims)) -> AuthenticatedUser:
+    # Tokens issued before claims were embedded only carry "sub"
+    if AUTH_MODE == "claims" and claims.get("email") and claims.get("name"):
+        return AuthenticatedUser(id=claims["sub"], email=claims["email"], name=claims["name"])
+    
+    user = await get_verified_user(claims)
+    return AuthenticatedUser(id=user.id, email=user.email, name=user.name)
+
+async def get_admin_user(current_user: AuthenticatedUser = Depends(get_current_user)) -> AuthenticatedUser:
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+async def revoke_user_sessions(user_id: str) -> None:
+    """Hook for password changes: invalidate every token already issued to the user."""
+    user_cache.invalidate(user_id)
+    await token_revocations.revoke_user_tokens(user_id, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+# ============ RATE LIMITS ============
+
+# Anonymous auth routes are keyed by client IP, signed-in routes by user id
+rate_limiter = RateLimiter.from_env(shared_state, {
+    "login": RatePolicy("ip", 10, 60),
+    "register": RatePolicy("ip", 5, 60),
+    "cart": RatePolicy("user", 120, 60, burst=30),
+    "cart_sync": RatePolicy("user", 10, 60),
+    "orders": RatePolicy("user", 10, 60),
+})
+concurrency_limiter = ConcurrencyLimiter.from_env()
+# Only behind a proxy that sets X-Forwarded-For; otherwise clients could pick their own key
+TRUST_FORWARDED_FOR = os.environ.get('RATE_LIMIT_TRUST_FORWARDED_FOR', 'false').lower() == 'true'
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def enforce_rate_limit(policy: str, key: str) -> None:
+    wait = await rate_limiter.check(policy, key)
+    if wait > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": retry_after(wait)},
+        )
+
+def rate_limited(policy: str):
+    """Route dependency applying a rate policy, keyed as the policy says."""
+    if rate_limiter.policies[policy].key == "user":
+        async def check_user(current_user: AuthenticatedUser = Depends(get_current_user)):
+            await enforce_rate_limit(policy, current_user.id)
+        return Depends(check_user)
+    
+    async def check_ip(request: Request):
+        await enforce_rate_limit(policy, client_ip(request))
+    return Depends(check_ip)
+
+# ============ PRODUCT CACHE ============
+
+product_cache = ProductCache.from_env(version_loader=lambda: load_catalog_version(db))
+search_index = ProductSearchIndex()
+product_cache.add_invalidation_listener(search_index.mark_stale)
+facet_index = ProductFacets()
+product_cache.add_invalidation_listener(facet_index.mark_stale)
+cart_summaries = CartSummaryCache.from_env(shared_state)
+product_cache.add_invalidation_listener(cart_summaries.invalidate_product)
+# Catalog responses are compressed once per response cache entry, so they get higher levels than per-user routes
+compressor = ResponseCompressor.from_env(routes={
+    "catalog": (CACHEABLE_PATHS.pattern, CompressionPolicy(gzip_level=9, brotli_level=9)),
+})
+response_cache = ResponseCache.from_env(
+    shared_state,
+    version=product_cache.current_version, variant=compressor.negotiate, variants=compressor.variants
+)
+
+def drop_product_response(product_id: Optional[str]) -> None:
+    # A whole-catalog change bumps the version, which already retires every cached response
+    if product_id is not None:
+        response_cache.invalidate_path(product_cache.version, f"/api/products/{product_id}")
+
+product_cache.add_invalidation_listener(drop_product_response)
+
+# ============ CATALOG WATCH ============
+
+stock_events = StockEvents.from_env()
+catalog_watcher = None  # started in the lifespan, once the database is connected
+recommendation_job = None  # likewise; refreshes related products in the background
+cart_compactor = None  # likewise; merges duplicate and orphaned cart lines
+
+def apply_catalog_change(change: ProductChange) -> None:
+    if change.product_id is None:
+        product_cache.invalidate_all()
+        return
+    # Stock-only writes (checkouts) keep cached lists, as the checkout route does for its own
+    product_cache.invalidate_products([change.product_id], lists=not change.stock_only)
+    if change.stock is not None:
+        stock_events.publish(change.product_id, change.stock)
+
+# Cached product documents hold exactly the Product fields, so they can be
+# serialized straight to JSON without building Product instances
+PRODUCT_FIELDS = {"_id": 0, **{field: 1 for field in Product.model_fields}}
+
+# Every product read skips soft-deleted products (see catalog_admin.py)
+async def load_product(product_id: str) -> Optional[dict]:
+    return await db.products.find_one({"id": product_id, **ACTIVE}, PRODUCT_FIELDS)
+
+async def load_products_by_id(product_ids: List[str]) -> dict:
+    products = await db.products.find({"id": {"$in": product_ids}, **ACTIVE}, PRODUCT_FIELDS).to_list(None)
+    return {product["id"]: product for product in products}
+
+async def load_search_documents() -> List[dict]:
+    return await db.products.find(ACTIVE, SEARCH_FIELDS).to_list(None)
+
+async def load_facet_documents() -> List[dict]:
+    return await db.products.find(ACTIVE, FACET_FIELDS).to_list(None)
+
+# ============ PRODUCT LISTING ============
+
+PRODUCT_PAGE_MAX = 1000
+RELATED_PRODUCTS_MAX = 24
+
+def encode_cursor(position: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+def parse_catalog_filter(min_price: Optional[float], max_price: Optional[float], in_stock: Optional[bool]) -> CatalogFilter:
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(status_code=400, detail="min_price must not exceed max_price")
+    return CatalogFilter(min_price, max_price, in_stock)
+
+async def load_product_page(search: Optional[str], category: Optional[str], filters: CatalogFilter,
+                            cursor: Optional[str], limit: int):
+    """Return ``(products, next_cursor)`` for one page of the listing.
+    
+    Searches are ranked in memory, so their cursor is an offset into the
+    ranking; price and stock filters are applied from the facet index before
+    ranking. Plain listings are ordered by (name, id) and use a keyset cursor,
+    so deep pages cost the same as the first one.
+    """
+    position = decode_cursor(cursor) if cursor else {}
+    
+    if search:
+        offset = position.get("o", 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        await search_index.refresh(load_search_documents, load_products_by_id)
+        where = None
+        if filters.active:
+            await facet_index.refresh(load_facet_documents, load_products_by_id)
+            where = facet_index.matcher(filters)
+        ranked_ids = search_index.search(search, category=category, limit=offset + limit + 1, where=where)
+        page_ids = ranked_ids[offset:offset + limit]
+        products_by_id = await product_cache.get_products(page_ids, load_products_by_id)
+        products = [products_by_id[pid] for pid in page_ids if pid in products_by_id]
+        has_more = len(ranked_ids) > offset + limit
+        return products, encode_cursor({"o": offset + limit}) if has_more else None
+    
+    query = {**filters.mongo_query(), **ACTIVE}
+    if category:
+        query["category"] = category
+    if position:
+        if not isinstance(position.get("n"), str) or not isinstance(position.get("i"), str):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["$or"] = [
+            {"name": {"$gt": position["n"]}},
+            {"name": position["n"], "id": {"$gt": position["i"]}},
+        ]
+    
+    products = await db.products.find(query, PRODUCT_FIELDS).sort(PRODUCT_PAGE_SORT).limit(limit + 1).to_list(None)
+    if len(products) > limit:
+        last = products[limit - 1]
+        return products[:limit], encode_cursor({"n": last["name"], "i": last["id"]})
+    return products, None
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in Product.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [field for field in requested if field != "id"]
+
+# ============ JSON RESPONSES ============
+
+JSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NAIVE_UTC
+
+def json_response(content, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """Serialize plain dicts/lists (e.g. Mongo documents) to JSON bytes in one pass.
+    
+    Bypasses response_model validation, so callers must only pass documents
+    that already match the declared model (see PRODUCT_FIELDS).
+    """
+    start = time.perf_counter()
+    body = orjson.dumps(content, option=JSON_OPTIONS)
+    JSON_ENCODE_SECONDS.observe(time.perf_counter() - start)
+    return Response(
+        content=body,
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
 # ============ AUTH ROUTES ============
 
-@api_router.post("/auth/register", response_model=TokenResponse)
+@api_router.post("/auth/register", response_model=TokenResponse, dependencies=[rate_limited("register")])
 async def register(user_data: UserCreate):
     # Check if user exists
     existing = await db.users.find_one({"email": user_data.email})
@@ -141,15 +433,13 @@ async def register(user_data: UserCreate):
     user = User(
         email=user_data.email,
         name=user_data.name,
-        password_hash=hash_password(user_data.password)
+        password_hash=await hash_password(user_data.password)
     )
     
-    user_dict = user.model_dump()
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
-    await db.users.insert_one(user_dict)
+    await db.users.insert_one(user.model_dump())
     
     # Create token
-    token = create_access_token({"sub": user.id})
+    token = create_access_token(user_token_claims(user))
     
     return TokenResponse(
         access_token=token,
@@ -157,21 +447,26 @@ async def register(user_data: UserCreate):
         user=UserResponse(id=user.id, email=user.email, name=user.name)
     )
 
-@api_router.post("/auth/login", response_model=TokenResponse)
+@api_router.post("/auth/login", response_model=TokenResponse, dependencies=[rate_limited("login")])
 async def login(credentials: UserLogin):
     user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
     if not user_doc:
+        AUTH_FAILURES.labels("invalid_credentials").inc()
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
-    
     user = User(**user_doc)
     
-    if not verify_password(credentials.password, user.password_hash):
+    valid, new_hash = await verify_password(credentials.password, user.password_hash)
+    if not valid:
+        AUTH_FAILURES.labels("invalid_credentials").inc()
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = create_access_token({"sub": user.id})
+    if new_hash:
+        # Stored hash uses an outdated cost factor; upgrade it while we have the password
+        await db.users.update_one({"id": user.id}, {"$set": {"password_hash": new_hash}})
+        user_cache.invalidate(user.id)
+    
+    token = create_access_token(user_token_claims(user))
     
     return TokenResponse(
         access_token=token,
@@ -180,185 +475,503 @@ async def login(credentials: UserLogin):
     )
 
 @api_router.get("/auth/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: AuthenticatedUser = Depends(get_current_user)):
     return UserResponse(id=current_user.id, email=current_user.email, name=current_user.name)
 
+@api_router.post("/auth/logout")
+async def logout(claims: dict = Depends(get_token_claims)):
+    # Tokens issued before jti was added cannot be revoked individually
+    if claims.get("jti"):
+        await token_revocations.revoke_token(claims)
+    return {"message": "Logged out"}
+
 # ============ PRODUCT ROUTES ============
 
 @api_router.get("/products", response_model=List[Product])
-async def get_products(search: Optional[str] = None, category: Optional[str] = None):
-    query = {}
-    if search:
-        query["name"] = {"$regex": search, "$options": "i"}
-    if category:
-        query["category"] = category
+async def get_products(
+    request: Request,
+    search: Optional[str] = Query(None, max_length=200),
+    category: Optional[str] = None,
+    limit: int = Query(PRODUCT_PAGE_MAX, ge=1, le=PRODUCT_PAGE_MAX),
+    cursor: Optional[str] = Query(None, max_length=1024),
+    fields: Optional[str] = Query(None, description="Comma-separated Product fields to return"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: Optional[bool] = None,
+):
+    projection = parse_fields(fields)
+    filters = parse_catalog_filter(min_price, max_price, in_stock)
+    products, next_cursor = await product_cache.get_product_page(
+        search, category, filters, cursor, limit, load_product_page
+    )
+    if projection:
+        products = [{field: product[field] for field in projection if field in product} for product in products]
     
-    products = await db.products.find(query, {"_id": 0}).to_list(1000)
+    response = json_response(products)
+    etag = etag_for(response.body)
+    headers = {"ETag": etag}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return response
+
+@api_router.get("/products/facets")
+async def get_product_facets(
+    request: Request,
+    search: Optional[str] = Query(None, max_length=200),
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: Optional[bool] = None,
+):
+    """Category, price bucket and stock counts for the listing these filters select.
     
-    for product in products:
-        if isinstance(product.get('created_at'), str):
-            product['created_at'] = datetime.fromisoformat(product['created_at'])
+    Each facet is counted with every filter except its own. Counts come from the
+    in-memory facet index, so a request costs O(facets) rather than a scan; with
+    a search term they are counted over the search matches instead.
+    """
+    filters = parse_catalog_filter(min_price, max_price, in_stock)
+    search, category = normalize_list_query(search, category)
+    await product_cache.check_version()
+    await facet_index.refresh(load_facet_documents, load_products_by_id)
+    product_ids = None
+    if search:
+        await search_index.refresh(load_search_documents, load_products_by_id)
+        product_ids = search_index.search(search, limit=len(search_index))
     
-    return products
+    response = json_response(facet_index.facets(category, filters, product_ids))
+    etag = etag_for(response.body)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return response
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
+async def get_product(product_id: str, request: Request):
+    product = await product_cache.get_product(product_id, load_product)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    response = json_response(product)
+    etag = etag_for(response.body)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return response
+
+@api_router.get("/products/{product_id}/stock/events")
+async def stream_product_stock(product_id: str):
+    """Server-Sent Events: the product's stock now, then every change to it"""
+    product = await product_cache.get_product(product_id, load_product)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if stock_events.full:
+        raise HTTPException(
+            status_code=503, detail="Too many live stock subscriptions", headers={"Retry-After": "30"}
+        )
+    return StreamingResponse(
+        stock_events.stream(product_id, product["stock"]),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they come rather than buffer them
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/products/{product_id}/related", response_model=List[Product])
+async def get_related_products(
+    product_id: str, request: Request, limit: int = Query(8, ge=1, le=RELATED_PRODUCTS_MAX)
+):
+    """Products often bought or carted with this one, topped up with its category's best sellers"""
+    product = await product_cache.get_product(product_id, load_product)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    if isinstance(product.get('created_at'), str):
-        product['created_at'] = datetime.fromisoformat(product['created_at'])
+    # Precomputed by recommendations.py; a few spare candidates cover deleted or sold-out ones
+    candidates = (await related_product_ids(db, product_id, product["category"]))[:limit * 2]
+    products_by_id = await product_cache.get_products(candidates, load_products_by_id)
+    related = [
+        products_by_id[pid] for pid in candidates if pid in products_by_id and products_by_id[pid]["stock"] > 0
+    ][:limit]
     
-    return Product(**product)
+    response = json_response(related)
+    etag = etag_for(response.body)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return response
 
 # ============ CART ROUTES ============
 
+INCLUDE_SUMMARY = Query(False, description="Also return the updated cart summary")
+
+@api_router.get("/cart/summary", response_model=CartSummary)
+async def get_cart_summary(current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Item count, totals and per-line price snapshot without full product documents"""
+    return json_response(await cart_summaries.get(carts, current_user.id))
+
 @api_router.get("/cart", response_model=List[CartItemResponse])
-async def get_cart(current_user: User = Depends(get_current_user)):
-    cart_items = await db.cart.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    
-    result = []
-    for item in cart_items:
-        product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0})
-        if product:
-            if isinstance(product.get('created_at'), str):
-                product['created_at'] = datetime.fromisoformat(product['created_at'])
-            result.append(CartItemResponse(
-                id=item["id"],
-                product=Product(**product),
-                quantity=item["quantity"]
-            ))
-    
-    return result
-
-@api_router.post("/cart", response_model=CartItemResponse)
-async def add_to_cart(item_data: CartItemCreate, current_user: User = Depends(get_current_user)):
+async def get_cart(current_user: AuthenticatedUser = Depends(get_current_user)):
+    cart_items = await carts.list_items(current_user.id)
+    if not cart_items:
+        return []
+    
+    # Join every cart row to its product; cache misses load in a single $in round trip
+    products_by_id = await product_cache.get_products(
+        [item["product_id"] for item in cart_items], load_products_by_id
+    )
+    
+    result = [
+        {"id": item["id"], "product": products_by_id[item["product_id"]], "quantity": item["quantity"]}
+        for item in cart_items
+        if item["product_id"] in products_by_id
+    ]
+    
+    return json_response(result)
+
+@api_router.post(
+    "/cart", response_model=CartItemResponse, response_model_exclude_none=True, dependencies=[rate_limited("cart")]
+)
+async def add_to_cart(
+    item_data: CartItemCreate,
+    include_summary: bool = INCLUDE_SUMMARY,
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
     # Check if product exists
-    product = await db.products.find_one({"id": item_data.product_id}, {"_id": 0})
+    product = await product_cache.get_product(item_data.product_id, load_product)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Check if item already in cart
-    existing = await db.cart.find_one({
-        "user_id": current_user.id,
-        "product_id": item_data.product_id
-    })
+    # Adds to the existing line or creates it, in one atomic write
+    cart_item = await carts.add_item(current_user.id, item_data.product_id, item_data.quantity)
+    await cart_summaries.invalidate(current_user.id)
     
-    if existing:
-        # Update quantity
-        new_quantity = existing["quantity"] + item_data.quantity
-        await db.cart.update_one(
-            {"id": existing["id"]},
-            {"$set": {"quantity": new_quantity}}
-        )
-        cart_item = CartItem(**existing)
-        cart_item.quantity = new_quantity
-    else:
-        # Create new cart item
-        cart_item = CartItem(
-            user_id=current_user.id,
-            product_id=item_data.product_id,
-            quantity=item_data.quantity
+    result = {"id": cart_item["id"], "product": product, "quantity": cart_item["quantity"]}
+    if include_summary:
+        result["summary"] = await cart_summaries.get(carts, current_user.id)
+    return json_response(result)
+
+@api_router.patch(
+    "/cart/{cart_id}", response_model=CartItemResponse, response_model_exclude_none=True,
+    dependencies=[rate_limited("cart")],
+)
+async def update_cart_item(
+    cart_id: str,
+    update_data: CartItemUpdate,
+    include_summary: bool = INCLUDE_SUMMARY,
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    cart_item = await carts.set_quantity(current_user.id, cart_id, update_data.quantity)
+    if not cart_item:
+        raise HTTPException(status_code=404, detail="Cart item not found")
+    await cart_summaries.invalidate(current_user.id)
+    
+    product = await product_cache.get_product(cart_item["product_id"], load_product)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    result = {"id": cart_id, "product": product, "quantity": update_data.quantity}
+    if include_summary:
+        result["summary"] = await cart_summaries.get(carts, current_user.id)
+    return json_response(result)
+
+@api_router.delete(
+    "/cart/{cart_id}", response_model=CartDeleteResponse, response_model_exclude_none=True,
+    dependencies=[rate_limited("cart")],
+)
+async def delete_cart_item(
+    cart_id: str,
+    include_summary: bool = INCLUDE_SUMMARY,
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    if not await carts.remove_item(current_user.id, cart_id):
+        raise HTTPException(status_code=404, detail="Cart item not found")
+    await cart_summaries.invalidate(current_user.id)
+    
+    response = {"message": "Item removed from cart"}
+    if include_summary:
+        response["summary"] = await cart_summaries.get(carts, current_user.id)
+    return json_response(response)
+
+@api_router.post("/cart/sync", response_model=CartSyncResponse, dependencies=[rate_limited("cart_sync")])
+async def sync_cart(
+    guest_cart: Annotated[List[CartItemCreate], Body(max_length=CART_SYNC_MAX_ITEMS)],
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Merge guest cart with user cart after login"""
+    # Collapse duplicate guest lines, keeping first-seen order
+    requested = {}
+    for item in guest_cart:
+        requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+    
+    # Check which products exist; cache misses load in one round trip
+    known_ids = await product_cache.get_products(requested, load_products_by_id)
+    to_merge = [pid for pid, qty in requested.items() if pid in known_ids and qty > 0]
+    
+    # Merge every line at once; increments make concurrent syncs add up instead of overwriting
+    rows_by_product, added = {}, set()
+    if to_merge:
+        rows_by_product, added = await carts.merge_items(
+            current_user.id, {product_id: requested[product_id] for product_id in to_merge}
         )
-        cart_dict = cart_item.model_dump()
-        cart_dict['created_at'] = cart_dict['created_at'].isoformat()
-        await db.cart.insert_one(cart_dict)
+        await cart_summaries.invalidate(current_user.id)
     
-    if isinstance(product.get('created_at'), str):
-        product['created_at'] = datetime.fromisoformat(product['created_at'])
+    results = []
+    for product_id in requested:
+        row = rows_by_product.get(product_id)
+        if row is None:
+            results.append(CartSyncItemResult(product_id=product_id, status="skipped"))
+            continue
+        results.append(CartSyncItemResult(
+            product_id=product_id,
+            status="added" if product_id in added else "merged",
+            quantity=row["quantity"],
+            cart_item_id=row["id"],
+        ))
     
-    return CartItemResponse(
-        id=cart_item.id,
-        product=Product(**product),
-        quantity=cart_item.quantity
-    )
+    return CartSyncResponse(message="Cart synced successfully", items=results)
 
-@api_router.patch("/cart/{cart_id}", response_model=CartItemResponse)
-async def update_cart_item(cart_id: str, update_data: CartItemUpdate, current_user: User = Depends(get_current_user)):
-    cart_item = await db.cart.find_one({"id": cart_id, "user_id": current_user.id})
-    if not cart_item:
-        raise HTTPException(status_code=404, detail="Cart item not found")
+# ============ ORDER ROUTES ============
+
+ORDER_FIELDS = {"_id": 0, "user_id": 0, "idempotency_key": 0}
+
+@api_router.post("/orders", response_model=OrderResponse, status_code=201, dependencies=[rate_limited("orders")])
+async def create_order(
+    response: Response,
+    idempotency_key: str = Header(..., min_length=1, max_length=128),
+    current_user: AuthenticatedUser = Depends(get_current_user),
+):
+    """Check out the caller's cart; retries with the same Idempotency-Key replay the order"""
+    order, created = await place_order(
+        db, client, carts, current_user.id, idempotency_key, use_order_transactions
+    )
     
-    await db.cart.update_one(
-        {"id": cart_id},
-        {"$set": {"quantity": update_data.quantity}}
+    if created:
+        # Stock changed; list pages may show the old figure until their TTL runs out
+        product_cache.invalidate_products([item["product_id"] for item in order["items"]], lists=False)
+        await cart_summaries.invalidate(current_user.id)
+    else:
+        response.status_code = 200
+    return order
+
+@api_router.get("/orders", response_model=List[OrderResponse])
+async def get_orders(current_user: AuthenticatedUser = Depends(get_current_user)):
+    orders = await db.orders.find(
+        {"user_id": current_user.id, "status": "placed"}, ORDER_FIELDS
+    ).sort("created_at", -1).to_list(100)
+    return json_response(orders)
+
+@api_router.get("/orders/{order_id}", response_model=OrderResponse)
+async def get_order(order_id: str, current_user: AuthenticatedUser = Depends(get_current_user)):
+    order = await db.orders.find_one(
+        {"id": order_id, "user_id": current_user.id, "status": "placed"}, ORDER_FIELDS
     )
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return json_response(order)
+
+# ============ ADMIN ROUTES ============
+
+async def after_catalog_write(product_ids: List[str]) -> int:
+    """Tell every API process the catalog changed, and drop this process's copies right away."""
+    version = await bump_catalog_version(db)
+    product_cache.invalidate_products(product_ids)
+    # Other processes clear their caches on the next version check; this one already has
+    product_cache.advance_version(version)
+    return version
+
+@api_router.post("/admin/products", response_model=Product, status_code=201)
+async def admin_create_product(product_data: ProductCreate, admin: AuthenticatedUser = Depends(get_admin_user)):
+    document = {**product_data.model_dump(), "created_at": datetime.now(timezone.utc)}
+    product = await create_product(db, document)
+    
+    await after_catalog_write([product["id"]])
+    logger.info("Admin %s created product %s", admin.email, product["id"])
+    response = json_response(product, status_code=201)
+    response.headers["ETag"] = etag_for(response.body)
+    return response
+
+@api_router.patch("/admin/products/{product_id}", response_model=Product)
+async def admin_patch_product(
+    product_id: str, patch: ProductPatch, admin: AuthenticatedUser = Depends(get_admin_user)
+):
+    """Change some fields of a product, if it is still at the version the caller read"""
+    changes = patch.changes()
+    if not changes:
+        raise HTTPException(status_code=400, detail="No fields to change")
+    product = await patch_product(db, product_id, patch.version, changes, PRODUCT_FIELDS)
     
-    product = await db.products.find_one({"id": cart_item["product_id"]}, {"_id": 0})
-    if isinstance(product.get('created_at'), str):
-        product['created_at'] = datetime.fromisoformat(product['created_at'])
+    await after_catalog_write([product_id])
+    logger.info("Admin %s patched product %s to version %d", admin.email, product_id, product["version"])
+    response = json_response(product)
+    response.headers["ETag"] = etag_for(response.body)
+    return response
+
+@api_router.patch("/admin/products", response_model=BulkPatchResponse)
+async def admin_bulk_patch_products(
+    patches: Annotated[List[ProductBulkPatch], Body(min_length=1, max_length=ADMIN_BULK_MAX_ITEMS)],
+    admin: AuthenticatedUser = Depends(get_admin_user),
+):
+    """Patch many products at once; each applies only at its own version, the rest are reported"""
+    if len({patch.id for patch in patches}) != len(patches):
+        raise HTTPException(status_code=400, detail="Each product may appear only once")
+    if any(not patch.changes() for patch in patches):
+        raise HTTPException(status_code=400, detail="Every patch must change at least one field")
     
-    return CartItemResponse(
-        id=cart_id,
-        product=Product(**product),
-        quantity=update_data.quantity
+    result = await bulk_patch(
+        db, [(patch.id, patch.version, patch.changes()) for patch in patches], ADMIN_BULK_BATCH_SIZE
     )
-
-@api_router.delete("/cart/{cart_id}")
-async def delete_cart_item(cart_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.cart.delete_one({"id": cart_id, "user_id": current_user.id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Cart item not found")
-    return {"message": "Item removed from cart"}
-
-@api_router.post("/cart/sync")
-async def sync_cart(guest_cart: List[CartItemCreate], current_user: User = Depends(get_current_user)):
-    """Merge guest cart with user cart after login"""
-    for item in guest_cart:
-        # Check if product exists
-        product = await db.products.find_one({"id": item.product_id})
-        if not product:
-            continue
-        
-        # Check if already in user cart
-        existing = await db.cart.find_one({
-            "user_id": current_user.id,
-            "product_id": item.product_id
-        })
-        
-        if existing:
-            # Add quantities
-            new_quantity = existing["quantity"] + item.quantity
-            await db.cart.update_one(
-                {"id": existing["id"]},
-                {"$set": {"quantity": new_quantity}}
-            )
-        else:
-            # Create new cart item
-            cart_item = CartItem(
-                user_id=current_user.id,
-                product_id=item.product_id,
-                quantity=item.quantity
-            )
-            cart_dict = cart_item.model_dump()
-            cart_dict['created_at'] = cart_dict['created_at'].isoformat()
-            await db.cart.insert_one(cart_dict)
-    
-    return {"message": "Cart synced successfully"}
+    updated = result["updated"]
+    catalog_version = await after_catalog_write(updated) if updated else await product_cache.current_version()
+    logger.info(
+        "Admin %s bulk patched %d products (%d conflicts, %d not found)",
+        admin.email, len(result["updated"]), len(result["conflicts"]), len(result["not_found"]),
+    )
+    return BulkPatchResponse(**result, catalog_version=catalog_version)
+
+@api_router.delete("/admin/products/{product_id}")
+async def admin_delete_product(
+    product_id: str,
+    version: Optional[int] = Query(None, ge=0, description="Only delete if the product is still at this version"),
+    admin: AuthenticatedUser = Depends(get_admin_user),
+):
+    await delete_product(db, product_id, version)
+    
+    await after_catalog_write([product_id])
+    logger.info("Admin %s deleted product %s", admin.email, product_id)
+    return {"message": "Product deleted"}
 
 # Root route
 @api_router.get("/")
 async def root():
     return {"message": "E-Commerce API"}
 
+@api_router.get("/health")
+async def health():
+    """Database reachability, ping latency and connection pool wait times"""
+    pool = {
+        "max_pool_size": mongo_settings.max_pool_size,
+        "min_pool_size": mongo_settings.min_pool_size,
+        **pool_monitor.stats(),
+    }
+    try:
+        ping_ms = await ping_latency_ms(client)
+    except Exception as e:
+        logger.warning("Health check ping failed: %s", e)
+        return json_response({"status": "unavailable", "database": {"ok": False}, "pool": pool}, status_code=503)
+    return json_response({"status": "ok", "database": {"ok": True, "ping_ms": ping_ms}, "pool": pool})
+
+# ============ METRICS ============
+
+# Multiprocess mode only: the worker's readings reach the other workers' scrapes through these publishes
+metrics_publisher = PeriodicTask("Metrics publish", publish_stats, METRICS_PUBLISH_SECONDS if MULTIPROCESS else 0)
+stats_collector.add_cache("product", product_cache.stats)
+stats_collector.add_cache("user", user_cache.stats)
+stats_collector.add_cache("cart_summary", cart_summaries.stats)
+stats_collector.add_cache("http", response_cache.stats)
+stats_collector.add_counter(
+    "http_compressed_responses", "Responses compressed with gzip or brotli", lambda: compressor.compressed
+)
+stats_collector.add_counter(
+    "http_compression_input_bytes", "Response bytes before compression", lambda: compressor.bytes_in
+)
+stats_collector.add_counter(
+    "http_compression_output_bytes", "Response bytes after compression", lambda: compressor.bytes_out
+)
+stats_collector.add_counter(
+    "http_compression_seconds", "Time spent compressing responses", lambda: compressor.seconds
+)
+stats_collector.add_counter(
+    "rate_limit_rejected", "Requests refused with 429 by a rate policy", rate_limiter.total_rejected
+)
+stats_collector.add_gauge(
+    "admission_in_flight", "Requests holding a concurrency slot", lambda: concurrency_limiter.in_flight
+)
+stats_collector.add_gauge(
+    "admission_waiting", "Requests queued for a concurrency slot", lambda: concurrency_limiter.waiting
+)
+stats_collector.add_counter(
+    "admission_rejected", "Requests shed with 503 by the concurrency limit", lambda: concurrency_limiter.rejected
+)
+stats_collector.add_counter(
+    "catalog_changes", "Product writes picked up by the catalog watcher", lambda: catalog_watcher.changes if catalog_watcher else 0
+)
+stats_collector.add_counter(
+    "catalog_watch_errors", "Catalog change stream or poll failures", lambda: catalog_watcher.errors if catalog_watcher else 0
+)
+stats_collector.add_counter(
+    "recommendation_runs", "Completed related product and popularity refreshes in this process",
+    lambda: recommendation_job.runs if recommendation_job else 0,
+)
+stats_collector.add_counter(
+    "recommendation_errors", "Failed recommendation refreshes", lambda: recommendation_job.errors if recommendation_job else 0
+)
+stats_collector.add_gauge(
+    "recommendation_last_run_seconds", "Duration of the last recommendation refresh",
+    lambda: recommendation_job.last_run_seconds if recommendation_job else 0,
+    combine="livemax",
+)
+stats_collector.add_counter(
+    "cart_compaction_documents_reclaimed", "Cart documents removed by compaction in this process",
+    lambda: cart_compactor.documents_reclaimed if cart_compactor else 0,
+)
+stats_collector.add_counter(
+    "cart_compaction_bytes_reclaimed", "Bytes of cart data removed by compaction in this process",
+    lambda: cart_compactor.bytes_reclaimed if cart_compactor else 0,
+)
+stats_collector.add_counter(
+    "cart_compaction_errors", "Failed cart compactions", lambda: cart_compactor.errors if cart_compactor else 0
+)
+stats_collector.add_gauge(
+    "stock_event_subscribers", "Open live stock streams", lambda: stock_events.subscribers
+)
+stats_collector.add_gauge(
+    "password_hash_queue_depth", "bcrypt calls waiting for a worker", lambda: password_hasher.queue_depth
+)
+stats_collector.add_counter(
+    "password_hash_rejected", "bcrypt calls refused because the pool was saturated", lambda: password_hasher.rejected
+)
+stats_collector.add_gauge(
+    "mongodb_pool_connections", "Open pooled MongoDB connections", lambda: pool_monitor.open_connections
+)
+stats_collector.add_gauge(
+    "mongodb_pool_connections_in_use", "Pooled MongoDB connections checked out", lambda: pool_monitor.in_use
+)
+stats_collector.add_counter(
+    "mongodb_pool_checkout_timeouts", "Connection checkouts that hit the wait queue timeout",
+    lambda: pool_monitor.checkout_timeouts,
+)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Include router
 app.include_router(api_router)
 
+# Added before CORS so they run inside it and replayed responses still get CORS headers.
+# Compression runs inside the response cache, which then stores compressed bodies.
+# Admission control runs inside the cache too, so cache hits are never shed.
+app.add_middleware(CompressionMiddleware, compressor=compressor)
+app.add_middleware(AdmissionMiddleware, limiter=concurrency_limiter)
+app.add_middleware(HTTPCacheMiddleware, response_cache=response_cache)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Cache"],
 )
 
+# Added last so it wraps every other middleware and sees the full request time
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+logger = logging.getLogger(__name__)
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""State shared by the API processes: response cache entries, rate-limit buckets and counters.
+
+With several workers (see serve.py), anything kept in a module-level dict
+exists once per process. Each process then has its own rate limits and its
+own cache, and sees other processes' changes late. The features that need
+one view across processes use a state backend with a small interface:
+
+* ``get`` / ``set`` / ``delete`` - byte values with a TTL (HTTP response cache)
+* ``take`` - atomic token-bucket withdrawal (rate limits)
+* ``incr`` / ``counter`` - integer counters (token revocation change stamps)
+
+Two backends implement it; SHARED_STATE picks one:
+
+* ``memory`` (default) - ``MemoryState``, per process. Right for a single
+  worker, and the stand-in for Redis in tests and benchmarks.
+* ``redis`` - ``RedisState``, any server that speaks the Redis protocol and
+  runs Lua scripts (Redis, Valkey, KeyDB, or fakeredis for local runs).
+  Needs the ``redis`` package. SHARED_STATE_URL gives its address.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class MemoryState:
+    name = "memory"
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_buckets: int = 100_000):
+        self.max_bytes = max_bytes
+        self.max_buckets = max_buckets
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        # key -> (tokens, updated_at), least recently used first
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "MemoryState":
+        return cls(
+            max_bytes=int(os.environ.get('SHARED_STATE_MAX_BYTES', 64 * 1024 * 1024)),
+            max_buckets=int(os.environ.get('SHARED_STATE_MAX_BUCKETS', 100_000)),
+        )
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + ttl_seconds, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._discard(key)
+
+    async def take(self, key: str, rate: float, capacity: int, cost: int = 1) -> float:
+        """Take ``cost`` tokens; return 0 if they were available, else the seconds to wait."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        # An evicted bucket comes back full, which only ever errs towards admitting
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+
+# Runs atomically on the server; the wait is returned as a string because Redis truncates Lua numbers to integers
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisState:
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "shophub:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("SHARED_STATE=redis needs the redis package (pip install redis)") from e
+        # Connections are opened on first use, so a client built at import is safe in forked workers
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(TAKE_SCRIPT)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        await self._redis.set(self.prefix + key, value, px=max(1, int(ttl_seconds * 1000)))
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def take(self, key: str, rate: float, capacity: int, cost: int = 1) -> float:
+        return float(await self._take(keys=[self.prefix + key], args=[rate, capacity, cost]))
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(self.prefix + key)
+
+    async def counter(self, key: str) -> int:
+        value = await self._redis.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+    def stats(self) -> dict:
+        # Size and evictions are the server's to report
+        return {}
+
+
+def shared_state_from_env():
+    backend = os.environ.get('SHARED_STATE', 'memory').lower()
+    if backend == 'redis':
+        return RedisState(os.environ.get('SHARED_STATE_URL', 'redis://localhost:6379/0'))
+    if backend == 'memory':
+        return MemoryState.from_env()
+    raise ValueError(f"SHARED_STATE must be memory or redis, not {backend!r}")
+
+
+def state_for(setting: str, shared):
+    """Resolve a feature's backend setting: ``shared`` (default), ``memory`` (per process) or ``off``."""
+    backend = os.environ.get(setting, 'shared').lower()
+    if backend == 'off':
+        return None
+    if backend == 'shared':
+        return shared
+    if backend == 'memory':
+        return shared if isinstance(shared, MemoryState) else MemoryState.from_env()
+    raise ValueError(f"{setting} must be shared, memory or off, not {backend!r}")
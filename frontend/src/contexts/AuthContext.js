@@ -67,6 +67,16 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    if (state.token) {
+      // Revoke the token server-side; the local session ends either way
+      axios
+        .post(
+          `${process.env.REACT_APP_BACKEND_URL}/api/auth/logout`,
+          null,
+          { headers: { Authorization: `Bearer ${state.token}` } }
+        )
+        .catch(() => {});
+    }
     localStorage.removeItem('token');
     dispatch({ type: 'LOGOUT' });
   };
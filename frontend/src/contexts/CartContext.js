@@ -32,8 +32,10 @@ const cartReducer = (state, action) => {
         ...state,
         items: state.items.filter((item) => item.id !== action.payload),
       };
+    case 'SET_SUMMARY':
+      return { ...state, summary: action.payload };
     case 'CLEAR_CART':
-      return { ...state, items: [] };
+      return { ...state, items: [], summary: null };
     default:
       return state;
   }
@@ -41,6 +43,8 @@ const cartReducer = (state, action) => {
 
 const initialState = {
   items: [],
+  // Server-computed totals for signed-in users; guests total their local cart
+  summary: null,
 };
 
 export const CartProvider = ({ children }) => {
@@ -80,11 +84,26 @@ export const CartProvider = ({ children }) => {
         }
       );
       dispatch({ type: 'SET_CART', payload: response.data });
+      fetchSummary(token);
     } catch (error) {
       console.error('Failed to fetch cart:', error);
     }
   };
 
+  const fetchSummary = async (authToken) => {
+    try {
+      const response = await axios.get(
+        `${process.env.REACT_APP_BACKEND_URL}/api/cart/summary`,
+        {
+          headers: { Authorization: `Bearer ${authToken}` },
+        }
+      );
+      dispatch({ type: 'SET_SUMMARY', payload: response.data });
+    } catch (error) {
+      console.error('Failed to fetch cart summary:', error);
+    }
+  };
+
   const syncGuestCart = async (authToken) => {
     const guestCart = localStorage.getItem('guestCart');
     const tokenToUse = authToken || token;
@@ -116,6 +135,7 @@ export const CartProvider = ({ children }) => {
             }
           );
           dispatch({ type: 'SET_CART', payload: response.data });
+          fetchSummary(tokenToUse);
         }
       } catch (error) {
         console.error('Failed to sync cart:', error);
@@ -130,10 +150,13 @@ export const CartProvider = ({ children }) => {
           `${process.env.REACT_APP_BACKEND_URL}/api/cart`,
           { product_id: product.id, quantity },
           {
+            params: { include_summary: true },
             headers: { Authorization: `Bearer ${token}` },
           }
         );
-        dispatch({ type: 'ADD_ITEM', payload: response.data });
+        const { summary, ...item } = response.data;
+        dispatch({ type: 'ADD_ITEM', payload: item });
+        dispatch({ type: 'SET_SUMMARY', payload: summary });
       } catch (error) {
         console.error('Failed to add to cart:', error);
       }
@@ -151,14 +174,16 @@ export const CartProvider = ({ children }) => {
   const updateQuantity = async (itemId, quantity) => {
     if (isAuthenticated && token) {
       try {
-        await axios.patch(
+        const response = await axios.patch(
           `${process.env.REACT_APP_BACKEND_URL}/api/cart/${itemId}`,
           { quantity },
           {
+            params: { include_summary: true },
             headers: { Authorization: `Bearer ${token}` },
           }
         );
         dispatch({ type: 'UPDATE_ITEM', payload: { id: itemId, quantity } });
+        dispatch({ type: 'SET_SUMMARY', payload: response.data.summary });
       } catch (error) {
         console.error('Failed to update quantity:', error);
       }
@@ -170,13 +195,15 @@ export const CartProvider = ({ children }) => {
   const removeFromCart = async (itemId) => {
     if (isAuthenticated && token) {
       try {
-        await axios.delete(
+        const response = await axios.delete(
           `${process.env.REACT_APP_BACKEND_URL}/api/cart/${itemId}`,
           {
+            params: { include_summary: true },
             headers: { Authorization: `Bearer ${token}` },
           }
         );
         dispatch({ type: 'REMOVE_ITEM', payload: itemId });
+        dispatch({ type: 'SET_SUMMARY', payload: response.data.summary });
       } catch (error) {
         console.error('Failed to remove from cart:', error);
       }
@@ -191,6 +218,9 @@ export const CartProvider = ({ children }) => {
   };
 
   const getCartTotal = () => {
+    if (isAuthenticated && state.summary) {
+      return state.summary.subtotal;
+    }
     return state.items.reduce(
       (total, item) => total + item.product.price * item.quantity,
       0
@@ -198,6 +228,9 @@ export const CartProvider = ({ children }) => {
   };
 
   const getCartCount = () => {
+    if (isAuthenticated && state.summary) {
+      return state.summary.item_count;
+    }
     return state.items.reduce((count, item) => count + item.quantity, 0);
   };
 
@@ -205,6 +238,7 @@ export const CartProvider = ({ children }) => {
     <CartContext.Provider
       value={{
         items: state.items,
+        summary: state.summary,
         addToCart,
         updateQuantity,
         removeFromCart,
@@ -1,5 +1,6 @@
 import React, { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
+import axios from 'axios';
 import { useCart } from '../contexts/CartContext';
 import { useAuth } from '../contexts/AuthContext';
 import { CheckCircle, CreditCard } from 'lucide-react';
@@ -8,22 +9,37 @@ import { toast } from 'sonner';
 export const Checkout = () => {
   const navigate = useNavigate();
   const { items, getCartTotal, clearCart } = useCart();
-  const { isAuthenticated, user } = useAuth();
+  const { isAuthenticated, user, token } = useAuth();
   const [orderPlaced, setOrderPlaced] = useState(false);
+  const [placing, setPlacing] = useState(false);
+  // One key per checkout visit, so a retried or double-clicked order is placed once
+  const [idempotencyKey] = useState(() => crypto.randomUUID());
 
   const subtotal = getCartTotal();
   const shipping = subtotal > 50 ? 0 : 9.99;
   const tax = subtotal * 0.08;
   const total = subtotal + shipping + tax;
 
-  const handlePlaceOrder = () => {
-    // Mock order placement
-    setOrderPlaced(true);
-    toast.success('Order placed successfully!');
-    setTimeout(() => {
-      clearCart();
-      navigate('/');
-    }, 3000);
+  const handlePlaceOrder = async () => {
+    setPlacing(true);
+    try {
+      await axios.post(`${process.env.REACT_APP_BACKEND_URL}/api/orders`, null, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+          'Idempotency-Key': idempotencyKey,
+        },
+      });
+      setOrderPlaced(true);
+      toast.success('Order placed successfully!');
+      setTimeout(() => {
+        clearCart();
+        navigate('/');
+      }, 3000);
+    } catch (error) {
+      const detail = error.response?.data?.detail;
+      toast.error(detail?.message || detail || 'Failed to place order');
+      setPlacing(false);
+    }
   };
 
   if (!isAuthenticated) {
@@ -147,6 +163,7 @@ export const Checkout = () => {
               </div>
               <button
                 onClick={handlePlaceOrder}
+                disabled={placing}
                 data-testid="place-order-button"
                 className="w-full flex items-center justify-center space-x-2 bg-blue-600 text-white px-6 py-4 rounded-lg hover:bg-blue-700 transition-colors font-semibold text-lg shadow-lg hover:shadow-xl mt-6"
               >
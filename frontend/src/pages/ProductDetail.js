@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { useCart } from '../contexts/CartContext';
+import { ProductCard } from '../components/ProductCard';
 import { ShoppingCart, ArrowLeft, Loader2, Plus, Minus } from 'lucide-react';
 import { toast } from 'sonner';
 
@@ -12,9 +13,24 @@ export const ProductDetail = () => {
   const [product, setProduct] = useState(null);
   const [loading, setLoading] = useState(true);
   const [quantity, setQuantity] = useState(1);
+  const [related, setRelated] = useState([]);
 
   useEffect(() => {
     fetchProduct();
+    fetchRelated();
+  }, [id]);
+
+  // Stock changes are pushed by the server while the page is open
+  useEffect(() => {
+    const events = new EventSource(
+      `${process.env.REACT_APP_BACKEND_URL}/api/products/${id}/stock/events`
+    );
+    events.addEventListener('stock', (event) => {
+      const { stock } = JSON.parse(event.data);
+      setProduct((current) => (current ? { ...current, stock } : current));
+      setQuantity((current) => Math.max(1, Math.min(current, stock)));
+    });
+    return () => events.close();
   }, [id]);
 
   const fetchProduct = async () => {
@@ -32,6 +48,20 @@ export const ProductDetail = () => {
     }
   };
 
+  // Precomputed on the server; the page works the same without them
+  const fetchRelated = async () => {
+    try {
+      const response = await axios.get(
+        `${process.env.REACT_APP_BACKEND_URL}/api/products/${id}/related`,
+        { params: { limit: 4 } }
+      );
+      setRelated(response.data);
+    } catch (error) {
+      console.error('Failed to fetch related products:', error);
+      setRelated([]);
+    }
+  };
+
   const handleAddToCart = () => {
     addToCart(product, quantity);
     toast.success(`${quantity}x ${product.name} added to cart!`);
@@ -156,6 +186,18 @@ export const ProductDetail = () => {
             </div>
           </div>
         </div>
+
+        {/* Related Products */}
+        {related.length > 0 && (
+          <div className="mt-12" data-testid="related-products">
+            <h2 className="text-2xl font-bold text-gray-900 mb-6">You may also like</h2>
+            <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-4 gap-6">
+              {related.map((item) => (
+                <ProductCard key={item.id} product={item} />
+              ))}
+            </div>
+          </div>
+        )}
       </div>
     </div>
   );
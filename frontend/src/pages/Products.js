@@ -8,11 +8,16 @@ export const Products = () => {
   const [loading, setLoading] = useState(true);
   const [search, setSearch] = useState('');
   const [category, setCategory] = useState('');
+  const [categories, setCategories] = useState([]);
 
   useEffect(() => {
     fetchProducts();
   }, [search, category]);
 
+  useEffect(() => {
+    fetchFacets();
+  }, [search]);
+
   const fetchProducts = async () => {
     setLoading(true);
     try {
@@ -32,7 +37,20 @@ export const Products = () => {
     }
   };
 
-  const categories = ['Electronics', 'Fashion', 'Sports', 'Home'];
+  const fetchFacets = async () => {
+    try {
+      const params = {};
+      if (search) params.search = search;
+
+      const response = await axios.get(
+        `${process.env.REACT_APP_BACKEND_URL}/api/products/facets`,
+        { params }
+      );
+      setCategories(response.data.categories);
+    } catch (error) {
+      console.error('Failed to fetch categories:', error);
+    }
+  };
 
   return (
     <div className="min-h-screen bg-gray-50 py-8">
@@ -68,8 +86,8 @@ export const Products = () => {
             >
               <option value="">All Categories</option>
               {categories.map((cat) => (
-                <option key={cat} value={cat}>
-                  {cat}
+                <option key={cat.value} value={cat.value}>
+                  {cat.value} ({cat.count})
                 </option>
               ))}
             </select>
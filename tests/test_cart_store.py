@@ -0,0 +1,26 @@
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from cart_store import RowCartStore  # noqa: E402
+
+
+def test_changing_one_row_keeps_the_whole_cart_from_expiring():
+    async def run():
+        db = AsyncMongoMockClient(tz_aware=True)["shophub_test"]
+        store = RowCartStore(db)
+        for user_id, product_id in (("u1", "a"), ("u1", "b"), ("u2", "a")):
+            await store.add_item(user_id, product_id, 1)
+        long_ago = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        await db.cart.update_many({}, {"$set": {"updated_at": long_ago}})
+
+        await store.add_item("u1", "b", 1)
+        rows = await db.cart.find({}, {"_id": 0, "user_id": 1, "product_id": 1, "updated_at": 1}).to_list(None)
+        return {(row["user_id"], row["product_id"]): row["updated_at"] > long_ago for row in rows}
+
+    assert asyncio.run(run()) == {("u1", "a"): True, ("u1", "b"): True, ("u2", "a"): False}
@@ -0,0 +1,31 @@
+import asyncio
+import sys
+from pathlib import Path
+
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from cart_store import RowCartStore  # noqa: E402
+from cart_summary import CartSummaryCache  # noqa: E402
+from shared_state import MemoryState  # noqa: E402
+
+
+def test_mutation_in_one_process_drops_the_summary_in_another():
+    async def run():
+        db = AsyncMongoMockClient(tz_aware=True)["shophub_test"]
+        await db.products.insert_one({"id": "p", "name": "Widget", "price": 2.5, "stock": 10})
+        carts = RowCartStore(db)
+        shared = MemoryState()
+        # Two API workers with their own caches and one state backend
+        handling, other = CartSummaryCache(shared=shared), CartSummaryCache(shared=shared)
+
+        await carts.add_item("u1", "p", 1)
+        assert (await other.get(carts, "u1"))["item_count"] == 1
+        await carts.add_item("u1", "p", 2)
+        await handling.invalidate("u1")
+        return await other.get(carts, "u1"), other.stats()
+
+    summary, stats = asyncio.run(run())
+    assert summary["item_count"] == 3
+    assert stats["hits"] == 0
@@ -0,0 +1,31 @@
+import asyncio
+import sys
+from pathlib import Path
+
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from db_indexes import CART_TTL_INDEX, ensure_indexes  # noqa: E402
+
+
+def cart_indexes(db):
+    async def names():
+        return {collection: set(await db[collection].index_information()) for collection in ("cart", "carts")}
+    return asyncio.run(names())
+
+
+def test_cart_ttl_index_follows_cart_ttl_days(monkeypatch):
+    db = AsyncMongoMockClient(tz_aware=True)["shophub_test"]
+
+    monkeypatch.setenv("CART_TTL_DAYS", "30")
+    asyncio.run(ensure_indexes(db))
+    for collection, names in cart_indexes(db).items():
+        assert CART_TTL_INDEX in names, collection
+
+    monkeypatch.setenv("CART_TTL_DAYS", "0")
+    asyncio.run(ensure_indexes(db))
+    for collection, names in cart_indexes(db).items():
+        assert CART_TTL_INDEX not in names, collection
+    # Running again with nothing left to drop is a no-op
+    asyncio.run(ensure_indexes(db))
@@ -0,0 +1,43 @@
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from cart_store import CART_STORES  # noqa: E402
+from orders import InsufficientStock, reserve_stock  # noqa: E402
+
+
+@pytest.mark.parametrize("engine", sorted(CART_STORES))
+def test_checkout_keeps_quantity_added_during_checkout(engine):
+    async def run():
+        store = CART_STORES[engine](AsyncMongoMockClient(tz_aware=True)["shophub_test"])
+        for product_id in ("a", "b", "c"):
+            await store.add_item("u1", product_id, 2)
+        priced = await store.list_items("u1")
+        # Adds that land between the checkout's read and its cart clear
+        await store.add_item("u1", "a", 3)
+        removed = next(line for line in priced if line["product_id"] == "c")
+        await store.remove_item("u1", removed["id"])
+
+        await store.remove_purchased("u1", priced)
+        return {line["product_id"]: line["quantity"] for line in await store.list_items("u1")}
+
+    assert asyncio.run(run()) == {"a": 3}
+
+
+def test_reserve_stock_skips_deleted_products():
+    async def run():
+        db = AsyncMongoMockClient(tz_aware=True)["shophub_test"]
+        await db.products.insert_one({"id": "p", "stock": 5, "deleted_at": datetime.now(timezone.utc)})
+        with pytest.raises(InsufficientStock) as refused:
+            await reserve_stock(db, [{"product_id": "p", "quantity": 1}])
+        return refused.value.detail["items"][0]["available"], await db.products.find_one({"id": "p"})
+
+    available, product = asyncio.run(run())
+    assert available == 0
+    assert product["stock"] == 5